@@ -1,6 +1,12 @@
+import os
+import sys
+
 import pytest
 import httpx
 
+# Storage-level tests import the application modules directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 BASE_URL = "http://localhost:8000"
 
 @pytest.fixture(scope="session")
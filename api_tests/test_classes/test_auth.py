@@ -85,4 +85,23 @@ class TestAuth:
         
         # Test with completely invalid token
         invalid_response = client.get("/users/1", headers={"Authorization": "Bearer invalid_token_12345"})
-        assert invalid_response.status_code == 401
\ No newline at end of file
+        assert invalid_response.status_code == 401
+
+    def test_session_cap_per_user_evicts_oldest(self, client):
+        client.post("/users", json={
+            "username": "session_cap_user",
+            "email": "session_cap@example.com",
+            "password": "Password123",
+            "age": 25
+        }, headers={"X-Forwarded-For": "10.0.3.1"})
+        tokens = []
+        for _ in range(11):
+            response = client.post("/login", json={"username": "session_cap_user", "password": "Password123"})
+            assert response.status_code == 200
+            tokens.append(response.json()["token"])
+        user_id = response.json()["user_id"]
+
+        oldest = client.put(f"/users/{user_id}", json={"age": 26}, headers={"Authorization": f"Bearer {tokens[0]}"})
+        assert oldest.status_code == 401
+        newest = client.put(f"/users/{user_id}", json={"age": 26}, headers={"Authorization": f"Bearer {tokens[-1]}"})
+        assert newest.status_code == 200
@@ -0,0 +1,40 @@
+import sys
+import time
+import tracemalloc
+
+from diagnostics import AllocationTracer, deep_sizeof, estimate_bytes
+from user_records import UserRecord
+
+
+class TestDiagnostics:
+
+    def test_deep_sizeof_walks_slots(self):
+        record = UserRecord(1000, "someone", "someone@example.com", "hash" * 20, 30, phone="+15550001")
+        fields = [record.id, record.username, record.email, record.password, record.phone, record.created_ts]
+        expected = sys.getsizeof(record) + sum(map(sys.getsizeof, fields))
+        # age and is_active are shared singletons, last_login_ts is None
+        assert deep_sizeof(record) == expected
+
+    def test_shared_objects_are_counted_once(self):
+        record = UserRecord(1000, "someone", "someone@example.com", "hash", 30)
+        users_db = {record.username: record}
+        per_user = estimate_bytes(users_db) - sys.getsizeof(users_db)
+        assert per_user == deep_sizeof(record)
+        assert deep_sizeof([record, record]) == sys.getsizeof([record, record]) + deep_sizeof(record)
+
+    def test_allocation_tracing_stops_after_its_window(self):
+        tracer = AllocationTracer(window=0.3, refresh_interval=60)
+        try:
+            assert tracer.report(5)["started"] is True
+            assert tracemalloc.is_tracing()
+            data = [bytearray(1000) for _ in range(100)]
+            first = tracer.report(5)
+            assert first["started"] is False
+            assert len(first["top"]) <= 5
+            # Statistics are reused within the refresh interval
+            assert tracer.report(5)["top"] == first["top"]
+            time.sleep(0.6)
+            assert not tracemalloc.is_tracing()
+            del data
+        finally:
+            tracer.stop()
@@ -0,0 +1,135 @@
+import bisect
+import random
+
+import pytest
+
+import indexes
+from indexes import PersistentSortedSet, SortedIndex, TrigramIndex
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Tiny chunks make a few hundred items exercise every split and merge
+    monkeypatch.setattr(indexes, "CHUNK_SIZE", 4)
+
+
+def check_matches(items, expected):
+    assert len(items) == len(expected)
+    assert bool(items) == bool(expected)
+    assert list(items.iter_from(0)) == expected
+    for i in range(-1, len(expected) + 2):
+        assert list(items.iter_from(i)) == expected[max(i, 0) :]
+        assert list(items.iter_before(i)) == expected[: max(i, 0)][::-1]
+        assert items.slice(i, i + 3) == expected[max(i, 0) : i + 3]
+    for i, item in enumerate(expected):
+        assert items[i] == item
+        assert items[-1 - i] == expected[-1 - i]
+    for probe in range(-1, 205):
+        assert items.bisect_left(probe) == bisect.bisect_left(expected, probe)
+        assert items.bisect_right(probe) == bisect.bisect_right(expected, probe)
+        assert (probe in items) == (probe in expected)
+
+
+class TestPersistentSortedSet:
+
+    def test_add_and_remove_match_a_sorted_list(self, small_chunks):
+        rng = random.Random(0)
+        for _ in range(30):
+            items, expected = PersistentSortedSet(), []
+            for _ in range(rng.randrange(200)):
+                # Mix appends past the end, which take the in-place tail path, with inserts
+                item = rng.randrange(60) if rng.random() < 0.5 else 60 + len(expected)
+                if expected and rng.random() < 0.3:
+                    item = rng.choice(expected)
+                    items = items.remove(item)
+                    expected.remove(item)
+                else:
+                    added = items.add(item)
+                    assert (added is items) == (item in expected)
+                    items = added
+                    if item not in expected:
+                        bisect.insort(expected, item)
+            check_matches(items, expected)
+            assert all(0 < len(chunk) <= 2 * indexes.CHUNK_SIZE for chunk in items._chunks)
+
+    def test_older_versions_stay_unchanged(self, small_chunks):
+        rng = random.Random(1)
+        items, expected = PersistentSortedSet(), []
+        versions = []
+        for step in range(400):
+            if expected and step % 4 == 3:
+                item = rng.choice(expected)
+                items = items.remove(item)
+                expected.remove(item)
+            else:
+                item = rng.randrange(100) if step % 2 else 100 + step
+                items = items.add(item)
+                if item not in expected:
+                    bisect.insort(expected, item)
+            versions.append((items, list(expected)))
+        for items, expected in versions[::10]:
+            assert list(items.iter_from(0)) == expected
+            assert list(items.iter_before(len(items))) == expected[::-1]
+            assert len(items) == len(expected)
+
+    def test_changing_an_older_version_leaves_newer_ones_alone(self, small_chunks):
+        items = PersistentSortedSet()
+        for item in range(0, 20, 2):
+            items = items.add(item)
+        newer = items.add(100).add(101)
+        # Both branch off the tail that ``newer`` appended to in place
+        appended = items.add(200)
+        inserted = items.add(7)
+        check_matches(newer, list(range(0, 20, 2)) + [100, 101])
+        check_matches(appended, list(range(0, 20, 2)) + [200])
+        check_matches(inserted, sorted(list(range(0, 20, 2)) + [7]))
+        check_matches(items, list(range(0, 20, 2)))
+
+    def test_replace_leaves_older_versions_alone(self, small_chunks):
+        items = PersistentSortedSet()
+        for user_id in range(1, 12):
+            items = items.add((user_id, "v0"))
+        # Positions 0-7 sit in chunks and 8-10 in the tail
+        versions = [items]
+        for position in (0, 5, 7, 8, 10):
+            user_id = items[position][0]
+            assert items.bisect_left((user_id,)) == position
+            items = items.replace(position, (user_id, "v1"))
+            versions.append(items)
+        assert [item for item in items.iter_from(0) if item[1] == "v1"] == [(1, "v1"), (6, "v1"), (8, "v1"), (9, "v1"), (11, "v1")]
+        assert list(versions[0].iter_from(0)) == [(user_id, "v0") for user_id in range(1, 12)]
+        assert list(versions[3].iter_from(0))[8] == (9, "v0")
+        assert len(items) == 11
+
+    def test_removing_absent_items_returns_same_version(self):
+        items = PersistentSortedSet().add(2).add(4)
+        assert items.remove(3) is items
+        assert items.remove(5) is items
+        assert PersistentSortedSet().remove(1)._tail_len == 0
+
+
+class TestIndexes:
+
+    def test_sorted_index_reader_keeps_its_version(self, small_chunks):
+        index = SortedIndex()
+        for user_id in range(1, 50):
+            index.add(user_id % 7, user_id)
+        page = index.page(100)
+        held = index._keys
+        for user_id in range(50, 80):
+            index.add(-user_id, user_id)
+        index.remove(3, 3)
+        assert list(held.iter_from(0)) == page
+        assert len(index) == 49 + 30 - 1
+
+    def test_trigram_candidates_follow_adds_and_removes(self, small_chunks):
+        index = TrigramIndex()
+        names = {user_id: f"user{user_id % 10}_name" for user_id in range(1, 60)}
+        for user_id, name in names.items():
+            index.add(name, user_id)
+        index.remove(names[13], 13)
+        expected = [user_id for user_id, name in names.items() if "r3_" in name and user_id != 13]
+        assert list(index.candidates("r3_")) == expected
+        assert list(index.candidates("r3_", after=23)) == [i for i in expected if i > 23]
+        assert list(index.candidates("zzz")) == []
+        assert index.candidates("r3") is None
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import pytest
+
+from journal import UserJournal, _numbered, _segment_path
+from storage import InMemoryUserStorage
+
+PASSWORD = "pbkdf2_sha256$120000$salt$digest"
+
+
+def open_store(directory):
+    return InMemoryUserStorage(journal=UserJournal(str(directory), fsync="always"))
+
+
+def rows(store):
+    return [user.to_row() for user in store.iter_users()]
+
+
+class TestJournal:
+
+    def test_replay_restores_every_change(self, tmp_path):
+        store = open_store(tmp_path)
+        for i in range(20):
+            store.create(f"user{i}", f"user{i}@example.com", PASSWORD, 20 + i, phone=f"+1555000{i:04d}")
+        store.update(3, email="changed@example.com", age=77)
+        store.update(4, phone="")
+        store.deactivate(5)
+        store.record_login(6)
+        expected = rows(store)
+        store.close()
+
+        store = open_store(tmp_path)
+        try:
+            assert rows(store) == expected
+            assert store.counts() == (20, 19)
+            assert store.get_by_email("changed@example.com").id == 3
+            assert store.get_by_email("user2@example.com") is None
+            assert store.get_by_phone("+15550000003") is None
+            # Ids continue after the recovered ones
+            assert store.create("late", "late@example.com", PASSWORD, 30).id == 21
+        finally:
+            store.close()
+
+    def test_torn_trailing_line_is_ignored(self, tmp_path):
+        store = open_store(tmp_path)
+        for i in range(5):
+            store.create(f"user{i}", f"user{i}@example.com", PASSWORD, 20)
+        expected = rows(store)
+        store.close()
+        segment = _numbered(str(tmp_path), "log")[-1]
+        with open(_segment_path(str(tmp_path), segment), "ab") as f:
+            f.write(b'{"op":"create","row":[6,"torn"')
+
+        store = open_store(tmp_path)
+        try:
+            assert rows(store) == expected
+            # Writes after recovery go to a fresh segment, not after the torn line
+            store.create("after", "after@example.com", PASSWORD, 20)
+            expected = rows(store)
+        finally:
+            store.close()
+        store = open_store(tmp_path)
+        try:
+            assert rows(store) == expected
+        finally:
+            store.close()
+
+    def test_snapshot_during_concurrent_writes(self, tmp_path):
+        journal = UserJournal(str(tmp_path), fsync="never", snapshot_interval=3600)
+        store = InMemoryUserStorage(journal=journal)
+        stop = threading.Event()
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                user = store.create(f"user{i}", f"user{i}@example.com", PASSWORD, 20)
+                if i % 3 == 0:
+                    store.update(user.id, age=21, phone=f"+1555{i:07d}")
+                if i % 5 == 0:
+                    store.deactivate(max(user.id - 2, 1))
+                if i % 7 == 0:
+                    store.update(max(user.id - 1, 1), email=f"moved{i}@example.com")
+                i += 1
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            snapshots = 0
+            while snapshots < 5 or store.counts()[0] < 500:
+                journal.snapshot()
+                snapshots += 1
+        finally:
+            stop.set()
+            thread.join()
+        expected = rows(store)
+        counts = store.counts()
+        store.close()
+        assert len(_numbered(str(tmp_path), "snapshot")) == 1
+
+        store = open_store(tmp_path)
+        try:
+            assert store.base is not None
+            assert rows(store) == expected
+            assert store.counts() == counts
+            for row in expected:
+                assert store.get_by_email(row[2]).id == row[0]
+        finally:
+            store.close()
+
+    def test_writes_rejected_after_flush_failure(self, tmp_path):
+        store = open_store(tmp_path)
+        store.create("before", "before@example.com", PASSWORD, 20)
+
+        def fail(batch):
+            raise OSError("disk full")
+
+        store.journal._write = fail
+        try:
+            with pytest.raises(RuntimeError):
+                store.create("lost", "lost@example.com", PASSWORD, 20)
+            total = store.counts()
+            with pytest.raises(RuntimeError):
+                store.create("rejected", "rejected@example.com", PASSWORD, 20)
+            with pytest.raises(RuntimeError):
+                store.update(1, age=99)
+            with pytest.raises(RuntimeError):
+                store.record_login(1)
+            # Nothing was applied, and nothing was left buffered
+            assert store.counts() == total
+            assert store.get_by_username("rejected") is None
+            assert store.get(1).age == 20
+            assert store.get(1).last_login is None
+            assert store.journal._buffer == []
+        finally:
+            store.close()
+
+    def test_failed_snapshot_is_retried(self, tmp_path, monkeypatch):
+        journal = UserJournal(str(tmp_path), snapshot_interval=0.2, snapshot_entries=1)
+        store = InMemoryUserStorage(journal=journal)
+        attempts = []
+
+        def fail(*args):
+            attempts.append(args)
+            raise ValueError("broken snapshot")
+
+        monkeypatch.setattr("journal.write_snapshot", fail)
+        store.create("user", "user@example.com", PASSWORD, 20)
+        deadline = time.monotonic() + 5
+        while len(attempts) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        monkeypatch.undo()
+        while not _numbered(str(tmp_path), "snapshot") and time.monotonic() < deadline:
+            time.sleep(0.05)
+        store.close()
+        assert len(attempts) >= 2
+        assert not journal._snapshotter.is_alive()
+
+        store = open_store(tmp_path)
+        try:
+            assert store.base is not None
+            assert store.get_by_username("user") is not None
+        finally:
+            store.close()
@@ -1,3 +1,7 @@
+import csv
+import io
+import json
+
 import pytest
 import httpx
 
@@ -72,6 +76,38 @@ class TestMisc:
             # memory_sessions should increase by 1
             assert after_login_data["memory_sessions"] == initial_sessions + 1
 
+    def test_readiness_diagnostics(self, client):
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["records"]["users"] > 0
+        # Which structures are measured depends on the storage backend
+        approx_bytes = data["approx_bytes"]
+        assert approx_bytes
+        if "users_db" in approx_bytes:
+            assert approx_bytes["users_db"] > 0
+            assert set(approx_bytes["sort_indexes"]) == {"id", "username", "created_at"}
+        else:
+            assert approx_bytes["sqlite_database"] > 0
+        assert "tracemalloc" not in data
+
+        # Allocation tracing is only available when the server enables it
+        response = client.get("/health/ready?tracemalloc=true&top=3")
+        assert response.status_code in (200, 403)
+        if response.status_code == 200:
+            assert response.json()["tracemalloc"]["tracing"] is True
+            assert len(response.json()["tracemalloc"]["top"]) <= 3
+
+    def test_readiness_response_cache_counters(self, client):
+        client.get("/users/search?q=john")
+        client.get("/users/search?q=john")
+        counters = client.get("/health/ready").json()["response_cache"]
+        assert counters["hits"] >= 1
+        assert counters["misses"] >= 1
+        assert "evictions" in counters
+        assert counters["bytes"] <= counters["max_bytes"]
+
     def test_stats_basic(self, client):
         response = client.get("/stats")
         assert response.status_code == 200
@@ -96,6 +132,62 @@ class TestMisc:
         assert isinstance(data["user_emails"], list)
         assert isinstance(data["session_tokens"], list)
 
+    def test_stats_counts_follow_deletes(self, client):
+        before = client.get("/stats").json()
+        assert before["total_users"] == before["active_users"] + before["inactive_users"]
+
+        created = client.post("/users", json={
+            "username": "stats_counter_user",
+            "email": "stats_counter@example.com",
+            "password": "Password123",
+            "age": 25
+        }, headers={"X-Forwarded-For": "10.0.2.2"})
+        assert created.status_code == 201
+        response = client.delete(f"/users/{created.json()['id']}", auth=("stats_counter_user", "Password123"))
+        assert response.status_code == 200
+
+        after = client.get("/stats").json()
+        assert after["total_users"] == before["total_users"] + 1
+        assert after["active_users"] == before["active_users"]
+        assert after["inactive_users"] == before["inactive_users"] + 1
+
+    def test_stats_details_are_paginated(self, client):
+        first = client.get("/stats?include_details=true&details_limit=2")
+        assert first.status_code == 200
+        assert len(first.json()["user_emails"]) == 2
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = client.get(f"/stats?include_details=true&details_limit=2&details_cursor={cursor}")
+        assert second.status_code == 200
+        assert not set(first.json()["user_emails"]) & set(second.json()["user_emails"])
+
+    def test_stats_emails_stream(self, client):
+        response = client.get("/stats/emails")
+        assert response.status_code == 200
+        emails = [line for line in response.text.splitlines() if line]
+        assert len(emails) == client.get("/stats").json()["total_users"]
+
+    def test_export_users_ndjson(self, client):
+        response = client.get("/users/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        users = [json.loads(line) for line in response.text.splitlines() if line]
+        assert len(users) == client.get("/stats").json()["total_users"]
+        assert [user["id"] for user in users] == sorted(user["id"] for user in users)
+        first = client.get(f"/users/{users[0]['id']}").json()
+        assert users[0] == first
+
+    def test_export_users_csv(self, client):
+        response = client.get("/users/export?format=csv")
+        assert response.status_code == 200
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert list(rows[0]) == ["id", "username", "email", "age", "created_at", "is_active", "phone", "last_login"]
+        assert len(rows) == client.get("/stats").json()["total_users"]
+
+    def test_export_users_invalid_format(self, client):
+        response = client.get("/users/export?format=xml")
+        assert response.status_code == 422
+
     def test_search_users_by_username(self, client):
         response = client.get("/users/search?q=john")
         assert response.status_code == 200
@@ -134,6 +226,31 @@ class TestMisc:
         response = client.get("/users/search?q=test&field=invalid")
         assert response.status_code == 422
 
+    def test_search_users_limit_and_cursor(self, client):
+        for i in range(5):
+            client.post("/users", json={
+                "username": f"cursor_search_{i}",
+                "email": f"cursor_search_{i}@example.com",
+                "password": "Password123",
+                "age": 25
+            }, headers={"X-Forwarded-For": "10.0.2.1"})
+
+        first = client.get("/users/search?q=cursor_search&limit=3")
+        assert first.status_code == 200
+        assert len(first.json()) == 3
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = client.get(f"/users/search?q=cursor_search&limit=3&cursor={cursor}")
+        assert second.status_code == 200
+        ids = [u["id"] for u in first.json() + second.json()]
+        assert len(ids) == 5
+        assert ids == sorted(set(ids))
+
+    def test_search_users_short_query_is_limited(self, client):
+        response = client.get("/users/search?q=a&limit=2")
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+
     def test_rate_limiting(self, client):
         # Make multiple requests quickly to test rate limiting
         for i in range(5):
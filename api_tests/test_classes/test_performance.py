@@ -239,3 +239,40 @@ class TestPerformance:
         response_time = end_time - start_time
         assert response.status_code == 200
         assert response_time < 1.0
+
+    def test_failed_logins_do_not_block_other_requests(self, client):
+        def failed_login(i):
+            response = client.post("/login", json={"username": "john_doe", "password": f"wrong_{i}"})
+            return response.status_code
+
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            futures = [executor.submit(failed_login, i) for i in range(50)]
+            start_time = time.time()
+            response = client.get("/")
+            root_time = time.time() - start_time
+            results = [future.result() for future in futures]
+
+        assert all(status == 401 for status in results)
+        assert response.status_code == 200
+        # Failure delays are awaited, so they must not hold up unrelated requests
+        assert root_time < 0.5
+
+    def test_repeated_basic_auth_is_fast(self, client):
+        client.post("/users", json={
+            "username": "basic_auth_cache_user",
+            "email": "basic_auth_cache@example.com",
+            "password": "Password123",
+            "age": 25
+        }, headers={"X-Forwarded-For": "10.0.5.1"})
+        auth = ("basic_auth_cache_user", "Password123")
+        assert client.delete("/users/99999", auth=auth).status_code == 404
+
+        start_time = time.time()
+        for _ in range(20):
+            response = client.delete("/users/99999", auth=auth)
+            assert response.status_code == 404
+        total_time = time.time() - start_time
+
+        # Verified credentials are cached, so repeats skip password hashing
+        assert total_time < 1.0
+        assert client.delete("/users/99999", auth=("basic_auth_cache_user", "wrong")).status_code == 401
@@ -61,6 +61,28 @@ class TestSecurity:
             # If we get here, rate limiting might not be working properly
             pytest.fail("Rate limiting not working properly")
 
+    def test_rate_limit_is_per_client(self, client):
+        limited = False
+        for i in range(150):
+            response = client.post("/users", json={
+                "username": f"rate_client_{i}",
+                "email": f"rate_client_{i}@example.com",
+                "password": "Password123",
+                "age": 25
+            }, headers={"X-Forwarded-For": "10.0.4.1"})
+            if response.status_code == 429:
+                limited = True
+                break
+        assert limited
+
+        response = client.post("/users", json={
+            "username": "rate_other_client",
+            "email": "rate_other_client@example.com",
+            "password": "Password123",
+            "age": 25
+        }, headers={"X-Forwarded-For": "10.0.4.2"})
+        assert response.status_code == 201
+
     def test_brute_force_protection(self, client):
         # Try multiple failed login attempts
         for i in range(5):
@@ -0,0 +1,180 @@
+import random
+
+import pytest
+
+from indexes import SortedIndex, normalize_email, normalize_phone, trigrams
+from journal import UserJournal
+from mapped_snapshot import MappedSnapshot, write_snapshot
+from storage import InMemoryUserStorage
+
+PASSWORD = "pbkdf2_sha256$120000$salt$digest"
+
+
+def sample_rows(count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for user_id in range(1, count + 1):
+        username = f"{rng.choice(['ann', 'Bob', 'çelik', 'dana'])}_{rng.getrandbits(20):05x}_{user_id}"
+        phone = f"+1555{user_id:07d}" if user_id % 3 else None
+        last_login = 1_700_000_000.5 + user_id if user_id % 4 == 0 else None
+        rows.append(
+            (
+                user_id,
+                username,
+                f"{username.upper()}@Example.com",
+                PASSWORD,
+                18 + user_id % 80,
+                phone,
+                # Repeated creation times make ties that the id has to break
+                1_600_000_000.25 + rng.randrange(20),
+                last_login,
+                user_id % 5 != 0,
+                user_id % 7,
+            )
+        )
+    return rows
+
+
+def reference_page(keys, limit, offset=0, after=None, descending=False):
+    keys = sorted(keys, reverse=descending)
+    if after is not None:
+        keys = [key for key in keys if (key < after if descending else key > after)]
+    return keys[offset : offset + limit]
+
+
+class TestMappedSnapshot:
+
+    def test_round_trip(self, tmp_path):
+        rows = sample_rows(200)
+        path = str(tmp_path / "snapshot")
+        write_snapshot(path, 7, rows)
+        snapshot = MappedSnapshot(path)
+        assert len(snapshot) == 200
+        assert snapshot.segment == 7
+        assert snapshot.active_count == sum(row[8] for row in rows)
+        assert [snapshot.row(i) for i in range(len(snapshot))] == rows
+        assert snapshot.record(41).to_row() == rows[41]
+        assert snapshot.row_of(42) == 41
+        assert snapshot.row_of(0) is None
+        assert snapshot.row_of(201) is None
+
+    def test_empty_snapshot(self, tmp_path):
+        path = str(tmp_path / "snapshot")
+        write_snapshot(path, 1, [])
+        snapshot = MappedSnapshot(path)
+        assert len(snapshot) == 0
+        assert snapshot.row_of(1) is None
+        assert snapshot.find("username", "ann") == []
+        assert len(snapshot.sorted_keys("username")) == 0
+
+    def test_lookups_and_orders(self, tmp_path):
+        rows = sample_rows(300)
+        path = str(tmp_path / "snapshot")
+        write_snapshot(path, 1, rows)
+        snapshot = MappedSnapshot(path)
+        row = rows[123]
+        assert snapshot.find("username", row[1]) == [123]
+        assert snapshot.find("email", normalize_email(row[2])) == [123]
+        assert snapshot.find("phone", normalize_phone(row[5])) == [123]
+        assert snapshot.find("username", "missing") == []
+
+        for sort_by, column in (("id", 0), ("username", 1), ("created_at", 6)):
+            keys = snapshot.sorted_keys(sort_by)
+            assert [keys[i] for i in range(len(keys))] == sorted((row[column], row[0]) for row in rows)
+
+        postings = snapshot.postings("username")
+        for gram in ("ann", "_10", "çel", "zzz"):
+            expected = [row[0] for row in rows if gram in trigrams(row[1].lower())]
+            assert list(postings.get(gram)) == expected
+
+    def test_unsupported_file_is_rejected(self, tmp_path):
+        path = tmp_path / "snapshot"
+        path.write_bytes(b"not a snapshot" * 10)
+        with pytest.raises(ValueError):
+            MappedSnapshot(str(path))
+
+
+class TestMergedPaging:
+
+    def make_index(self, seed):
+        rng = random.Random(seed)
+        keys = {(rng.randrange(50), user_id) for user_id in range(1, 400)}
+        base = sorted(key for key in keys if key[1] % 3)
+        index = SortedIndex(base)
+        overlay = [key for key in keys if not key[1] % 3]
+        rng.shuffle(overlay)
+        for value, user_id in overlay:
+            index.add(value, user_id)
+        return index, sorted(keys)
+
+    @pytest.mark.parametrize("descending", [False, True])
+    def test_offsets(self, descending):
+        index, keys = self.make_index(1)
+        assert len(index) == len(keys)
+        for offset in list(range(0, 40)) + [150, 265, len(keys) - 1, len(keys), len(keys) + 5]:
+            for limit in (0, 1, 7, 50):
+                assert index.page(limit, offset=offset, descending=descending) == reference_page(
+                    keys, limit, offset, descending=descending
+                )
+
+    @pytest.mark.parametrize("descending", [False, True])
+    def test_cursors(self, descending):
+        index, keys = self.make_index(2)
+        rng = random.Random(3)
+        afters = keys[:3] + keys[-3:] + rng.sample(keys, 30) + [(-1, 0), (25, 0), (99, 0)]
+        for after in afters:
+            for offset in (0, 1, 13):
+                assert index.page(10, offset=offset, after=after, descending=descending) == reference_page(
+                    keys, 10, offset, after, descending
+                )
+
+    @pytest.mark.parametrize("descending", [False, True])
+    def test_walking_every_page(self, descending):
+        index, keys = self.make_index(4)
+        walked, after = [], None
+        while True:
+            page = index.page(17, after=after, descending=descending)
+            walked.extend(page)
+            if len(page) < 17:
+                break
+            after = page[-1]
+        assert walked == sorted(keys, reverse=descending)
+
+    @pytest.mark.parametrize("descending", [False, True])
+    def test_store_pages_over_mapped_snapshot(self, tmp_path, descending):
+        store = InMemoryUserStorage(journal=UserJournal(str(tmp_path), snapshot_interval=3600))
+        rng = random.Random(5)
+        for i in range(150):
+            store.create(f"{rng.getrandbits(24):06x}_{i}", f"user{i}@example.com", PASSWORD, 30)
+        store.journal.snapshot()
+        store.close()
+
+        store = InMemoryUserStorage(journal=UserJournal(str(tmp_path), snapshot_interval=3600))
+        try:
+            assert store.base is not None
+            for i in range(60):
+                store.create(f"{rng.getrandbits(24):06x}_new{i}", f"new{i}@example.com", PASSWORD, 30)
+            store.update(10, age=99)
+            keys = [(user.username, user.id) for user in store.iter_users()]
+            assert len(keys) == 210
+            for offset in (0, 5, 149, 205, 210):
+                page = store.page("username", descending, 10, offset=offset)
+                assert [key for key, _ in page] == reference_page(keys, 10, offset, descending=descending)
+                assert all(user.username == key[0] for key, user in page)
+            # An export sees the store as it was when it started
+            exported = store.snapshot_users()
+            store.update(20, age=55)
+            store.deactivate(170)
+            store.create("late_user", "late_user@example.com", PASSWORD, 30)
+            before = {user.id: user for user in exported}
+            assert len(before) == 210
+            assert before[20].age == 30 and before[170].is_active is True
+            now = {user.id: user for user in store.snapshot_users()}
+            assert len(now) == 211
+            assert now[20].age == 55 and now[170].is_active is False
+            after = sorted(keys)[100]
+            page = store.page("username", descending, 10, after=after)
+            assert [key for key, _ in page] == reference_page(keys, 10, 0, after, descending)
+            assert store.get(10).age == 99
+        finally:
+            store.close()
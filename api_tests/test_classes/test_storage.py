@@ -0,0 +1,358 @@
+import random
+import threading
+import time
+
+import pytest
+
+from indexes import split_offset
+from journal import UserJournal
+from sharded_storage import ShardedUserStorage, shard_directories
+from session_store import SessionStore
+from sqlite_storage import SQLiteSessionStorage, SQLiteUserStorage
+from storage import DuplicateUserError, InMemoryUserStorage, VersionConflictError, search_matches
+
+PASSWORD = "pbkdf2_sha256$120000$salt$digest"
+
+# Backend name -> factory taking a directory; persistent backends reopen what
+# an earlier store in the same directory wrote
+BACKENDS = {
+    "memory": lambda directory: InMemoryUserStorage(),
+    "journal": lambda directory: InMemoryUserStorage(journal=UserJournal(str(directory), fsync="never")),
+    "sqlite": lambda directory: SQLiteUserStorage(str(directory / "users.db"), pool_size=2),
+    "sharded": lambda directory: ShardedUserStorage(3),
+    "sharded_journal": lambda directory: ShardedUserStorage(
+        3, journals=[UserJournal(d, fsync="never") for d in shard_directories(str(directory), 3)]
+    ),
+}
+PERSISTENT = ("journal", "sqlite", "sharded_journal")
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def store(backend, tmp_path):
+    store = BACKENDS[backend](tmp_path)
+    yield store
+    store.close()
+
+
+def create_users(store, count, prefix="user"):
+    return [
+        store.create(f"{prefix}{i:03d}", f"{prefix}{i:03d}@example.com", PASSWORD, 18 + i % 60, phone=f"+1555{i:07d}")
+        for i in range(count)
+    ]
+
+
+def keys_of(page):
+    return [key for key, _ in page]
+
+
+class TestStorageBackends:
+
+    def test_create_and_lookups(self, store):
+        user = store.create("alice", "Alice@Example.com", PASSWORD, 30, phone="+15550001")
+        assert user.id > 0
+        assert user.version == 0
+        assert store.get(user.id).username == "alice"
+        assert store.get_by_username("alice").id == user.id
+        assert store.get_by_email(" alice@example.COM ").id == user.id
+        assert store.get_by_phone("15550001").id == user.id
+        assert store.get(user.id + 1000) is None
+        assert store.get_by_username("bob") is None
+        assert store.counts() == (1, 1)
+
+    def test_duplicates_are_rejected(self, store):
+        store.create("alice", "alice@example.com", PASSWORD, 30, phone="+15550001")
+        for kwargs, field in (
+            ({"username": "alice", "email": "other@example.com"}, "Username"),
+            ({"username": "bob", "email": "ALICE@example.com"}, "Email"),
+            ({"username": "bob", "email": "bob@example.com", "phone": "15550001"}, "Phone"),
+        ):
+            with pytest.raises(DuplicateUserError) as e:
+                store.create(password=PASSWORD, age=20, **kwargs)
+            assert e.value.field == field
+        assert store.counts() == (1, 1)
+
+    def test_create_many_reports_each_row(self, store):
+        store.create("taken", "taken@example.com", PASSWORD, 30)
+        rows = [
+            {"username": "a", "email": "a@example.com", "password": PASSWORD, "age": 20, "phone": None},
+            {"username": "taken", "email": "b@example.com", "password": PASSWORD, "age": 20, "phone": None},
+            {"username": "c", "email": "a@example.com", "password": PASSWORD, "age": 20, "phone": None},
+            {"username": "d", "email": "d@example.com", "password": PASSWORD, "age": 20, "phone": "+1999"},
+        ]
+        results = store.create_many(rows)
+        assert [type(result).__name__ for result in results] == [
+            "UserRecord", "DuplicateUserError", "DuplicateUserError", "UserRecord"
+        ]
+        assert results[0].id != results[3].id
+        assert store.get_by_phone("1999").username == "d"
+        assert store.counts() == (3, 3)
+
+    def test_update_moves_unique_values(self, store):
+        alice, bob = create_users(store, 2)
+        updated = store.update(alice.id, email="new@example.com", age=50, phone="")
+        assert (updated.email, updated.age, updated.phone) == ("new@example.com", 50, "")
+        assert updated.version == alice.version + 1
+        assert store.get_by_email(alice.email) is None
+        assert store.get_by_phone(alice.phone) is None
+        # Released values can be taken by someone else
+        store.update(bob.id, email=alice.email, phone=alice.phone)
+        assert store.get_by_email(alice.email).id == bob.id
+        with pytest.raises(DuplicateUserError):
+            store.update(alice.id, email=alice.email)
+        assert store.update(alice.id + 1000, age=1) is None
+
+    def test_update_with_expected_version(self, store):
+        (user,) = create_users(store, 1)
+        updated = store.update(user.id, age=40, expected_version=user.version)
+        with pytest.raises(VersionConflictError) as e:
+            store.update(user.id, age=41, expected_version=user.version)
+        assert e.value.current.version == updated.version
+        assert store.get(user.id).age == 40
+
+    def test_deactivate_and_login(self, store):
+        (user,) = create_users(store, 1)
+        store.record_login(user.id)
+        logged_in = store.get(user.id)
+        assert logged_in.last_login_ts is not None
+        assert logged_in.version == user.version + 1
+        assert store.deactivate(user.id) is True
+        assert store.deactivate(user.id) is False
+        assert store.deactivate(user.id + 1000) is None
+        assert store.get(user.id).is_active is False
+        assert store.counts() == (1, 0)
+
+    def test_generation_moves_on_writes(self, store):
+        before = store.generation()
+        (user,) = create_users(store, 1)
+        after_create = store.generation()
+        assert after_create > before
+        store.record_login(user.id)
+        assert store.generation() > after_create
+
+    @pytest.mark.parametrize("sort_by", ["id", "username", "created_at"])
+    @pytest.mark.parametrize("descending", [False, True])
+    def test_pages_by_offset_and_cursor(self, store, sort_by, descending):
+        create_users(store, 40)
+        attribute = {"id": "id", "username": "username", "created_at": "created_ts"}[sort_by]
+        expected = sorted(((getattr(u, attribute), u.id) for u in store.iter_users()), reverse=descending)
+        assert keys_of(store.page(sort_by, descending, 10)) == expected[:10]
+        assert keys_of(store.page(sort_by, descending, 10, offset=35)) == expected[35:]
+        walked, after = [], None
+        while True:
+            page = store.page(sort_by, descending, 7, after=after)
+            assert all(key[1] == user.id for key, user in page)
+            walked += keys_of(page)
+            if len(page) < 7:
+                break
+            after = page[-1][0]
+        assert walked == expected
+
+    def test_search(self, store):
+        create_users(store, 30)
+        store.create("zeta", "someone@example.org", PASSWORD, 30)
+        users = list(store.iter_users())
+        for pattern, field, exact in (
+            ("user01", "username", False),
+            ("ser0", "all", False),
+            ("example.org", "email", False),
+            ("zeta", "username", True),
+            ("ze", "all", False),
+        ):
+            expected = [u.id for u in users if search_matches(u, pattern, field, exact)]
+            assert [u.id for u in store.search(pattern, field, exact, 0, 100)] == expected
+            assert [u.id for u in store.search(pattern, field, exact, expected[0], 3)] == expected[1:4]
+
+    def test_iteration_and_snapshot(self, store):
+        users = create_users(store, 25)
+        ids = [user.id for user in users]
+        assert [u.id for u in store.iter_users()] == ids
+        assert [u.id for u in store.iter_users(after_id=ids[9])] == ids[10:]
+        snapshot = store.snapshot_users()
+        store.create("late", "late@example.com", PASSWORD, 30)
+        store.update(ids[3], age=99)
+        store.record_login(ids[-1])
+        assert [u.to_row() for u in snapshot] == [u.to_row() for u in users]
+
+    def test_concurrent_creates_keep_values_unique(self, store):
+        errors = []
+
+        def writer(t):
+            for i in range(30):
+                try:
+                    # Every thread competes for the same emails
+                    store.create(f"t{t}_{i}", f"shared{i}@example.com", PASSWORD, 20)
+                except DuplicateUserError:
+                    errors.append(i)
+
+        threads = [threading.Thread(target=writer, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert store.counts() == (30, 30)
+        assert len(errors) == 90
+        assert len({u.id for u in store.iter_users()}) == 30
+
+    def test_reopen_keeps_users(self, backend, tmp_path):
+        if backend not in PERSISTENT:
+            pytest.skip("nothing to reopen")
+        store = BACKENDS[backend](tmp_path)
+        users = create_users(store, 10)
+        store.update(users[3].id, email="moved@example.com")
+        store.deactivate(users[4].id)
+        expected = [user.to_row() for user in store.iter_users()]
+        store.close()
+        store = BACKENDS[backend](tmp_path)
+        try:
+            assert [user.to_row() for user in store.iter_users()] == expected
+            assert store.counts() == (10, 9)
+            assert store.get_by_email("moved@example.com").id == users[3].id
+            assert store.create("new", "new@example.com", PASSWORD, 30).id > users[-1].id
+        finally:
+            store.close()
+
+
+class TestSessionStorage:
+
+    @pytest.fixture(params=["memory", "sqlite"])
+    def user_store(self, request, tmp_path):
+        store = BACKENDS[request.param](tmp_path)
+        yield store
+        store.close()
+
+    def test_backend_picks_the_implementation(self, tmp_path):
+        assert isinstance(InMemoryUserStorage().session_storage(), SessionStore)
+        assert isinstance(ShardedUserStorage(2).session_storage(), SessionStore)
+        store = BACKENDS["sqlite"](tmp_path)
+        try:
+            assert isinstance(store.session_storage(), SQLiteSessionStorage)
+        finally:
+            store.close()
+
+    def test_create_get_revoke(self, user_store):
+        sessions = user_store.session_storage(ttl_seconds=60)
+        token, session = sessions.create("alice", "10.0.0.1")
+        found = sessions.get(token)
+        assert (found.username, found.ip) == ("alice", "10.0.0.1")
+        assert found.expires_at == pytest.approx(session.created_at + 60)
+        assert len(sessions) == 1
+        assert sessions.sample(5) == [token]
+        assert sessions.get("not-hex") is None
+        assert sessions.get("00" * 16) is None
+        assert sessions.revoke(token) is True
+        assert sessions.revoke(token) is False
+        assert sessions.get(token) is None
+        assert len(sessions) == 0
+
+    def test_per_user_cap_drops_the_oldest(self, user_store):
+        sessions = user_store.session_storage(max_sessions_per_user=2)
+        tokens = [sessions.create("alice", "10.0.0.1")[0] for _ in range(3)]
+        other, _ = sessions.create("bob", "10.0.0.2")
+        assert sessions.get(tokens[0]) is None
+        assert all(sessions.get(token) for token in tokens[1:] + [other])
+        assert len(sessions) == 3
+
+    def test_total_cap_drops_the_soonest_to_expire(self, user_store):
+        sessions = user_store.session_storage(max_sessions=3)
+        tokens = [sessions.create(f"user{i}", "10.0.0.1")[0] for i in range(4)]
+        assert sessions.get(tokens[0]) is None
+        assert all(sessions.get(token) for token in tokens[1:])
+        assert len(sessions) == 3
+
+    def test_expired_sessions_are_swept(self, user_store):
+        sessions = user_store.session_storage(ttl_seconds=0.05)
+        token, _ = sessions.create("alice", "10.0.0.1")
+        time.sleep(0.1)
+        assert sessions.get(token) is None
+        assert sessions.sample(5) == []
+        sessions.create("bob", "10.0.0.2")
+        assert len(sessions) == 1
+
+    def test_caps_below_one_are_rejected(self, user_store):
+        with pytest.raises(ValueError):
+            user_store.session_storage(max_sessions=0)
+        with pytest.raises(ValueError):
+            user_store.session_storage(max_sessions_per_user=0)
+
+    def test_workers_on_one_database_share_sessions(self, tmp_path):
+        first = BACKENDS["sqlite"](tmp_path)
+        second = BACKENDS["sqlite"](tmp_path)
+        try:
+            token, _ = first.session_storage().create("alice", "10.0.0.1")
+            other = second.session_storage()
+            assert other.get(token).username == "alice"
+            assert len(other) == 1
+            assert other.revoke(token) is True
+            assert first.session_storage().get(token) is None
+        finally:
+            first.close()
+            second.close()
+
+
+class TestSharding:
+
+    def test_users_spread_over_shards(self):
+        store = ShardedUserStorage(4)
+        create_users(store, 100)
+        sizes = [shard.counts()[0] for shard in store.shards]
+        assert sum(sizes) == 100
+        assert all(sizes)
+        for user in store.iter_users():
+            assert store._shard_for(user.username).get(user.id) is user
+
+    def test_emails_unique_across_shards(self):
+        store = ShardedUserStorage(4)
+        errors = []
+
+        def writer(t):
+            for i in range(50):
+                try:
+                    # Usernames differ, so the competing writers sit on different shards
+                    store.create(f"t{t}_{i}", f"shared{i}@example.com", PASSWORD, 20, phone=f"+1{i}")
+                except DuplicateUserError:
+                    errors.append(i)
+
+        threads = [threading.Thread(target=writer, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert store.counts() == (50, 50)
+        assert len(errors) == 150
+        assert store._claims == {"email": {}, "phone": {}}
+
+    def test_shard_directories(self, tmp_path):
+        directory = str(tmp_path)
+        assert shard_directories(directory, 1) == [directory]
+        paths = shard_directories(directory, 3)
+        assert len(paths) == 3
+        assert shard_directories(directory, 3) == paths
+        with pytest.raises(ValueError):
+            shard_directories(directory, 2)
+        with pytest.raises(ValueError):
+            shard_directories(directory, 1)
+
+    def test_unsharded_directory_is_not_resharded(self, tmp_path):
+        store = InMemoryUserStorage(journal=UserJournal(str(tmp_path)))
+        create_users(store, 1)
+        store.close()
+        with pytest.raises(ValueError):
+            shard_directories(str(tmp_path), 2)
+
+    @pytest.mark.parametrize("descending", [False, True])
+    def test_split_offset_matches_a_merge(self, descending):
+        rng = random.Random(0)
+        for _ in range(50):
+            runs = [sorted(rng.sample(range(1000), rng.randrange(60)), reverse=descending) for _ in range(4)]
+            merged = sorted(((key, r) for r, run in enumerate(runs) for key in run), reverse=descending)
+            for k in (0, 1, 5, 37, 100, len(merged), len(merged) + 3):
+                taken = split_offset([(run.__getitem__, len(run)) for run in runs], k, descending)
+                # Keys are drawn without replacement per run, so ties only happen across runs
+                assert sum(taken) == min(k, len(merged))
+                chosen = sorted((key for r, run in enumerate(runs) for key in run[: taken[r]]), reverse=descending)
+                assert chosen == [key for key, _ in merged[: sum(taken)]]
@@ -188,4 +188,203 @@ class TestUserCRUD:
         }
         response2 = client.post("/users", json=payload2)
         # This might fail due to case sensitivity bug
-        assert response2.status_code in [201, 400]
\ No newline at end of file
+        assert response2.status_code in [201, 400]
+
+    def test_get_single_user_by_created_id(self, client):
+        payload = {
+            "username": "id_lookup_user",
+            "email": "id_lookup@example.com",
+            "password": "Password123",
+            "age": 25
+        }
+        response = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.1"})
+        assert response.status_code == 201
+        user_id = response.json()["id"]
+
+        response = client.get(f"/users/{user_id}")
+        assert response.status_code == 200
+        assert response.json()["id"] == user_id
+        assert response.json()["username"] == "id_lookup_user"
+
+    def test_created_user_ids_are_unique_and_increasing(self, client):
+        ids = []
+        for i in range(3):
+            payload = {
+                "username": f"sequence_user_{i}",
+                "email": f"sequence_{i}@example.com",
+                "password": "Password123",
+                "age": 25
+            }
+            response = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.2"})
+            assert response.status_code == 201
+            ids.append(response.json()["id"])
+        assert ids == sorted(set(ids))
+
+    def test_get_user_list_with_cursor(self, client):
+        first = client.get("/users?limit=3&sort_by=username&order=desc")
+        assert first.status_code == 200
+        assert len(first.json()) == 3
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = client.get(f"/users?limit=3&sort_by=username&order=desc&cursor={cursor}")
+        assert second.status_code == 200
+        usernames = [u["username"] for u in first.json() + second.json()]
+        assert usernames == sorted(usernames, reverse=True)
+        assert len(set(usernames)) == len(usernames)
+
+    def test_get_user_list_with_invalid_cursor(self, client):
+        response = client.get("/users?cursor=not-a-cursor")
+        assert response.status_code == 400
+        assert "Invalid cursor" in response.json()["detail"]
+
+    def test_create_user_duplicate_email(self, client):
+        payload = {
+            "username": "duplicate_email_user",
+            "email": "john@example.com",
+            "password": "Password123",
+            "age": 25
+        }
+        response = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.3"})
+        assert response.status_code == 400
+        assert "Email already exists" in response.json()["detail"]
+
+    def test_get_user_by_email(self, client):
+        response = client.get("/users/by-email/John@Example.com")
+        assert response.status_code == 200
+        assert response.json()["username"] == "john_doe"
+
+        response = client.get("/users/by-email/nobody@example.com")
+        assert response.status_code == 404
+
+    def test_get_user_by_phone(self, client):
+        response = client.get("/users/by-phone/+15551234567")
+        assert response.status_code == 200
+        assert response.json()["username"] == "john_doe"
+
+        response = client.get("/users/by-phone/+19999999999")
+        assert response.status_code == 404
+
+    def test_bulk_create_users_ndjson(self, client):
+        lines = [
+            '{"username": "bulk_user_1", "email": "bulk_user_1@example.com", "password": "Password123", "age": 30}',
+            '{"username": "bulk_user_2", "email": "bulk_user_2@example.com", "password": "Password123", "age": 10}',
+            '{"username": "BULK_USER_1", "email": "bulk_user_3@example.com", "password": "Password123", "age": 30}',
+            '{"username": "bulk_user_4", "email": "bulk_user_1@example.com", "password": "Password123", "age": 30}',
+            'not json',
+            '',
+            '{"username": "bulk_user_5", "email": "bulk_user_5@example.com", "password": "Password123", "age": 40}',
+        ]
+        response = client.post(
+            "/users/bulk",
+            content="\n".join(lines) + "\n",
+            headers={"Content-Type": "application/x-ndjson", "X-Forwarded-For": "10.0.1.4"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["status"] for r in data["results"]] == [201, 422, 400, 400, 422, 201]
+        assert [r["index"] for r in data["results"]] == list(range(6))
+        assert data["created"] == 2
+        assert data["failed"] == 4
+
+        user_id = data["results"][0]["id"]
+        response = client.get(f"/users/{user_id}")
+        assert response.status_code == 200
+        assert response.json()["username"] == "bulk_user_1"
+
+        response = client.post("/login", json={"username": "bulk_user_5", "password": "Password123"})
+        assert response.status_code == 200
+
+    def test_bulk_create_users_json_array(self, client):
+        payload = [
+            {"username": "bulk_array_1", "email": "bulk_array_1@example.com", "password": "Password123", "age": 30},
+            {"username": "bulk_array_1", "email": "bulk_array_2@example.com", "password": "Password123", "age": 30},
+        ]
+        response = client.post("/users/bulk", json=payload, headers={"X-Forwarded-For": "10.0.1.5"})
+        assert response.status_code == 200
+        assert [r["status"] for r in response.json()["results"]] == [201, 400]
+
+    def test_get_user_list_cached_until_write(self, client):
+        url = "/users?limit=5&sort_by=created_at&order=desc"
+        first = client.get(url)
+        second = client.get(url)
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.json() == first.json()
+
+        payload = {"username": "cache_probe", "email": "cache_probe@example.com", "password": "Password123", "age": 30}
+        response = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.6"})
+        assert response.status_code == 201
+        third = client.get(url)
+        assert third.headers["X-Cache"] == "MISS"
+        assert third.json()[0]["username"] == "cache_probe"
+
+    def test_get_user_conditional_etag(self, client):
+        payload = {"username": "etag_probe", "email": "etag_probe@example.com", "password": "Password123", "age": 30}
+        created = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.7"})
+        assert created.status_code == 201
+        user_id = created.json()["id"]
+
+        first = client.get(f"/users/{user_id}")
+        etag = first.headers["ETag"]
+        assert etag == created.headers["ETag"]
+        unchanged = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert unchanged.content == b""
+        assert unchanged.headers["ETag"] == etag
+
+        login = client.post("/login", json={"username": "etag_probe", "password": "Password123"})
+        assert login.status_code == 200
+        changed = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        assert changed.json()["last_login"] is not None
+
+    def test_get_user_list_conditional_etag(self, client):
+        first = client.get("/users?limit=5")
+        etag = first.headers["ETag"]
+        unchanged = client.get("/users?limit=5", headers={"If-None-Match": f"W/{etag}"})
+        assert unchanged.status_code == 304
+
+        payload = {"username": "etag_list_probe", "email": "etag_list_probe@example.com", "password": "Password123", "age": 30}
+        response = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.8"})
+        assert response.status_code == 201
+        changed = client.get("/users?limit=5", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+
+    def test_update_user_if_match(self, client):
+        payload = {"username": "if_match_probe", "email": "if_match_probe@example.com", "password": "Password123", "age": 30}
+        created = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.9"})
+        assert created.status_code == 201
+        user_id = created.json()["id"]
+        token = client.post("/login", json={"username": "john_doe", "password": "password123"}).json()["token"]
+        auth = {"Authorization": f"Bearer {token}"}
+        etag = client.get(f"/users/{user_id}").headers["ETag"]
+
+        updated = client.put(f"/users/{user_id}", json={"age": 31}, headers={**auth, "If-Match": etag})
+        assert updated.status_code == 200
+        assert updated.json()["age"] == 31
+        assert updated.headers["ETag"] != etag
+
+        stale = client.put(f"/users/{user_id}", json={"age": 32}, headers={**auth, "If-Match": etag})
+        assert stale.status_code == 412
+        assert stale.headers["ETag"] == updated.headers["ETag"]
+        weak = client.put(
+            f"/users/{user_id}", json={"age": 32}, headers={**auth, "If-Match": f"W/{updated.headers['ETag']}"}
+        )
+        assert weak.status_code == 412
+        assert client.get(f"/users/{user_id}").json()["age"] == 31
+
+    def test_deactivated_user_basic_auth_rejected(self, client):
+        payload = {"username": "deactivated_probe", "email": "deactivated_probe@example.com", "password": "Password123", "age": 30}
+        created = client.post("/users", json=payload, headers={"X-Forwarded-For": "10.0.1.10"})
+        assert created.status_code == 201
+        user_id = created.json()["id"]
+        auth = ("deactivated_probe", "Password123")
+
+        response = client.delete(f"/users/{user_id}", auth=auth)
+        assert response.status_code == 200
+        assert response.json()["was_active"] is True
+        response = client.delete(f"/users/{user_id}", auth=auth)
+        assert response.status_code == 401
+        response = client.post("/login", json={"username": "deactivated_probe", "password": "Password123"})
+        assert response.status_code == 401
@@ -0,0 +1,79 @@
+import hashlib
+import hmac
+import secrets
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Set
+
+
+class CredentialCache:
+    """Short-lived LRU of HTTP Basic verification results.
+
+    Entries are keyed by an HMAC of the (username, password) pair under a
+    per-process random key, so the cache never holds a password or anything
+    that can be checked against one offline. Each entry remembers the stored
+    password hash it was verified against and only counts as a hit while the
+    user's hash is unchanged, which invalidates it on a password change
+    without any bookkeeping. ``invalidate_user`` drops a user's entries
+    explicitly, e.g. when the account is deactivated.
+    """
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._key = secrets.token_bytes(32)
+        self._lock = Lock()
+        # digest -> (username, password hash, verified, expires_at)
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._by_user: Dict[str, Set[bytes]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def approx_bytes(self) -> int:
+        # Usernames and password hashes are shared with the user records
+        per_entry = sys.getsizeof(b"\0" * 32) + sys.getsizeof((None,) * 4) + sys.getsizeof(0.0) + 56
+        return sys.getsizeof(self._entries) + sys.getsizeof(self._by_user) + len(self) * per_entry
+
+    def _digest(self, username: str, password: str) -> bytes:
+        message = username.encode() + b"\0" + password.encode()
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def get(self, username: str, password: str, password_hash: str) -> Optional[bool]:
+        digest = self._digest(username, password)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            _, cached_hash, verified, expires_at = entry
+            if cached_hash != password_hash or expires_at <= time.monotonic():
+                self._drop(digest)
+                return None
+            self._entries.move_to_end(digest)
+            return verified
+
+    def put(self, username: str, password: str, password_hash: str, verified: bool) -> None:
+        digest = self._digest(username, password)
+        with self._lock:
+            self._entries[digest] = (username, password_hash, verified, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(digest)
+            self._by_user.setdefault(username, set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, username: str) -> None:
+        with self._lock:
+            for digest in list(self._by_user.get(username, ())):
+                self._drop(digest)
+
+    def _drop(self, digest: bytes) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        digests = self._by_user.get(entry[0])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[entry[0]]
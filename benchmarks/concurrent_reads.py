@@ -0,0 +1,97 @@
+"""Page and search an in-memory store while a writer keeps inserting users.
+
+Reader threads walk the username index page by page with cursors and run
+substring searches, without taking the store's lock, while one writer
+creates users with random usernames, so most inserts land in the middle
+of the index. Every page is checked to be strictly ascending and every
+search hit to match, and reads per second are reported for each number of
+readers. Run from the repository root:
+
+    python benchmarks/concurrent_reads.py --users 100000 --readers 1 2 4
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import InMemoryUserStorage, search_matches  # noqa: E402
+
+PASSWORD = "pbkdf2_sha256$120000$salt$digest"
+
+
+def create_users(store, rng, count, prefix):
+    for i in range(count):
+        username = f"{rng.getrandbits(40):010x}_{prefix}{i}"
+        store.create(username, f"{username}@example.com", PASSWORD, 18 + i % 80)
+
+
+def reader(store, stop, page_size, counts, errors):
+    rng = random.Random(threading.get_ident())
+    reads = 0
+    while not stop.is_set():
+        after = None
+        while not stop.is_set():
+            page = store.page("username", False, page_size, after=after)
+            keys = [key for key, _ in page]
+            if any(a >= b for a, b in zip(keys, keys[1:])) or (after is not None and keys and keys[0] <= after):
+                errors.append(f"page after {after!r} out of order")
+            reads += 1
+            if len(page) < page_size:
+                break
+            after = keys[-1]
+        pattern = f"{rng.getrandbits(12):03x}"
+        for user in store.search(pattern, "username", False, 0, page_size):
+            if not search_matches(user, pattern, "username", False):
+                errors.append(f"search {pattern!r} returned {user.username!r}")
+        reads += 1
+    counts.append(reads)
+
+
+def run(users, readers, seconds, page_size):
+    store = InMemoryUserStorage()
+    rng = random.Random(0)
+    create_users(store, rng, users, "base")
+    stop = threading.Event()
+    counts, errors, written = [], [], [0]
+
+    def writer():
+        while not stop.is_set():
+            create_users(store, rng, 100, f"w{written[0]}_")
+            written[0] += 100
+
+    threads = [threading.Thread(target=reader, args=(store, stop, page_size, counts, errors)) for _ in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds, written[0] / seconds, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--page", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'readers':>8}{'reads/s':>10}{'writes/s':>10}{'errors':>8}")
+    failed = False
+    for readers in args.readers:
+        reads, writes, errors = run(args.users, readers, args.seconds, args.page)
+        print(f"{readers:>8}{reads:>10.0f}{writes:>10.0f}{len(errors):>8}")
+        for error in errors[:5]:
+            print(f"  {error}")
+        failed = failed or bool(errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
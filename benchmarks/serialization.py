@@ -0,0 +1,65 @@
+"""Compare encoding a page of users through UserResponse with the byte encoder.
+
+The model path builds a ``UserResponse`` per row and renders it the way
+``response_model`` plus ``JSONResponse`` do; the encoder path is what the
+handlers use now, cold (every row encoded) and warm (every row a hit in
+``EncodedUserCache``). Run from the repository root:
+
+    python benchmarks/serialization.py --page 100
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import serialization  # noqa: E402
+from main import UserResponse  # noqa: E402
+from serialization import EncodedUserCache, json_array  # noqa: E402
+from user_records import UserRecord  # noqa: E402
+
+
+def make_users(count):
+    return [
+        UserRecord(
+            i,
+            f"user_{i:07d}",
+            f"user_{i:07d}@example.com",
+            "pbkdf2_sha256$120000$salt$digest",
+            18 + i % 80,
+            f"+1555{i:07d}" if i % 2 else None,
+            1_700_000_000.0 + i,
+            1_700_000_500.0 + i if i % 3 else None,
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    users = make_users(args.page)
+    warm = EncodedUserCache(max_entries=args.page)
+    warm.encode_many(users)
+    cases = {
+        "UserResponse": lambda: JSONResponse(jsonable_encoder([UserResponse(**u.as_dict()) for u in users])).body,
+        "encoder cold": lambda: json_array(EncodedUserCache(max_entries=0).encode_many(users)),
+        "encoder warm": lambda: json_array(warm.encode_many(users)),
+    }
+    assert len({case() for case in cases.values()}) == 1, "paths disagree"
+
+    print(f"JSON encoder: {'orjson' if serialization.orjson is not None else 'json'}")
+    print(f"{'path':<16}{'ms/page':>10}{'pages/s':>10}")
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.repeat, repeat=3)) / args.repeat
+        print(f"{name:<16}{seconds * 1000:>10.3f}{1 / seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
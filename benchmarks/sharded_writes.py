@@ -0,0 +1,83 @@
+"""Measure insert throughput of the sharded store against its shard count.
+
+Each run creates ``--users`` users from ``--threads`` threads into a fresh
+``ShardedUserStorage`` (one shard is the plain ``InMemoryUserStorage``)
+and reports users created per second. With ``--journal`` every shard logs
+to its own directory under a temporary one, so writers also wait for their
+shard's group commit; ``--fsync always`` makes that wait an fsync. Run from
+the repository root:
+
+    python benchmarks/sharded_writes.py --shards 1 2 4 8 --threads 1 4 8
+    python benchmarks/sharded_writes.py --journal --fsync always
+
+In-memory inserts are CPU work under the GIL, so only a free-threaded
+interpreter turns more shards into more throughput; journaled inserts
+spend their time waiting on the disk, which shards do side by side.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import UserJournal  # noqa: E402
+from sharded_storage import ShardedUserStorage, shard_directories  # noqa: E402
+from storage import InMemoryUserStorage  # noqa: E402
+
+PASSWORD = "pbkdf2_sha256$120000$salt$digest"
+
+
+def make_store(shards, journal_dir, fsync):
+    journals = None
+    if journal_dir is not None:
+        journals = [UserJournal(d, fsync=fsync) for d in shard_directories(journal_dir, shards)]
+    if shards == 1:
+        return InMemoryUserStorage(journal=journals[0] if journals else None)
+    return ShardedUserStorage(shards, journals=journals)
+
+
+def run(shards, threads, users, journal, fsync):
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(shards, directory if journal else None, fsync)
+        per_thread = users // threads
+
+        def writer(t):
+            for i in range(per_thread):
+                username = f"user_{t}_{i}"
+                store.create(username, f"{username}@example.com", PASSWORD, 18 + i % 80)
+
+        workers = [threading.Thread(target=writer, args=(t,)) for t in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        assert store.counts()[0] == per_thread * threads
+        store.close()
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--journal", action="store_true", help="log every shard to a temporary directory")
+    parser.add_argument("--fsync", default="interval", help="journal fsync policy (always, interval or never)")
+    args = parser.parse_args()
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    mode = f"journal, fsync {args.fsync}" if args.journal else "memory only"
+    print(f"{args.users} users, {mode}, GIL {'enabled' if gil else 'disabled'}; users/s by writer threads")
+    print(f"{'shards':>8}" + "".join(f"{f'{t} threads':>12}" for t in args.threads))
+    for shards in args.shards:
+        rates = [run(shards, threads, args.users, args.journal, args.fsync) for threads in args.threads]
+        print(f"{shards:>8}" + "".join(f"{rate:>12.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
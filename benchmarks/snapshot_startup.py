@@ -0,0 +1,78 @@
+"""Compare recovery from a JSON snapshot against a mapped snapshot.
+
+Writes the same synthetic users in both snapshot formats, then reports how
+long ``InMemoryUserStorage`` takes to come up from each and the memory it
+allocates while doing so. Run from the repository root:
+
+    python benchmarks/snapshot_startup.py --users 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import UserJournal  # noqa: E402
+from mapped_snapshot import write_snapshot  # noqa: E402
+from storage import InMemoryUserStorage  # noqa: E402
+
+
+def _rows(count):
+    for i in range(count):
+        yield (
+            i + 1,
+            f"user_{i:07d}",
+            f"user_{i:07d}@example.com",
+            f"pbkdf2_sha256$120000${i:024d}${i:044d}",
+            18 + i % 80,
+            f"+1555{i:07d}" if i % 2 else None,
+            1_700_000_000.0 + i,
+            None,
+            True,
+        )
+
+
+def write_json(directory, count):
+    with open(os.path.join(directory, "snapshot.0000000001"), "w") as f:
+        f.write(json.dumps({"version": 1, "segment": 1}) + "\n")
+        for row in _rows(count):
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+
+def write_mapped(directory, count):
+    write_snapshot(os.path.join(directory, "snapshot.0000000001"), 1, _rows(count))
+
+
+def measure(directory):
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = InMemoryUserStorage(journal=UserJournal(directory))
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    store.close()
+    return current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    results = {}
+    for name, writer in (("json", write_json), ("mapped", write_mapped)):
+        with tempfile.TemporaryDirectory() as directory:
+            writer(directory, args.users)
+            results[name] = measure(directory)
+
+    print(f"{'format':<10}{'startup s':>12}{'heap MiB':>12}")
+    for name, (total, elapsed) in results.items():
+        print(f"{name:<10}{elapsed:>12.3f}{total / 2**20:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
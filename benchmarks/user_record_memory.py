@@ -0,0 +1,90 @@
+"""Compare the memory held by dict user records against ``UserRecord``.
+
+Builds the same synthetic users both ways, keyed by username as in
+``users_db``, and reports the traced allocation per user. Run from the
+repository root:
+
+    python benchmarks/user_record_memory.py --users 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_records import UserRecord  # noqa: E402
+
+
+def _fields(i):
+    return {
+        "username": f"User_{i:07d}",
+        "email": f"user_{i:07d}@example.com",
+        "password": f"pbkdf2_sha256$120000${i:024d}${i:044d}",
+        "age": 18 + i % 80,
+        "phone": f"+1555{i:07d}" if i % 2 else None,
+    }
+
+
+def build_dicts(count):
+    store = {}
+    for i in range(count):
+        f = _fields(i)
+        # Mirrors the original create_user: the key and the stored username
+        # are two separate lower() results
+        store[f["username"].lower()] = {
+            "id": i + 1,
+            "username": f["username"].lower(),
+            "email": f["email"],
+            "password": f["password"],
+            "age": f["age"],
+            "phone": f["phone"],
+            "created_at": datetime.now(),
+            "is_active": True,
+            "last_login": None,
+        }
+    return store
+
+
+def build_records(count):
+    store = {}
+    for i in range(count):
+        f = _fields(i)
+        record = UserRecord(
+            i + 1, f["username"].lower(), f["email"], f["password"], f["age"], f["phone"]
+        )
+        store[record.username] = record
+    return store
+
+
+def measure(builder, count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = builder(count)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    results = {}
+    for name, builder in (("dict", build_dicts), ("UserRecord", build_records)):
+        results[name] = measure(builder, args.users)
+
+    print(f"{'layout':<12}{'total MiB':>12}{'bytes/user':>12}{'build s':>10}")
+    for name, (total, elapsed) in results.items():
+        print(f"{name:<12}{total / 2**20:>12.1f}{total / args.users:>12.0f}{elapsed:>10.2f}")
+    saved = 1 - results["UserRecord"][0] / results["dict"][0]
+    print(f"UserRecord saves {saved:.0%} per user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, List
+
+
+class InvalidLine:
+    """Stands in for an NDJSON line that could not be parsed."""
+
+    __slots__ = ("detail",)
+
+    def __init__(self, detail: str):
+        self.detail = detail
+
+
+def _parse(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return InvalidLine("Invalid JSON")
+
+
+async def iter_ndjson(chunks: AsyncIterable[bytes], max_line_bytes: int = 65536) -> AsyncIterator[Any]:
+    """Parse a streamed NDJSON body one line at a time.
+
+    Only the current line is buffered, so a body of any size is read in
+    constant memory. Blank lines are skipped; a line that is not JSON, or
+    that grows past ``max_line_bytes``, yields an ``InvalidLine`` in its
+    place so the caller can report it and carry on with the next one.
+    """
+    buffer = bytearray()
+    skipping = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if not skipping:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        buffer.clear()
+                        skipping = True
+                        yield InvalidLine("Line too long")
+                break
+            if skipping:
+                skipping = False
+            else:
+                buffer += chunk[start:end]
+                if len(buffer) > max_line_bytes:
+                    yield InvalidLine("Line too long")
+                elif buffer.strip():
+                    yield _parse(bytes(buffer))
+                buffer.clear()
+            start = end + 1
+    if buffer.strip() and not skipping:
+        yield _parse(bytes(buffer))
+
+
+async def iter_items(items: Iterable[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
+async def chunked(items: AsyncIterable[Any], size: int) -> AsyncIterator[List[Any]]:
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,169 @@
+import sys
+import time
+import tracemalloc
+from itertools import islice
+from threading import Lock, Timer
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    resource = None
+
+
+# type -> names of the __slots__ it and its bases declare
+_slot_names: Dict[type, Tuple[str, ...]] = {}
+
+
+def _slots(cls: type) -> Tuple[str, ...]:
+    names = _slot_names.get(cls)
+    if names is None:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            names.extend([slots] if isinstance(slots, str) else slots)
+        names = _slot_names[cls] = tuple(name for name in names if name not in ("__dict__", "__weakref__"))
+    return names
+
+
+def _shared(obj: Any) -> bool:
+    # None, bools and small ints are interpreter-wide singletons
+    return obj is None or isinstance(obj, bool) or (type(obj) is int and -5 <= obj <= 256)
+
+
+def deep_sizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """``sys.getsizeof`` of ``obj`` plus the containers, scalars and slot
+    values it holds.
+
+    Objects already in ``seen`` (ids) are not counted again, so a string
+    shared by a dict key and a record's field is measured once when both go
+    through the same ``seen``; interpreter-wide singletons are not counted.
+    """
+    if seen is None:
+        seen = set()
+    if _shared(obj) or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    else:
+        for name in _slots(type(obj)):
+            value = getattr(obj, name, None)
+            if value is not None:
+                size += deep_sizeof(value, seen)
+    return size
+
+
+def estimate_bytes(container, sample_size: Optional[int] = 256, shared_values: bool = False) -> int:
+    """Approximate memory held by a dict or list.
+
+    The container's own table is measured exactly; the cost of its entries is
+    extrapolated from the first ``sample_size`` of them (all of them when
+    ``sample_size`` is ``None``). With ``shared_values`` the dict values are
+    treated as references to objects accounted for elsewhere, which is the
+    case for secondary indexes that point at the records in ``users_db``.
+    """
+    size = sys.getsizeof(container)
+    count = len(container)
+    if not count:
+        return size
+    if isinstance(container, dict):
+        entries = islice(container.items(), sample_size)
+        sizes = []
+        for k, v in entries:
+            seen: Set[int] = set()
+            sizes.append(deep_sizeof(k, seen) + (0 if shared_values else deep_sizeof(v, seen)))
+    else:
+        sizes = [deep_sizeof(item) for item in islice(container, sample_size)]
+    return size + int(sum(sizes) / len(sizes) * count)
+
+
+def max_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class AllocationTracer:
+    """Top allocation sites by size, traced for a bounded window at a time.
+
+    tracemalloc slows every allocation down, so it is only started on
+    request and stopped again ``window`` seconds later. Only allocations
+    made after tracing starts are attributed: the first call starts a window
+    and later calls within it report what has accumulated since. Snapshots
+    walk every traced block, so one is taken at most every
+    ``refresh_interval`` seconds and its statistics reused in between.
+    """
+
+    def __init__(self, window: float, refresh_interval: float):
+        self.window = window
+        self.refresh_interval = refresh_interval
+        self._lock = Lock()
+        self._deadline: Optional[float] = None
+        self._stats: List[tracemalloc.Statistic] = []
+        self._taken_at = 0.0
+
+    def report(self, limit: int) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            if self._deadline is None:
+                tracemalloc.start()
+                self._deadline = now + self.window
+                timer = Timer(self.window, self.stop)
+                timer.daemon = True
+                timer.start()
+                return {"tracing": True, "started": True, "stops_in": self.window, "top": []}
+            if not self._stats or now - self._taken_at >= self.refresh_interval:
+                self._stats = tracemalloc.take_snapshot().statistics("lineno")
+                self._taken_at = now
+            stats = self._stats[:limit]
+            traced, peak = tracemalloc.get_traced_memory()
+            stops_in = max(self._deadline - now, 0.0)
+        top: List[Dict[str, Any]] = [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in stats
+        ]
+        return {
+            "tracing": True,
+            "started": False,
+            "stops_in": round(stops_in, 1),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "top": top,
+        }
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._deadline is not None:
+                tracemalloc.stop()
+                self._deadline = None
+                self._stats = []
+
+
+class CachedReport:
+    """Rebuild an expensive report at most once per ``refresh_interval`` seconds."""
+
+    def __init__(self, build: Callable[[], Dict[str, Any]], refresh_interval: float):
+        self._build = build
+        self.refresh_interval = refresh_interval
+        self._lock = Lock()
+        self._report: Optional[Dict[str, Any]] = None
+        self._built_at = 0.0
+
+    def get(self) -> Dict[str, Any]:
+        if self._report is None or time.monotonic() - self._built_at >= self.refresh_interval:
+            with self._lock:
+                # Another request may have refreshed it while we waited
+                if self._report is None or time.monotonic() - self._built_at >= self.refresh_interval:
+                    self._report = self._build()
+                    self._built_at = time.monotonic()
+        return self._report
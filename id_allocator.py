@@ -0,0 +1,66 @@
+import os
+from threading import Lock
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+
+class IdAllocator:
+    """Monotonic id sequence handed out from leased blocks.
+
+    Ids are served from an in-process block, so ``next_id`` is O(1) and only
+    touches the state file once per ``block_size`` ids. When ``path`` is set,
+    the file holds the next unleased id and every lease bumps it under an
+    exclusive ``flock``: worker processes sharing the file get disjoint blocks
+    and a restarted process resumes after the last block it could have used.
+    Without a path the sequence lives in memory and restarts from ``start``.
+    """
+
+    def __init__(self, path: Optional[str] = None, block_size: int = 1000, start: int = 1):
+        if block_size < 1:
+            raise ValueError("block_size must be positive")
+        if path and fcntl is None:
+            raise RuntimeError("Durable id sequences require fcntl (POSIX)")
+        self.path = path
+        self.block_size = block_size
+        self._lock = Lock()
+        self._high_water = start
+        self._next = start
+        self._end = start
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._lease(self.block_size)
+            user_id = self._next
+            self._next += 1
+            return user_id
+
+    def observe(self, user_id: int) -> None:
+        """Make sure ids at or below ``user_id`` are never handed out again."""
+        with self._lock:
+            if user_id >= self._next:
+                self._next = user_id + 1
+
+    def _lease(self, size: int):
+        if not self.path:
+            start = max(self._high_water, self._next)
+            self._high_water = start + size
+            return start, start + size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.pread(fd, 32, 0).strip()
+            start = max(int(raw) if raw else 1, self._high_water, self._next)
+            end = start + size
+            encoded = str(end).encode()
+            os.pwrite(fd, encoded, 0)
+            os.ftruncate(fd, len(encoded))
+            os.fsync(fd)
+            self._high_water = end
+            return start, end
+        finally:
+            os.close(fd)
@@ -0,0 +1,516 @@
+import base64
+import heapq
+import json
+import sys
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def normalize_phone(phone: str) -> str:
+    return phone.strip().lstrip("+")
+
+
+# Items per chunk of a PersistentSortedSet
+CHUNK_SIZE = 1024
+
+
+class PersistentSortedSet:
+    """Immutable sorted set with positional access; ``add`` and ``remove``
+    return a new version.
+
+    Items sit in tuple chunks of up to ``2 * CHUNK_SIZE``, with the last item
+    and the running item count of each chunk alongside, followed by a tail
+    list holding the largest items. A change copies only the chunk it
+    touches and those per-chunk tables, sharing every other chunk with the
+    version before. Appends, which is how ids and creation times arrive, go
+    onto the tail in place: each version reads the tail only up to its own
+    length, so older versions never see the new items, and a full tail
+    becomes a chunk. Holders of a version can read it for as long as they
+    like while writers publish newer ones by replacing a single reference.
+    """
+
+    __slots__ = ("_chunks", "_maxes", "_ends", "_tail", "_tail_len")
+
+    def __init__(
+        self,
+        chunks: Tuple[tuple, ...] = (),
+        maxes: tuple = (),
+        ends: Tuple[int, ...] = (),
+        tail: Optional[list] = None,
+        tail_len: int = 0,
+    ):
+        self._chunks = chunks
+        self._maxes = maxes
+        self._ends = ends
+        self._tail = [] if tail is None else tail
+        self._tail_len = tail_len
+
+    def _chunked(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def _start(self, chunk: int) -> int:
+        return self._ends[chunk - 1] if chunk else 0
+
+    def __len__(self):
+        return self._chunked() + self._tail_len
+
+    def __bool__(self):
+        return bool(self._ends or self._tail_len)
+
+    def approx_bytes(self) -> int:
+        return (
+            sys.getsizeof(self)
+            + sum(map(sys.getsizeof, self._chunks))
+            + sys.getsizeof(self._chunks)
+            + sys.getsizeof(self._maxes)
+            + sys.getsizeof(self._ends)
+            + sys.getsizeof(self._tail)
+        )
+
+    def __getitem__(self, position: int):
+        size = len(self)
+        if position < 0:
+            position += size
+        if not 0 <= position < size:
+            raise IndexError("PersistentSortedSet index out of range")
+        chunked = self._chunked()
+        if position >= chunked:
+            return self._tail[position - chunked]
+        chunk = bisect_right(self._ends, position)
+        return self._chunks[chunk][position - self._start(chunk)]
+
+    def __contains__(self, item) -> bool:
+        chunk = bisect_left(self._maxes, item)
+        if chunk < len(self._chunks):
+            items, hi = self._chunks[chunk], None
+        else:
+            items, hi = self._tail, self._tail_len
+        i = bisect_left(items, item, 0, len(items) if hi is None else hi)
+        return i < (len(items) if hi is None else hi) and items[i] == item
+
+    def bisect_left(self, item) -> int:
+        chunk = bisect_left(self._maxes, item)
+        if chunk < len(self._chunks):
+            return self._start(chunk) + bisect_left(self._chunks[chunk], item)
+        return self._chunked() + bisect_left(self._tail, item, 0, self._tail_len)
+
+    def bisect_right(self, item) -> int:
+        chunk = bisect_right(self._maxes, item)
+        if chunk < len(self._chunks):
+            return self._start(chunk) + bisect_right(self._chunks[chunk], item)
+        return self._chunked() + bisect_right(self._tail, item, 0, self._tail_len)
+
+    def iter_from(self, position: int) -> Iterator:
+        """Items in ascending order from ``position`` on."""
+        position, chunked = max(position, 0), self._chunked()
+        if position < chunked:
+            chunk = bisect_right(self._ends, position)
+            yield from self._chunks[chunk][position - self._start(chunk) :]
+            for items in islice(self._chunks, chunk + 1, None):
+                yield from items
+            position = chunked
+        yield from islice(self._tail, position - chunked, self._tail_len)
+
+    def iter_before(self, end: int) -> Iterator:
+        """Items in descending order, starting just before ``end``."""
+        end, chunked = min(end, len(self)), self._chunked()
+        tail = self._tail
+        for i in range(end - chunked - 1, -1, -1):
+            yield tail[i]
+        end = min(end, chunked)
+        if end <= 0:
+            return
+        chunk = bisect_right(self._ends, end - 1)
+        yield from reversed(self._chunks[chunk][: end - self._start(chunk)])
+        for items in reversed(self._chunks[:chunk]):
+            yield from reversed(items)
+
+    def slice(self, start: int, stop: int) -> list:
+        return list(islice(self.iter_from(start), max(stop - max(start, 0), 0)))
+
+    def _with_tail(self, tail: list) -> "PersistentSortedSet":
+        if len(tail) < CHUNK_SIZE:
+            return PersistentSortedSet(self._chunks, self._maxes, self._ends, tail, len(tail))
+        return PersistentSortedSet(
+            self._chunks + (tuple(tail),),
+            self._maxes + (tail[-1],),
+            self._ends + (self._chunked() + len(tail),),
+        )
+
+    def _with_chunk(self, chunk: int, items: tuple) -> "PersistentSortedSet":
+        chunks, maxes, ends = self._chunks, self._maxes, self._ends
+        start, delta = self._start(chunk), len(items) - len(chunks[chunk])
+        if not items:
+            pieces, piece_ends = (), ()
+        elif len(items) > 2 * CHUNK_SIZE:
+            pieces = (items[:CHUNK_SIZE], items[CHUNK_SIZE:])
+            piece_ends = (start + CHUNK_SIZE, start + len(items))
+        else:
+            pieces, piece_ends = (items,), (start + len(items),)
+        return PersistentSortedSet(
+            chunks[:chunk] + pieces + chunks[chunk + 1 :],
+            maxes[:chunk] + tuple(piece[-1] for piece in pieces) + maxes[chunk + 1 :],
+            ends[:chunk] + piece_ends + tuple(map(delta.__add__, ends[chunk + 1 :])),
+            self._tail,
+            self._tail_len,
+        )
+
+    def add(self, item) -> "PersistentSortedSet":
+        """A version with ``item``, or this one if it is already present."""
+        tail, tail_len = self._tail, self._tail_len
+        if tail_len and len(tail) == tail_len and tail[-1] < item and tail_len + 1 < CHUNK_SIZE:
+            # Nothing newer shares this tail, so append in place
+            tail.append(item)
+            return PersistentSortedSet(self._chunks, self._maxes, self._ends, tail, tail_len + 1)
+        if self._maxes and item <= self._maxes[-1]:
+            chunk = bisect_left(self._maxes, item)
+            items = self._chunks[chunk]
+            i = bisect_left(items, item)
+            if items[i] == item:
+                return self
+            return self._with_chunk(chunk, items[:i] + (item,) + items[i:])
+        i = bisect_left(tail, item, 0, tail_len)
+        if i < tail_len and tail[i] == item:
+            return self
+        return self._with_tail(tail[:i] + [item] + tail[i:tail_len])
+
+    def replace(self, position: int, item) -> "PersistentSortedSet":
+        """A version with the item at ``position`` swapped for ``item``, which
+        must sort in the same place."""
+        chunked = self._chunked()
+        if position >= chunked:
+            # Copied rather than written in place, which older versions would see
+            tail = self._tail[: self._tail_len]
+            tail[position - chunked] = item
+            return PersistentSortedSet(self._chunks, self._maxes, self._ends, tail, self._tail_len)
+        chunk = bisect_right(self._ends, position)
+        items, i = self._chunks[chunk], position - self._start(chunk)
+        # Lengths are unchanged, so the running counts can be shared
+        chunks, maxes = self._chunks, self._maxes
+        replaced = items[:i] + (item,) + items[i + 1 :]
+        if i == len(items) - 1:
+            maxes = maxes[:chunk] + (item,) + maxes[chunk + 1 :]
+        return PersistentSortedSet(
+            chunks[:chunk] + (replaced,) + chunks[chunk + 1 :], maxes, self._ends, self._tail, self._tail_len
+        )
+
+    def remove(self, item) -> "PersistentSortedSet":
+        """A version without ``item``, or this one if it is absent."""
+        chunk = bisect_left(self._maxes, item)
+        if chunk < len(self._chunks):
+            items = self._chunks[chunk]
+            i = bisect_left(items, item)
+            if items[i] != item:
+                return self
+            return self._with_chunk(chunk, items[:i] + items[i + 1 :])
+        tail, tail_len = self._tail, self._tail_len
+        i = bisect_left(tail, item, 0, tail_len)
+        if i == tail_len or tail[i] != item:
+            return self
+        return self._with_tail(tail[:i] + tail[i + 1 : tail_len])
+
+
+class SortedIndex:
+    """Keys of the form ``(value, user_id)`` kept in sorted order.
+
+    Keys live in a ``PersistentSortedSet``: writers publish a new version
+    and readers take the current one once, then locate a page with a binary
+    search and slice it out, so a page costs O(log n + limit) rather than a
+    full sort and never sees a write half made. The trailing user id makes
+    every key unique, which is what lets a cursor point at an exact position
+    that later inserts cannot shift.
+
+    An optional ``base`` is a read-only sorted sequence of further keys, such
+    as a mapped snapshot; inserts go to the in-memory list and reads merge
+    the two, still locating ``offset`` by binary search.
+    """
+
+    def __init__(self, base: Sequence[Tuple[Any, int]] = ()):
+        self._base = base
+        self._keys = PersistentSortedSet()
+
+    def __len__(self):
+        return len(self._base) + len(self._keys)
+
+    def approx_bytes(self) -> int:
+        # Key tuples only reference values owned by the user records
+        keys = self._keys
+        return keys.approx_bytes() + len(keys) * sys.getsizeof((None, 0))
+
+    # Writers are serialized by the store's lock
+    def add(self, value, user_id: int) -> None:
+        self._keys = self._keys.add((value, user_id))
+
+    def remove(self, value, user_id: int) -> None:
+        self._keys = self._keys.remove((value, user_id))
+
+    def page(
+        self,
+        limit: int,
+        offset: int = 0,
+        after: Optional[Tuple[Any, int]] = None,
+        descending: bool = False,
+    ) -> List[Tuple[Any, int]]:
+        """Return up to ``limit`` keys, skipping ``offset`` keys past ``after``."""
+        keys = self._keys
+        limit = max(limit, 0)
+        if self._base:
+            return self._merged_page(keys, limit, offset, after, descending)
+        if not descending:
+            start = keys.bisect_right(after) if after is not None else 0
+            start += offset
+            return keys.slice(start, start + limit)
+        end = keys.bisect_left(after) if after is not None else len(keys)
+        end -= offset
+        if end <= 0:
+            return []
+        return list(islice(keys.iter_before(end), limit))
+
+    def _starts(self, keys: PersistentSortedSet, after, descending: bool) -> Tuple[int, int]:
+        """Where page order past ``after`` starts in the base and in ``keys``."""
+        base = self._base
+        if after is None:
+            return (len(base), len(keys)) if descending else (0, 0)
+        if descending:
+            return bisect_left(base, after), keys.bisect_left(after)
+        return bisect_right(base, after), keys.bisect_right(after)
+
+    def _runs(self, keys: PersistentSortedSet, a: int, b: int, descending: bool):
+        """``(key_at, count)`` of the base and of ``keys`` in page order from ``a`` and ``b``."""
+        base = self._base
+        if descending:
+            return (lambda n: base[a - 1 - n]), a, (lambda n: keys[b - 1 - n]), b
+        return (lambda n: base[a + n]), len(base) - a, (lambda n: keys[b + n]), len(keys) - b
+
+    def _merged_page(self, keys, limit, offset, after, descending) -> List[Tuple[Any, int]]:
+        base = self._base
+        a, b = self._starts(keys, after, descending)
+        i, j = _split(*self._runs(keys, a, b, descending), offset, descending=descending)
+        if not descending:
+            merged = heapq.merge(_ascending(base, a + i), keys.iter_from(b + j))
+        else:
+            merged = heapq.merge(_descending(base, a - i), keys.iter_before(b - j), reverse=True)
+        return list(islice(merged, limit))
+
+    def ranked(
+        self, after: Optional[Tuple[Any, int]] = None, descending: bool = False
+    ) -> Tuple[Callable[[int], Tuple[Any, int]], int]:
+        """``(key_at, count)`` for the keys a page past ``after`` walks.
+
+        ``key_at(n)`` is the n-th of those keys in page order, found by
+        binary search, and ``count`` is how many there are.
+        """
+        keys = self._keys
+        a, b = self._starts(keys, after, descending)
+        at_a, a_len, at_b, b_len = self._runs(keys, a, b, descending)
+        if not a_len:
+            return at_b, b_len
+        if not b_len:
+            return at_a, a_len
+
+        def key_at(n: int) -> Tuple[Any, int]:
+            i, j = _split(at_a, a_len, at_b, b_len, n + 1, descending=descending)
+            # The n-th key is the later of the last keys taken from each run
+            if not i:
+                return at_b(j - 1)
+            if not j:
+                return at_a(i - 1)
+            return (min if descending else max)(at_a(i - 1), at_b(j - 1))
+
+        return key_at, a_len + b_len
+
+    def iter_from(self, after: Optional[Tuple[Any, int]] = None) -> Iterator[Tuple[Any, int]]:
+        """Yield keys in ascending order, starting just past ``after``."""
+        keys = self._keys
+        pos = keys.bisect_right(after) if after is not None else 0
+        if self._base:
+            start = bisect_right(self._base, after) if after is not None else 0
+            yield from heapq.merge(_ascending(self._base, start), keys.iter_from(pos))
+            return
+        yield from keys.iter_from(pos)
+
+
+def _ascending(keys: Sequence, pos: int) -> Iterator:
+    while pos < len(keys):
+        yield keys[pos]
+        pos += 1
+
+
+def _descending(keys: Sequence, end: int) -> Iterator:
+    while end > 0:
+        end -= 1
+        yield keys[end]
+
+
+def _split(
+    a: Callable[[int], Any], a_len: int, b: Callable[[int], Any], b_len: int, k: int, descending: bool = False
+) -> Tuple[int, int]:
+    """Split the first ``k`` keys of merging two sorted runs into ``(from a, from b)``.
+
+    ``a(n)`` and ``b(n)`` return the n-th key of each run in merge order;
+    the split is found by binary search, so skipping an offset is O(log n).
+    """
+    k = min(max(k, 0), a_len + b_len)
+    lo, hi = max(0, k - b_len), min(k, a_len)
+    while lo < hi:
+        i = (lo + hi) // 2
+        # Does a's next key come before the last key taken from b?
+        if (a(i) > b(k - i - 1)) if descending else (a(i) < b(k - i - 1)):
+            lo = i + 1
+        else:
+            hi = i
+    return lo, k - lo
+
+
+def split_offset(runs: List[Tuple[Callable[[int], Any], int]], k: int, descending: bool = False) -> List[int]:
+    """How many of the first ``k`` keys of merging ``runs`` come from each.
+
+    ``runs`` are ``(key_at, count)`` pairs such as ``SortedIndex.ranked``
+    returns. Each round probes every run ``step = k // len(runs)`` keys ahead
+    and takes those keys from the run whose probe comes first: at most
+    ``len(runs) * step <= k`` keys can precede that probe, so they all belong
+    to the first ``k``. That takes O(len(runs) * log k) rounds of binary
+    searches instead of walking ``k`` keys.
+    """
+    taken = [0] * len(runs)
+    k = min(max(k, 0), sum(count for _, count in runs))
+    while k > 0:
+        step = max(k // len(runs), 1)
+        best, best_key, best_n = -1, None, 0
+        for r, (key_at, count) in enumerate(runs):
+            n = min(step, count - taken[r])
+            if n <= 0:
+                continue
+            probe = key_at(taken[r] + n - 1)
+            if best < 0 or (probe > best_key if descending else probe < best_key):
+                best, best_key, best_n = r, probe, n
+        taken[best] += best_n
+        k -= best_n
+    return taken
+
+
+def trigrams(text: str):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from lowercase 3-character substrings to user ids.
+
+    Any string containing the query also contains every trigram of the query,
+    so intersecting their posting lists yields a superset of the matches and
+    callers only re-check those rows. Posting lists are sorted by id (ids are
+    allocated in increasing order, so adds are almost always appends), which
+    lets a search resume after a cursor id with a binary search. Each is a
+    ``PersistentSortedSet``, so a search reads whole versions of them while
+    writers carry on. Queries
+    shorter than three characters have no trigrams; ``candidates`` returns
+    ``None`` for them and the caller falls back to an id-ordered scan.
+
+    An optional read-only ``base`` maps trigrams to further sorted postings
+    (e.g. from a mapped snapshot). Both layers are intersected separately
+    and merged: a text indexed in full in either layer is found, and stale
+    base entries are weeded out by the caller's re-check.
+    """
+
+    def __init__(self, base=None):
+        self._base = base
+        self._postings: Dict[str, PersistentSortedSet] = {}
+
+    def approx_bytes(self) -> int:
+        postings = self._postings
+        return sys.getsizeof(postings) + sum(
+            sys.getsizeof(gram) + posting.approx_bytes() for gram, posting in list(postings.items())
+        )
+
+    def add(self, text: str, user_id: int) -> None:
+        postings = self._postings
+        for gram in trigrams(text.lower()):
+            posting = postings.get(gram)
+            postings[gram] = (posting or PersistentSortedSet()).add(user_id)
+
+    def remove(self, text: str, user_id: int) -> None:
+        postings = self._postings
+        for gram in trigrams(text.lower()):
+            posting = postings.get(gram)
+            if posting is None:
+                continue
+            posting = posting.remove(user_id)
+            if posting:
+                postings[gram] = posting
+            else:
+                del postings[gram]
+
+    def candidates(self, query: str, after: int = 0) -> Optional[Iterator[int]]:
+        grams = trigrams(query.lower())
+        if not grams:
+            return None
+        empty = PersistentSortedSet()
+        postings = sorted((self._postings.get(gram, empty) for gram in grams), key=len)
+        overlay = self._intersect(postings, after)
+        if self._base is None:
+            return overlay
+        base_postings = sorted((self._base.get(gram, ()) for gram in grams), key=len)
+        return merge_ids(self._intersect_base(base_postings, after), overlay)
+
+    @staticmethod
+    def _intersect(postings: List[PersistentSortedSet], after: int) -> Iterator[int]:
+        shortest, rest = postings[0], postings[1:]
+        for user_id in shortest.iter_from(shortest.bisect_right(after)):
+            for posting in rest:
+                if user_id not in posting:
+                    break
+            else:
+                yield user_id
+
+    @staticmethod
+    def _intersect_base(postings: List[Sequence[int]], after: int) -> Iterator[int]:
+        shortest, rest = postings[0], postings[1:]
+        pos = bisect_right(shortest, after)
+        while pos < len(shortest):
+            user_id = shortest[pos]
+            pos += 1
+            for posting in rest:
+                i = bisect_left(posting, user_id)
+                if i == len(posting) or posting[i] != user_id:
+                    break
+            else:
+                yield user_id
+
+
+def merge_ids(*iterables: Iterator[int]) -> Iterator[int]:
+    """Merge ascending id streams, dropping duplicates."""
+    last = None
+    for user_id in heapq.merge(*iterables):
+        if user_id != last:
+            yield user_id
+            last = user_id
+
+
+def encode_cursor(sort_by: str, order: str, key: Tuple[Any, int]) -> str:
+    value, user_id = key
+    raw = json.dumps([sort_by, order, value, user_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, order: str) -> Tuple[Any, int]:
+    """Inverse of ``encode_cursor``; raises ``ValueError`` for foreign cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        c_sort_by, c_order, value, user_id = json.loads(base64.urlsafe_b64decode(padded))
+        if sort_by == "created_at":
+            # Epoch seconds; JSON may hand back a whole number as an int
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError
+            value = float(value)
+        elif not isinstance(value, int if sort_by == "id" else str):
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if (c_sort_by, c_order) != (sort_by, order) or not isinstance(user_id, int):
+        raise ValueError("Cursor does not match sort_by/order")
+    return value, user_id
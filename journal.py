@@ -0,0 +1,331 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from mapped_snapshot import MappedSnapshot, is_mapped_snapshot, write_snapshot
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+FSYNC_POLICIES = ("always", "interval", "never")
+# Line-delimited JSON snapshots written before the mapped format; still readable
+JSON_SNAPSHOT_VERSION = 1
+# First wait before retrying a failed snapshot; doubles up to snapshot_interval
+SNAPSHOT_RETRY_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def _segment_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"log.{segment:010d}")
+
+
+def _snapshot_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"snapshot.{segment:010d}")
+
+
+def _numbered(directory: str, prefix: str) -> List[int]:
+    numbers = []
+    for name in os.listdir(directory):
+        stem, _, number = name.partition(".")
+        if stem == prefix and number.isdigit():
+            numbers.append(int(number))
+    return sorted(numbers)
+
+
+def _fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_log(path: str) -> Iterable[Dict[str, Any]]:
+    """Entries of one log segment; a torn last line from a crash is ignored."""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            yield json.loads(line)
+
+
+class UserJournal:
+    """Snapshot plus append-only mutation log for the in-memory user store.
+
+    Mutations are appended as JSON lines to the current log segment. Appends
+    only buffer the line; a flusher thread writes everything buffered in one
+    ``write`` (group commit) and ``wait`` returns once a caller's entry is
+    written, so concurrent writers share each write and fsync. ``fsync``
+    picks what "written" means: ``always`` fsyncs every group before
+    releasing it, ``interval`` fsyncs at most every ``fsync_interval``
+    seconds (a crash of the process loses nothing, a power loss up to that
+    interval) and ``never`` leaves flushing to the OS.
+
+    Every ``snapshot_interval`` seconds, or sooner once ``snapshot_entries``
+    entries have been logged, a background thread asks the store for its
+    records, starting a new log segment at the same moment. The snapshot is
+    written in the ``mapped_snapshot`` format beside the logs and renamed
+    into place, and recovery maps it instead of parsing it; older snapshots and the
+    segments they cover are then deleted, so recovery reads one snapshot and
+    a bounded log tail. Records are captured without blocking writers, so a
+    snapshot may already contain changes logged after its segment started;
+    log entries hold absolute values, which makes replaying them over such a
+    snapshot converge on the logged state.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        snapshot_interval: float = 300.0,
+        snapshot_entries: int = 100_000,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        self.directory = directory
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_entries = snapshot_entries
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(directory, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(self._lock_fd)
+                raise RuntimeError(f"{directory} is in use by another process")
+        self._cond = threading.Condition()
+        self._buffer: List[Tuple[int, bytes]] = []
+        self._appended = 0
+        self._written = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        # Set by close so a sleeping snapshotter wakes up at once
+        self._stopping = threading.Event()
+        self._since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        # Start a fresh segment rather than appending after a possibly torn line
+        segments = _numbered(directory, "log")
+        snapshots = _numbered(directory, "snapshot")
+        self.segment = max(segments[-1] + 1 if segments else 1, snapshots[-1] if snapshots else 1)
+        self._file = None
+        self._file_segment = None
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+        self._flusher: Optional[threading.Thread] = None
+        self._snapshotter: Optional[threading.Thread] = None
+        self._capture: Optional[Callable[[], Tuple[int, Iterable[tuple]]]] = None
+
+    def recover(
+        self,
+        load_snapshot: Callable[[MappedSnapshot], None],
+        load_row: Callable[[list], None],
+        apply_entry: Callable[[Dict[str, Any]], None],
+    ) -> int:
+        """Hand the latest snapshot and then the log tail to the store.
+
+        A mapped snapshot goes to ``load_snapshot`` as is; rows of an older
+        JSON snapshot are fed to ``load_row``. Returns the number of log
+        entries replayed.
+        """
+        snapshots = _numbered(self.directory, "snapshot")
+        start = 0
+        if snapshots:
+            start = snapshots[-1]
+            path = _snapshot_path(self.directory, start)
+            if is_mapped_snapshot(path):
+                load_snapshot(MappedSnapshot(path))
+            else:
+                with open(path, "rb") as f:
+                    header = json.loads(f.readline())
+                    if header.get("version") != JSON_SNAPSHOT_VERSION:
+                        raise RuntimeError(f"Unsupported snapshot version {header.get('version')}")
+                    for line in f:
+                        load_row(json.loads(line))
+        replayed = 0
+        for segment in _numbered(self.directory, "log"):
+            if segment < start:
+                continue
+            for entry in read_log(_segment_path(self.directory, segment)):
+                apply_entry(entry)
+                replayed += 1
+        self._since_snapshot = replayed
+        return replayed
+
+    def start(self, capture: Callable[[], Tuple[int, Iterable[tuple]]]) -> None:
+        """Start flushing and snapshotting; ``capture`` must call ``rotate`` under the store lock."""
+        self._capture = capture
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-flush", daemon=True)
+        self._flusher.start()
+        self._snapshotter = threading.Thread(
+            target=self._snapshot_loop, name="journal-snapshot", daemon=True
+        )
+        self._snapshotter.start()
+
+    def check(self) -> None:
+        """Raise if appends would be refused.
+
+        The store calls this before changing anything, so a write the
+        journal cannot take is rejected instead of being applied in memory
+        and then failing.
+        """
+        with self._cond:
+            self._check()
+
+    def _check(self) -> None:
+        if self._closed:
+            raise RuntimeError("Journal is closed")
+        if self._error is not None:
+            raise RuntimeError("Journal write failed") from self._error
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Buffer ``entry`` and return a ticket for ``wait``; call under the store lock."""
+        line = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+        with self._cond:
+            # Once the flusher has died nothing drains the buffer
+            self._check()
+            self._buffer.append((self.segment, line))
+            self._appended += 1
+            self._since_snapshot += 1
+            self._cond.notify_all()
+            return self._appended
+
+    def wait(self, ticket: int) -> None:
+        with self._cond:
+            while self._written < ticket and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise RuntimeError("Journal write failed") from self._error
+
+    def rotate(self) -> int:
+        """Send later appends to a new segment and return its number."""
+        with self._cond:
+            self.segment += 1
+            self._since_snapshot = 0
+            return self.segment
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    timeout = None
+                    if self.fsync == "interval" and self._file is not None:
+                        timeout = self.fsync_interval
+                    if not self._cond.wait(timeout):
+                        break
+                batch, self._buffer = self._buffer, []
+                ticket = self._appended
+                closing = self._closed
+            try:
+                self._write(batch)
+                if self.fsync == "always" and batch:
+                    self._sync()
+                elif self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    self._sync()
+            except BaseException as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._written = ticket
+                self._cond.notify_all()
+            if closing and not batch:
+                self._sync()
+                return
+
+    def _write(self, batch: List[Tuple[int, bytes]]) -> None:
+        start = 0
+        while start < len(batch):
+            segment = batch[start][0]
+            end = start
+            while end < len(batch) and batch[end][0] == segment:
+                end += 1
+            if segment != self._file_segment:
+                self._open(segment)
+            self._file.write(b"".join(line for _, line in batch[start:end]))
+            start = end
+        if batch:
+            self._file.flush()
+            self._dirty = True
+
+    def _open(self, segment: int) -> None:
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        self._file = open(_segment_path(self.directory, segment), "ab")
+        self._file_segment = segment
+        _fsync_directory(self.directory)
+
+    def _sync(self) -> None:
+        if self._dirty and self.fsync != "never":
+            os.fsync(self._file.fileno())
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def _snapshot_loop(self) -> None:
+        retry_delay, retry_at = SNAPSHOT_RETRY_SECONDS, 0.0
+        while not self._stopping.wait(min(self.snapshot_interval, 1.0)):
+            with self._cond:
+                pending = self._since_snapshot
+            now = time.monotonic()
+            due = now - self._last_snapshot >= self.snapshot_interval
+            if pending and (due or pending >= self.snapshot_entries) and now >= retry_at and not self._closed:
+                try:
+                    self.snapshot()
+                except Exception:
+                    # Keep logging; the next attempt retries with a longer tail,
+                    # which the rotation that already happened must not hide
+                    with self._cond:
+                        self._since_snapshot += pending
+                    logger.exception("Snapshot of %s failed; retrying in %.0fs", self.directory, retry_delay)
+                    retry_at = time.monotonic() + retry_delay
+                    retry_delay = min(retry_delay * 2, max(self.snapshot_interval, SNAPSHOT_RETRY_SECONDS))
+                else:
+                    retry_delay = SNAPSHOT_RETRY_SECONDS
+
+    def snapshot(self) -> int:
+        """Write a snapshot now and drop the files it supersedes.
+
+        A snapshot the store still maps stays readable after it is deleted;
+        its disk space is released when the process exits.
+        """
+        segment, rows = self._capture()
+        final = _snapshot_path(self.directory, segment)
+        tmp = final + ".tmp"
+        write_snapshot(tmp, segment, rows)
+        os.replace(tmp, final)
+        _fsync_directory(self.directory)
+        self._last_snapshot = time.monotonic()
+        for old in _numbered(self.directory, "snapshot"):
+            if old < segment:
+                os.remove(_snapshot_path(self.directory, old))
+        for old in _numbered(self.directory, "log"):
+            if old < segment:
+                os.remove(_segment_path(self.directory, old))
+        return segment
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._stopping.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        # A snapshot in progress still writes files and rotates segments
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.close(self._lock_fd)
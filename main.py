@@ -1,25 +1,100 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Header, Query
+from fastapi import FastAPI, HTTPException, Depends, status, Header, Query, Request, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, EmailStr, Field, validator
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field, ValidationError, validator
 from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
-import hashlib
+from datetime import datetime
+from itertools import islice
+import asyncio
+import csv
+import io
+import os
 import secrets
+import sqlite3
 import re
-import time
-from threading import Lock
 import json
 
+from auth_cache import CredentialCache
+from bulk_import import InvalidLine, chunked, iter_items, iter_ndjson
+from diagnostics import AllocationTracer, CachedReport, max_rss_bytes
+from id_allocator import IdAllocator
+from journal import UserJournal
+from indexes import decode_cursor, encode_cursor
+from password_hashing import HasherOverloaded, PasswordHasher
+from rate_limiter import SharedMemoryLimiter, TokenBucketLimiter
+from serialization import EncodedUserCache, dumps, json_array, user_fields
+from response_cache import ResponseCache
+from sharded_storage import ShardedUserStorage, shard_directories
+from storage import DuplicateUserError, InMemoryUserStorage, VersionConflictError
+from user_records import UserRecord
+
 app = FastAPI(title="User Management API", version="1.0.0")
 security = HTTPBasic()
-# In-memory database with thread safety
-users_db = {}
-sessions = {}
-user_locks = {}
-db_lock = Lock()
-request_counts = {}
-last_request_time = {}
+if os.environ.get("USER_STORAGE", "memory") == "sqlite":
+    from sqlite_storage import SQLiteUserStorage
+
+    user_store = SQLiteUserStorage(
+        os.environ.get("SQLITE_PATH", "users.db"),
+        pool_size=int(os.environ.get("SQLITE_POOL_SIZE", "8")),
+    )
+else:
+    def _journal(directory):
+        return UserJournal(
+            directory,
+            fsync=os.environ.get("USER_STORE_FSYNC", "interval"),
+            fsync_interval=float(os.environ.get("USER_STORE_FSYNC_INTERVAL", "1")),
+            snapshot_interval=float(os.environ.get("USER_STORE_SNAPSHOT_SECONDS", "300")),
+            snapshot_entries=int(os.environ.get("USER_STORE_SNAPSHOT_ENTRIES", "100000")),
+        )
+
+    id_allocator = IdAllocator(
+        os.environ.get("USER_ID_SEQUENCE_FILE"),
+        block_size=int(os.environ.get("USER_ID_BLOCK_SIZE", "1000")),
+    )
+    shard_count = int(os.environ.get("USER_STORE_SHARDS", "1"))
+    journals = None
+    if os.environ.get("USER_STORE_DIR"):
+        journals = [_journal(d) for d in shard_directories(os.environ["USER_STORE_DIR"], shard_count)]
+    if shard_count > 1:
+        user_store = ShardedUserStorage(shard_count, id_allocator, journals=journals)
+    else:
+        user_store = InMemoryUserStorage(id_allocator, journal=journals[0] if journals else None)
+# Shared by workers when the backend is; otherwise held in this process
+sessions = user_store.session_storage(
+    ttl_seconds=int(os.environ.get("SESSION_TTL_SECONDS", "86400")),
+    max_sessions=int(os.environ.get("SESSION_MAX_COUNT", "100000")),
+    max_sessions_per_user=int(os.environ.get("SESSION_MAX_PER_USER", "10")),
+)
+RATE_LIMIT_REQUESTS = int(os.environ.get("RATE_LIMIT_REQUESTS", "100"))
+RATE_LIMIT_WINDOW_SECONDS = float(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "60"))
+if os.environ.get("RATE_LIMIT_SHARED_NAME"):
+    rate_limiter = SharedMemoryLimiter(
+        os.environ["RATE_LIMIT_SHARED_NAME"],
+        capacity=RATE_LIMIT_REQUESTS,
+        rate=RATE_LIMIT_REQUESTS / RATE_LIMIT_WINDOW_SECONDS,
+        slots=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "65536")),
+    )
+else:
+    rate_limiter = TokenBucketLimiter(
+        capacity=RATE_LIMIT_REQUESTS,
+        rate=RATE_LIMIT_REQUESTS / RATE_LIMIT_WINDOW_SECONDS,
+        max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")),
+    )
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "0")) or None,
+    target_ms=float(os.environ.get("PASSWORD_HASH_TARGET_MS", "50")),
+    max_pending=int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "128")),
+)
+credential_cache = CredentialCache(
+    ttl_seconds=float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60")),
+    max_entries=int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "10000")),
+)
+# Tokens charged per request on each rate-limited route
+rate_limit_costs = {"create_user": 1.0, "bulk_create_users": 1.0}
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "1000"))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "1000"))
+# UserResponse fields, in order, as export columns
+EXPORT_COLUMNS = ("id", "username", "email", "age", "created_at", "is_active", "phone", "last_login")
 
 
 class UserCreate(BaseModel):
@@ -64,28 +139,115 @@ class LoginRequest(BaseModel):
     password: str
 
 
-def hash_password(password: str) -> str:
-    salt = "static_salt_2024"
-    return hashlib.md5(f"{salt}{password}".encode()).hexdigest()
+# Handlers encode records straight to JSON bytes instead of building a
+# UserResponse per row; response_model still documents the shape.
+encoded_users = EncodedUserCache(max_entries=int(os.environ.get("ENCODED_USER_CACHE_SIZE", "50000")))
 
 
-def verify_rate_limit(ip: str):
-    current_time = time.time()
-    if ip in last_request_time:
-        time_diff = current_time - last_request_time[ip]
-        if ip in request_counts:
-            if time_diff < 60:  # 1 minute window
-                request_counts[ip] += 1
-                if request_counts[ip] > 100:  # 100 requests per minute
-                    return False
-            else:
-                request_counts[ip] = 1
-        else:
-            request_counts[ip] = 1
-    else:
-        request_counts[ip] = 1
-    last_request_time[ip] = current_time
-    return True
+def _user_etag(user: UserRecord) -> str:
+    # Id and creation time tell users apart even when a store that was not
+    # persisted hands out the same ids again; the version moves on every change
+    return f'"{user.id}-{int(user.created_ts * 1_000_000):x}-{user.version}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _expected_version(if_match: Optional[str], user: UserRecord) -> Optional[int]:
+    """The version an ``If-Match`` header pins ``user`` to, if any.
+
+    If-Match uses the strong comparison, so weak tags never match; a header
+    that names no current ETag of the user raises ``VersionConflictError``.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    if _user_etag(user) not in (tag.strip() for tag in if_match.split(",")):
+        raise VersionConflictError(user)
+    return user.version
+
+
+def _user_json(user: UserRecord, status_code: int = 200, if_none_match: Optional[str] = None) -> Response:
+    etag = _user_etag(user)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    body = encoded_users.encode(user)
+    return Response(body, status_code=status_code, media_type="application/json", headers={"ETag": etag})
+
+
+response_cache = ResponseCache(max_bytes=int(os.environ.get("RESPONSE_CACHE_BYTES", str(16 * 2**20))))
+
+
+def _cached_users_json(key: tuple, compute, if_none_match: Optional[str] = None) -> Response:
+    # compute() returns (users, headers). The generation is read before the
+    # store is, so neither a cached page nor the collection ETag is ever
+    # older than the generation it is tagged with.
+    generation = user_store.generation()
+    etag = f'"g{generation}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    enabled = response_cache.max_bytes > 0
+    if enabled:
+        cached = response_cache.get(key, generation)
+        if cached is not None:
+            body, headers = cached
+            headers = {**headers, "ETag": etag, "X-Cache": "HIT"}
+            return Response(body, media_type="application/json", headers=headers)
+    users, headers = compute()
+    body = json_array(encoded_users.encode_many(users))
+    if enabled:
+        response_cache.put(key, generation, body, headers)
+        headers = {**headers, "X-Cache": "MISS"}
+    return Response(body, media_type="application/json", headers={**headers, "ETag": etag})
+
+
+@app.on_event("startup")
+def start_password_hasher():
+    password_hasher.start()
+
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+    user_store.close()
+
+
+@app.exception_handler(HasherOverloaded)
+def hasher_overloaded_handler(request, exc: HasherOverloaded):
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(sqlite3.OperationalError)
+def storage_busy_handler(request, exc: sqlite3.OperationalError):
+    # Typically "database is locked": another writer held the lock past busy_timeout
+    return JSONResponse(
+        status_code=503, content={"detail": "Storage is busy, try again"}, headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(DuplicateUserError)
+def duplicate_user_handler(request, exc: DuplicateUserError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+@app.exception_handler(VersionConflictError)
+def version_conflict_handler(request, exc: VersionConflictError):
+    return JSONResponse(
+        status_code=412,
+        content={"detail": "User has been modified since the given ETag"},
+        headers={"ETag": _user_etag(exc.current)},
+    )
+
+
+def verify_rate_limit(ip: str, route: str = "create_user"):
+    return rate_limiter.allow(ip, rate_limit_costs.get(route, 1.0))
 
 
 def get_client_ip(
@@ -99,24 +261,30 @@ def get_client_ip(
     return "127.0.0.1"
 
 
-def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
+async def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
     username = credentials.username.lower()
     password = credentials.password
-    if username not in users_db:
-        time.sleep(0.1)  # Artificial delay
+    user = await asyncio.to_thread(user_store.get_by_username, username)
+    if user is None:
+        await asyncio.sleep(0.1)  # Artificial delay
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Basic"},
         )
-    user = users_db[username]
-    if user["password"] != hash_password(password):
+    verified = credential_cache.get(username, password, user.password)
+    if verified is None:
+        verified = await password_hasher.verify(password, user.password)
+        credential_cache.put(username, password, user.password, verified)
+    # Deactivated accounts keep their password hash, so the check is needed
+    # whether or not the verification came from the cache
+    if not verified or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Basic"},
         )
-    user["last_login"] = datetime.now()
+    await asyncio.to_thread(user_store.record_login, user.id)
     return username
 
 
@@ -124,12 +292,10 @@ def verify_session(authorization: Optional[str] = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     token = authorization.replace("Bearer ", "")
-    if token not in sessions:
+    session = sessions.get(token)
+    if session is None:
         raise HTTPException(status_code=401, detail="Invalid session")
-    session = sessions[token]
-    # if datetime.now() > session["expires_at"]:
-    #     raise HTTPException(status_code=401, detail="Session expired")
-    return session["username"]
+    return session.username
 
 
 @app.get("/")
@@ -138,26 +304,20 @@ def root():
 
 
 @app.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, client_ip: str = Depends(get_client_ip)):
+async def create_user(user: UserCreate, client_ip: str = Depends(get_client_ip)):
     if not verify_rate_limit(client_ip):
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
-    with db_lock:
-        if user.username in users_db:
-            raise HTTPException(status_code=400, detail="Username already exists")
-        user_id = max([u["id"] for u in users_db.values()], default=0) + 1
-        user_data = {
-            "id": user_id,
-            "username": user.username.lower(),
-            "email": user.email,
-            "password": hash_password(user.password),
-            "age": user.age,
-            "phone": user.phone,
-            "created_at": datetime.now(),
-            "is_active": True,
-            "last_login": None,
-        }
-        users_db[user.username.lower()] = user_data
-    return UserResponse(**user_data)
+    # Cheap early rejection before paying for the hash; the store re-checks
+    # atomically. Usernames are stored lowercased, so compare them that way.
+    username = user.username.lower()
+    if await asyncio.to_thread(user_store.get_by_username, username) is not None:
+        raise HTTPException(status_code=400, detail="Username already exists")
+    password_hash = await password_hasher.hash(user.password)
+    # The store may block on disk (log fsync, SQLite), so keep it off the event loop
+    record = await asyncio.to_thread(
+        user_store.create, username, user.email, password_hash, user.age, user.phone
+    )
+    return _user_json(record, status.HTTP_201_CREATED)
 
 
 @app.get("/users", response_model=List[UserResponse])
@@ -166,91 +326,187 @@ def list_users(
     offset: int = Query(0, ge=0),
     sort_by: str = Query("id", regex="^(id|username|created_at)$"),
     order: str = Query("asc", regex="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, sort_by, order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+    def compute():
+        rows = user_store.page(
+            sort_by, descending=(order == "desc"), limit=limit, offset=offset, after=after
+        )
+        headers = {}
+        if len(rows) == limit and rows:
+            headers["X-Next-Cursor"] = encode_cursor(sort_by, order, rows[-1][0])
+        return [user for _, user in rows], headers
+
+    return _cached_users_json(("users", sort_by, order, limit, offset, after), compute, if_none_match)
+
+
+@app.get("/users/search")
+def search_users(
+    q: str = Query(..., min_length=1),
+    field: str = Query("all", regex="^(all|username|email)$"),
+    exact: bool = False,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
 ):
-    all_users = list(users_db.values())
-    if sort_by == "created_at":
-        all_users.sort(key=lambda x: str(x[sort_by]), reverse=(order == "desc"))
+    after = 0
+    if cursor:
+        try:
+            after = decode_cursor(cursor, "id", "asc")[1]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    search_pattern = q.lower() if not exact else q
+
+    def compute():
+        users = user_store.search(search_pattern, field, exact, after, limit)
+        headers = {}
+        if len(users) == limit:
+            last_id = users[-1].id
+            headers["X-Next-Cursor"] = encode_cursor("id", "asc", (last_id, last_id))
+        return users, headers
+
+    return _cached_users_json(
+        ("search", search_pattern, field, exact, limit, after), compute, if_none_match
+    )
+
+
+def _export_batches(users):
+    return iter(lambda: list(islice(users, EXPORT_CHUNK_ROWS)), [])
+
+
+def _ndjson_export(users):
+    for batch in _export_batches(users):
+        # Not through encoded_users: one pass over every user would flush it
+        yield b"".join(dumps(user_fields(user)) + b"\n" for user in batch)
+
+
+def _csv_export(users):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for batch in _export_batches(users):
+        buffer.seek(0)
+        buffer.truncate()
+        for user in batch:
+            fields = user_fields(user)
+            fields["is_active"] = "true" if fields["is_active"] else "false"
+            writer.writerow(fields[column] for column in EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+
+@app.get("/users/export")
+def export_users(format: str = Query("ndjson", regex="^(ndjson|csv)$")):
+    # Every user in one response, read from a point-in-time snapshot so
+    # writers carry on; rows go out EXPORT_CHUNK_ROWS at a time
+    users = user_store.snapshot_users()
+    if format == "csv":
+        body, media_type = _csv_export(users), "text/csv"
     else:
-        all_users.sort(key=lambda x: x[sort_by], reverse=(order == "desc"))
-    paginated_users = all_users[offset : offset + limit + 1]
-    return [UserResponse(**user) for user in paginated_users]
+        body, media_type = _ndjson_export(users), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
+
+
+@app.get("/users/by-email/{email}", response_model=UserResponse)
+def get_user_by_email(email: str, if_none_match: Optional[str] = Header(None)):
+    user = user_store.get_by_email(email)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return _user_json(user, if_none_match=if_none_match)
+
+
+@app.get("/users/by-phone/{phone}", response_model=UserResponse)
+def get_user_by_phone(phone: str, if_none_match: Optional[str] = Header(None)):
+    user = user_store.get_by_phone(phone)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return _user_json(user, if_none_match=if_none_match)
 
 
 @app.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: str):
+def get_user(user_id: str, if_none_match: Optional[str] = Header(None)):
     try:
         user_id = int(user_id)
     except ValueError:
         raise HTTPException(
             status_code=400, detail=f"Invalid user ID format: {user_id}"
         )
-    for username, user in users_db.items():
-        if user["id"] == user_id:
-            return UserResponse(**user)
-    raise HTTPException(status_code=404, detail="User not found")
+    user = user_store.get(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return _user_json(user, if_none_match=if_none_match)
 
 
 @app.put("/users/{user_id}", response_model=UserResponse)
 def update_user(
-    user_id: int, user_update: UserUpdate, authorization: Optional[str] = Header(None)
+    user_id: int,
+    user_update: UserUpdate,
+    authorization: Optional[str] = Header(None),
+    if_match: Optional[str] = Header(None),
 ):
     username = verify_session(authorization) if authorization else None
     if not username:
         raise HTTPException(status_code=401, detail="Authentication required")
-    target_user = None
-    target_username = None
-    for uname, user in users_db.items():
-        if user["id"] == user_id:
-            target_user = user
-            target_username = uname
-            break
+    target_user = user_store.get(user_id)
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
-    if not target_user["is_active"]:
-        return UserResponse(**target_user)
-    if user_update.email:
-        target_user["email"] = user_update.email
-    if user_update.age is not None:
-        target_user["age"] = user_update.age
-    if user_update.phone is not None:
-        target_user["phone"] = user_update.phone
-    return UserResponse(**target_user)
+    # The store re-checks the version under its write lock, so a change
+    # landing after this read still fails the precondition
+    expected_version = _expected_version(if_match, target_user)
+    if not target_user.is_active:
+        return _user_json(target_user)
+    updated = user_store.update(
+        user_id,
+        email=user_update.email,
+        age=user_update.age,
+        phone=user_update.phone,
+        expected_version=expected_version,
+    )
+    if updated is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return _user_json(updated)
 
 
 @app.delete("/users/{user_id}")
 def delete_user(user_id: int, username: str = Depends(verify_credentials)):
-    for uname, user in users_db.items():
-        if user["id"] == user_id:
-            previous_state = user["is_active"]
-            user["is_active"] = False
-            return {
-                "message": "User deleted successfully",
-                "was_active": previous_state,
-            }
-    raise HTTPException(status_code=404, detail="User not found")
+    user = user_store.get(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    previous_state = user_store.deactivate(user_id)
+    credential_cache.invalidate_user(user.username)
+    return {
+        "message": "User deleted successfully",
+        "was_active": previous_state,
+    }
 
 
 @app.post("/login")
-def login(login_data: LoginRequest, client_ip: str = Depends(get_client_ip)):
+async def login(login_data: LoginRequest, client_ip: str = Depends(get_client_ip)):
     username_lower = login_data.username.lower()
-    if username_lower not in users_db:
-        time.sleep(0.05)
+    user = await asyncio.to_thread(user_store.get_by_username, username_lower)
+    if user is None:
+        await asyncio.sleep(0.05)
         raise HTTPException(status_code=401, detail="Invalid username or password")
-    user = users_db[username_lower]
-    if user["password"] != hash_password(login_data.password):
-        time.sleep(0.1)
+    # Deactivated accounts get the same answer as a wrong password
+    if not await password_hasher.verify(login_data.password, user.password) or not user.is_active:
+        await asyncio.sleep(0.1)
         raise HTTPException(status_code=401, detail="Invalid username or password")
-    session_token = hashlib.sha256(
-        f"{login_data.username}{datetime.now().isoformat()}{client_ip}".encode()
-    ).hexdigest()[:32]
-    sessions[session_token] = {
-        "username": username_lower,
-        "created_at": datetime.now(),
-        "expires_at": datetime.now() + timedelta(hours=24),
-        "ip": client_ip,
-    }
-    user["last_login"] = datetime.now()
-    return {"token": session_token, "expires_in": 86400, "user_id": user["id"]}
+    # Recorded first, so a store that cannot take the write leaves no session behind
+    await asyncio.to_thread(user_store.record_login, user.id)
+    session_token, _ = await asyncio.to_thread(sessions.create, username_lower, client_ip)
+    return {"token": session_token, "expires_in": sessions.ttl_seconds, "user_id": user.id}
 
 
 @app.post("/logout")
@@ -258,68 +514,169 @@ def logout(authorization: Optional[str] = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         return {"message": "No active session"}
     token = authorization.replace("Bearer ", "")
-    if token in sessions:
-        del sessions[token]
+    sessions.revoke(token)
     return {"message": "Logged out successfully"}
 
 
-@app.get("/users/search")
-def search_users(
-    q: str = Query(..., min_length=1),
-    field: str = Query("all", regex="^(all|username|email)$"),
-    exact: bool = False,
-):
-    results = []
-    search_pattern = q.lower() if not exact else q
-    for username, user in users_db.items():
-        matched = False
-        if field == "all" or field == "username":
-            if exact:
-                if user["username"] == search_pattern:
-                    matched = True
-            else:
-                if search_pattern in user["username"].lower():
-                    matched = True
-        if field == "all" or field == "email":
-            if search_pattern in user["email"]:
-                matched = True
-        if matched:
-            results.append(UserResponse(**user))
-    return results
-
-
 @app.get("/stats")
-def get_stats(include_details: bool = False):
+def get_stats(
+    response: Response,
+    include_details: bool = False,
+    details_limit: int = Query(100, ge=1, le=1000),
+    details_cursor: Optional[str] = None,
+):
+    total, active = user_store.counts()
     stats = {
-        "total_users": len(users_db),
-        "active_users": len([u for u in users_db.values() if u["is_active"]]),
-        "inactive_users": len([u for u in users_db.values() if not u["is_active"]]),
+        "total_users": total,
+        "active_users": active,
+        "inactive_users": total - active,
         "active_sessions": len(sessions),
         "api_version": "1.0.0",
     }
     if include_details:
-        stats["user_emails"] = [u["email"] for u in users_db.values()]
-        stats["session_tokens"] = list(sessions.keys())[:5]
+        after = None
+        if details_cursor:
+            try:
+                after = decode_cursor(details_cursor, "id", "asc")
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+        rows = user_store.page("id", descending=False, limit=details_limit, after=after)
+        stats["user_emails"] = [user.email for _, user in rows]
+        stats["session_tokens"] = sessions.sample(5)
+        if len(rows) == details_limit:
+            response.headers["X-Next-Cursor"] = encode_cursor("id", "asc", rows[-1][0])
     return stats
 
 
+@app.get("/stats/emails")
+def stream_user_emails():
+    def generate():
+        for user in user_store.iter_users():
+            yield json.dumps(user.email) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @app.get("/health")
 def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "memory_users": len(str(users_db)),
-        "memory_sessions": len(str(sessions)),
+        "memory_users": len(user_store),
+        "memory_sessions": len(sessions),
     }
 
 
+def _build_diagnostics():
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "records": {
+            "users": len(user_store),
+            "sessions": len(sessions),
+            "rate_limit_keys": len(rate_limiter),
+        },
+        "approx_bytes": {
+            **user_store.memory_usage(),
+            "sessions": sessions.approx_bytes(),
+            "rate_limit": rate_limiter.approx_bytes(),
+            "credential_cache": credential_cache.approx_bytes(),
+            "encoded_users": encoded_users.approx_bytes(),
+            "response_cache": response_cache.approx_bytes(),
+        },
+        "max_rss_bytes": max_rss_bytes(),
+    }
+
+
+diagnostics = CachedReport(
+    _build_diagnostics, float(os.environ.get("DIAGNOSTICS_REFRESH_SECONDS", "30"))
+)
+# Allocation tracing slows the whole process down, so it is off unless configured
+TRACEMALLOC_SECONDS = float(os.environ.get("DIAGNOSTICS_TRACEMALLOC_SECONDS", "0"))
+allocation_tracer = AllocationTracer(TRACEMALLOC_SECONDS, diagnostics.refresh_interval)
+
+
+@app.get("/health/ready")
+def readiness_check(
+    tracemalloc: bool = False, top: int = Query(10, ge=1, le=100)
+):
+    # Cache counters are cheap to read, so they are always current
+    report = {"status": "ready", **diagnostics.get(), "response_cache": response_cache.stats()}
+    if tracemalloc:
+        if TRACEMALLOC_SECONDS <= 0:
+            raise HTTPException(status_code=403, detail="Allocation tracing is disabled")
+        report["tracemalloc"] = allocation_tracer.report(top)
+    return report
+
+
+async def _create_chunk(chunk: List[tuple]) -> List[Dict[str, Any]]:
+    # Validate, hash and store one chunk of (index, row) pairs
+    results = {}
+    valid = []
+    for index, row in chunk:
+        if isinstance(row, InvalidLine):
+            results[index] = {"index": index, "status": 422, "detail": row.detail}
+            continue
+        if not isinstance(row, dict):
+            results[index] = {"index": index, "status": 422, "detail": "Expected a JSON object"}
+            continue
+        try:
+            user = UserCreate(**row)
+        except ValidationError as e:
+            detail = [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+            results[index] = {"index": index, "status": 422, "detail": detail}
+            continue
+        valid.append((index, user, user.username.lower()))
+    taken = await asyncio.to_thread(
+        lambda: [user_store.get_by_username(username) is not None for _, _, username in valid]
+    )
+    for (index, _, _), exists in zip(valid, taken):
+        if exists:
+            results[index] = {"index": index, "status": 400, "detail": "Username already exists"}
+    valid = [entry for entry, exists in zip(valid, taken) if not exists]
+    if valid:
+        try:
+            hashes = await password_hasher.hash_many([user.password for _, user, _ in valid])
+        except HasherOverloaded as e:
+            for index, _, _ in valid:
+                results[index] = {"index": index, "status": 503, "detail": str(e)}
+        else:
+            rows = [
+                {"username": username, "email": user.email, "password": password_hash,
+                 "age": user.age, "phone": user.phone}
+                for (_, user, username), password_hash in zip(valid, hashes)
+            ]
+            # One lock (or transaction) for the whole chunk
+            outcomes = await asyncio.to_thread(user_store.create_many, rows)
+            for (index, _, _), outcome in zip(valid, outcomes):
+                if isinstance(outcome, DuplicateUserError):
+                    results[index] = {"index": index, "status": 400, "detail": str(outcome)}
+                else:
+                    results[index] = {"index": index, "status": 201, "id": outcome.id}
+    return [results[index] for index, _ in chunk]
+
+
 @app.post("/users/bulk", include_in_schema=False)
-def bulk_create_users(users: List[UserCreate]):
-    created = []
-    for user in users:
+async def bulk_create_users(request: Request, client_ip: str = Depends(get_client_ip)):
+    # A JSON array, or an NDJSON body parsed as it streams in; every row gets
+    # its own result, so one bad row does not fail the rest
+    if not verify_rate_limit(client_ip, "bulk_create_users"):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("application/x-ndjson", "application/jsonl")):
+        rows = iter_ndjson(request.stream())
+    else:
         try:
-            result = create_user(user, client_ip="127.0.0.1")
-            created.append(result)
-        except:
-            pass
-    return {"created": len(created), "users": created}
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(payload, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array of users")
+        rows = iter_items(payload)
+    results = []
+    index = 0
+    async for chunk in chunked(rows, BULK_CHUNK_SIZE):
+        indexed = list(enumerate(chunk, start=index))
+        index += len(chunk)
+        results.extend(await _create_chunk(indexed))
+    created = sum(1 for result in results if result["status"] == 201)
+    return {"created": created, "failed": len(results) - created, "results": results}
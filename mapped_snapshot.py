@@ -0,0 +1,275 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from indexes import normalize_email, normalize_phone, trigrams
+from user_records import UserRecord
+
+MAGIC = b"USRSNAP\0"
+VERSION = 3
+# Version 2 snapshots lack the trailing "versions" section; their users read as version 0
+READABLE_VERSIONS = (2, 3)
+
+# Section name -> array typecode. Columns hold one entry per row, in id
+# order; "*_offsets" index the matching "*_heap" (n + 1 entries); "by_*"
+# are row numbers in key order; "*_grams" are packed trigrams with
+# "*_gram_offsets" into the id postings in "*_postings".
+SECTIONS = (
+    ("ids", "q"),
+    ("ages", "i"),
+    ("created", "d"),
+    ("last_login", "d"),
+    ("flags", "B"),
+    ("username_offsets", "Q"),
+    ("username_heap", "B"),
+    ("email_offsets", "Q"),
+    ("email_heap", "B"),
+    ("password_offsets", "Q"),
+    ("password_heap", "B"),
+    ("phone_offsets", "Q"),
+    ("phone_heap", "B"),
+    ("by_username", "I"),
+    ("by_email", "I"),
+    ("by_phone", "I"),
+    ("by_created", "I"),
+    ("username_grams", "Q"),
+    ("username_gram_offsets", "Q"),
+    ("username_postings", "q"),
+    ("email_grams", "Q"),
+    ("email_gram_offsets", "Q"),
+    ("email_postings", "q"),
+    ("versions", "Q"),
+)
+STRING_COLUMNS = ("username", "email", "password", "phone")
+
+# magic, version, little-endian flag, rows, active rows, log segment
+HEADER = struct.Struct("<8sHB5xQQQ")
+SECTION = struct.Struct("<QQ")
+
+ACTIVE = 1
+HAS_PHONE = 2
+HAS_LAST_LOGIN = 4
+
+NORMALIZERS = {"username": str, "email": normalize_email, "phone": normalize_phone}
+
+
+def pack_trigram(gram: str) -> int:
+    a, b, c = gram
+    return (ord(a) << 42) | (ord(b) << 21) | ord(c)
+
+
+def is_mapped_snapshot(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_snapshot(path: str, segment: int, rows: Iterable[Sequence[Any]]) -> None:
+    """Write ``UserRecord.to_row`` rows, given in ascending id order, to ``path``.
+
+    Sections are 8-byte aligned and stored in native byte order, which the
+    header records so a snapshot is never mapped on a mismatched machine.
+    """
+    columns = {name: array(typecode) for name, typecode in SECTIONS}
+    heaps = {name: bytearray() for name in STRING_COLUMNS}
+    for name in STRING_COLUMNS:
+        columns[f"{name}_offsets"].append(0)
+    usernames: List[str] = []
+    email_keys: List[str] = []
+    phone_keys: List[Optional[str]] = []
+    postings = {"username": {}, "email": {}}
+    active = 0
+    for user_id, username, email, password, age, phone, created_ts, last_login_ts, is_active, *rest in rows:
+        columns["ids"].append(user_id)
+        columns["versions"].append(rest[0] if rest else 0)
+        columns["ages"].append(age)
+        columns["created"].append(created_ts)
+        columns["last_login"].append(last_login_ts or 0.0)
+        flags = (ACTIVE if is_active else 0) | (HAS_PHONE if phone is not None else 0)
+        flags |= HAS_LAST_LOGIN if last_login_ts is not None else 0
+        columns["flags"].append(flags)
+        active += bool(is_active)
+        for name, value in zip(STRING_COLUMNS, (username, email, password, phone or "")):
+            heap = heaps[name]
+            heap += value.encode()
+            columns[f"{name}_offsets"].append(len(heap))
+        usernames.append(username)
+        email_keys.append(normalize_email(email))
+        phone_keys.append(normalize_phone(phone) if phone else None)
+        for name, text in (("username", username), ("email", email)):
+            grams = postings[name]
+            for gram in trigrams(text.lower()):
+                posting = grams.get(gram)
+                if posting is None:
+                    posting = grams[gram] = array("q")
+                posting.append(user_id)
+    count = len(usernames)
+    for name in STRING_COLUMNS:
+        columns[f"{name}_heap"] = heaps[name]
+    # Stable sorts of rows already in id order break ties by id
+    columns["by_username"].extend(sorted(range(count), key=usernames.__getitem__))
+    columns["by_email"].extend(sorted(range(count), key=email_keys.__getitem__))
+    with_phone = [row for row in range(count) if phone_keys[row]]
+    columns["by_phone"].extend(sorted(with_phone, key=phone_keys.__getitem__))
+    columns["by_created"].extend(sorted(range(count), key=columns["created"].__getitem__))
+    for name, grams in postings.items():
+        packed = sorted((pack_trigram(gram), posting) for gram, posting in grams.items())
+        offsets = columns[f"{name}_gram_offsets"]
+        offsets.append(0)
+        for code, posting in packed:
+            columns[f"{name}_grams"].append(code)
+            columns[f"{name}_postings"].extend(posting)
+            offsets.append(len(columns[f"{name}_postings"]))
+
+    with open(path, "wb") as f:
+        table_size = HEADER.size + SECTION.size * len(SECTIONS)
+        position = table_size
+        layout = []
+        for name, _ in SECTIONS:
+            position += -position % 8
+            data = columns[name]
+            length = len(data) * getattr(data, "itemsize", 1)
+            layout.append((position, length))
+            position += length
+        f.write(HEADER.pack(MAGIC, VERSION, sys.byteorder == "little", count, active, segment))
+        for offset, length in layout:
+            f.write(SECTION.pack(offset, length))
+        for (name, _), (offset, _) in zip(SECTIONS, layout):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(columns[name] if isinstance(columns[name], bytearray) else columns[name].tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class _SortedKeys:
+    """``(value, user_id)`` keys of a snapshot in sort order, as a read-only sequence."""
+
+    def __init__(self, snapshot: "MappedSnapshot", order: Optional[Sequence[int]], value: Callable[[int], Any]):
+        self._ids = snapshot.ids
+        self._order = order
+        self._value = value
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, position: int) -> Tuple[Any, int]:
+        row = position if self._order is None else self._order[position]
+        return self._value(row), self._ids[row]
+
+
+class _Postings:
+    """Trigram -> ascending ids lookups over a snapshot's posting sections."""
+
+    def __init__(self, grams: Sequence[int], offsets: Sequence[int], postings: Sequence[int]):
+        self._grams = grams
+        self._offsets = offsets
+        self._postings = postings
+
+    def get(self, gram: str, default=()) -> Sequence[int]:
+        code = pack_trigram(gram)
+        i = bisect_left(self._grams, code)
+        if i == len(self._grams) or self._grams[i] != code:
+            return default
+        return self._postings[self._offsets[i] : self._offsets[i + 1]]
+
+
+class MappedSnapshot:
+    """Read-only ``mmap`` view of a snapshot written by ``write_snapshot``.
+
+    Opening one reads the header and section table only; every column is a
+    ``memoryview`` into the mapping, so startup cost and private memory do
+    not grow with the number of users and processes mapping the same file
+    share its pages through the page cache. Rows are located by binary
+    search over the id column or the precomputed key orders, and a
+    ``UserRecord`` is only built when ``record`` is called.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little_endian, self.count, self.active_count, self.segment = HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != MAGIC or version not in READABLE_VERSIONS:
+            raise ValueError(f"{path} is not a user snapshot of a supported version")
+        if bool(little_endian) != (sys.byteorder == "little"):
+            raise ValueError(f"{path} was written on a machine with different byte order")
+        view = memoryview(self._mmap)
+        self._sections = {}
+        sections = SECTIONS if version >= 3 else SECTIONS[:-1]
+        for i, (name, typecode) in enumerate(sections):
+            offset, length = SECTION.unpack_from(self._mmap, HEADER.size + i * SECTION.size)
+            self._sections[name] = view[offset : offset + length].cast(typecode)
+        self.ids = self._sections["ids"]
+        self._versions = self._sections.get("versions")
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def size(self) -> int:
+        return len(self._mmap)
+
+    def string(self, column: str, row: int) -> str:
+        offsets = self._sections[f"{column}_offsets"]
+        return bytes(self._sections[f"{column}_heap"][offsets[row] : offsets[row + 1]]).decode()
+
+    def row_of(self, user_id: int) -> Optional[int]:
+        row = bisect_left(self.ids, user_id)
+        if row < self.count and self.ids[row] == user_id:
+            return row
+        return None
+
+    def row(self, row: int) -> tuple:
+        """The row as ``UserRecord.to_row`` would give it."""
+        sections = self._sections
+        flags = sections["flags"][row]
+        return (
+            self.ids[row],
+            self.string("username", row),
+            self.string("email", row),
+            self.string("password", row),
+            sections["ages"][row],
+            self.string("phone", row) if flags & HAS_PHONE else None,
+            sections["created"][row],
+            sections["last_login"][row] if flags & HAS_LAST_LOGIN else None,
+            bool(flags & ACTIVE),
+            self._versions[row] if self._versions is not None else 0,
+        )
+
+    def record(self, row: int) -> UserRecord:
+        return UserRecord.from_row(self.row(row))
+
+    def find(self, column: str, key: str) -> List[int]:
+        """Rows whose normalized ``column`` value equals ``key``.
+
+        Usernames are unique; an email or phone key can repeat when a
+        snapshot captured one user's new value before another's old one was
+        released, so callers check the row against the live record.
+        """
+        order = self._sections[f"by_{column}"]
+        normalize = NORMALIZERS[column]
+
+        def key_of(row: int) -> str:
+            return normalize(self.string(column, row))
+
+        lo = bisect_left(order, key, key=key_of)
+        hi = bisect_right(order, key, lo, key=key_of)
+        return [order[i] for i in range(lo, hi)]
+
+    def sorted_keys(self, sort_by: str) -> _SortedKeys:
+        if sort_by == "id":
+            return _SortedKeys(self, None, self.ids.__getitem__)
+        if sort_by == "username":
+            return _SortedKeys(self, self._sections["by_username"], lambda row: self.string("username", row))
+        return _SortedKeys(self, self._sections["by_created"], self._sections["created"].__getitem__)
+
+    def postings(self, field: str) -> _Postings:
+        sections = self._sections
+        return _Postings(
+            sections[f"{field}_grams"], sections[f"{field}_gram_offsets"], sections[f"{field}_postings"]
+        )
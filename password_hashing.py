@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import List, Optional
+
+ALGORITHM = "pbkdf2_sha256"
+
+
+class HasherOverloaded(Exception):
+    """Raised when the hashing queue stays full for longer than the queue timeout."""
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def _pbkdf2_many(passwords: List[str], salts: List[bytes], iterations: int) -> List[bytes]:
+    return [_pbkdf2(password, salt, iterations) for password, salt in zip(passwords, salts)]
+
+
+def _calibrate(target_seconds: float, min_iterations: int) -> int:
+    # Runs inside a worker so the measurement reflects the pool's own speed
+    sample = 20_000
+    start = time.perf_counter()
+    _pbkdf2("calibration", b"\0" * 16, sample)
+    elapsed = time.perf_counter() - start
+    return max(min_iterations, int(sample * target_seconds / elapsed))
+
+
+def _encode(iterations: int, salt: bytes, digest: bytes) -> str:
+    salt_b64 = base64.b64encode(salt).decode()
+    digest_b64 = base64.b64encode(digest).decode()
+    return f"{ALGORITHM}${iterations}${salt_b64}${digest_b64}"
+
+
+class PasswordHasher:
+    """PBKDF2-SHA256 hashing on a process pool, awaitable from request handlers.
+
+    Hashing is CPU-bound and holds the GIL, so it runs in worker processes and
+    throughput scales with ``workers``. The iteration count is calibrated once
+    at startup so one hash takes about ``target_ms`` on a worker; it is stored
+    in every encoded hash, so verification keeps working after recalibration.
+    At most ``max_pending`` hashes may be queued: further callers wait up to
+    ``queue_timeout`` seconds for a slot and then get ``HasherOverloaded``,
+    which keeps a login flood from building an unbounded backlog.
+    ``hash_many`` sends passwords to the workers in batches, one queue slot
+    and one round trip per batch, for bulk imports.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        target_ms: float = 50,
+        min_iterations: int = 10_000,
+        max_pending: int = 128,
+        queue_timeout: float = 10.0,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.target_ms = target_ms
+        self.min_iterations = min_iterations
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.iterations: Optional[int] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._start_lock = Lock()
+        self._slots = None
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._pool is not None:
+                return
+            # Forking a server that already runs threads is unsafe
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            self.iterations = self._pool.submit(
+                _calibrate, self.target_ms / 1000, self.min_iterations
+            ).result()
+
+    def shutdown(self) -> None:
+        with self._start_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    async def hash(self, password: str) -> str:
+        if self._pool is None:
+            await asyncio.to_thread(self.start)
+        salt = secrets.token_bytes(16)
+        iterations = self.iterations
+        digest = await self._run(_pbkdf2, password, salt, iterations)
+        return _encode(iterations, salt, digest)
+
+    async def hash_many(self, passwords: List[str], batch_size: int = 32) -> List[str]:
+        if self._pool is None:
+            await asyncio.to_thread(self.start)
+        iterations = self.iterations
+        salts = [secrets.token_bytes(16) for _ in passwords]
+        batches = await asyncio.gather(
+            *(
+                self._run(_pbkdf2_many, passwords[i : i + batch_size], salts[i : i + batch_size], iterations)
+                for i in range(0, len(passwords), batch_size)
+            )
+        )
+        digests = [digest for batch in batches for digest in batch]
+        return [_encode(iterations, salt, digest) for salt, digest in zip(salts, digests)]
+
+    async def verify(self, password: str, encoded: str) -> bool:
+        try:
+            algorithm, iterations, salt, expected = encoded.split("$")
+            if algorithm != ALGORITHM:
+                return False
+            iterations = int(iterations)
+            salt, expected = base64.b64decode(salt), base64.b64decode(expected)
+        except (ValueError, TypeError):
+            return False
+        if self._pool is None:
+            await asyncio.to_thread(self.start)
+        digest = await self._run(_pbkdf2, password, salt, iterations)
+        return hmac.compare_digest(digest, expected)
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HasherOverloaded("Password hashing queue is full")
+        try:
+            future = self._pool.submit(fn, *args)
+            return await asyncio.wrap_future(future)
+        finally:
+            self._slots.release()
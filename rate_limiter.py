@@ -0,0 +1,173 @@
+import hashlib
+import os
+import struct
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets holding ``capacity`` tokens refilled at ``rate`` per second.
+
+    Keys are spread over ``stripes`` independently locked LRU maps, so
+    concurrent requests for different clients rarely share a lock. A bucket
+    that has been idle long enough to refill completely is indistinguishable
+    from a new one, so it is dropped as soon as it reaches the cold end of its
+    stripe; ``max_keys`` caps the total on top of that by evicting the least
+    recently used key.
+    """
+
+    def __init__(self, capacity: float, rate: float, stripes: int = 16, max_keys: int = 100_000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys_per_stripe = max(max_keys // stripes, 1)
+        self._locks = [Lock() for _ in range(stripes)]
+        self._buckets: List["OrderedDict[str, List[float]]"] = [OrderedDict() for _ in range(stripes)]
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self._buckets)
+
+    def allow(self, key: str, cost: float = 1.0) -> bool:
+        stripe = hash(key) % len(self._locks)
+        buckets = self._buckets[stripe]
+        now = time.monotonic()
+        with self._locks[stripe]:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [self.capacity, now]
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            allowed = bucket[0] >= cost
+            if allowed:
+                bucket[0] -= cost
+            self._evict(buckets, now)
+            return allowed
+
+    def _evict(self, buckets, now: float) -> None:
+        while len(buckets) > self.max_keys_per_stripe:
+            buckets.popitem(last=False)
+        while buckets:
+            tokens, updated = next(iter(buckets.values()))
+            if tokens + (now - updated) * self.rate < self.capacity:
+                break
+            buckets.popitem(last=False)
+
+    def approx_bytes(self) -> int:
+        per_key = sys.getsizeof([0.0, 0.0]) + 2 * sys.getsizeof(0.0) + sys.getsizeof("255.255.255.255")
+        # OrderedDict keeps a linked-list node per key on top of the hash table
+        per_key += 56
+        return sum(sys.getsizeof(b) for b in self._buckets) + len(self) * per_key
+
+
+class SharedMemoryLimiter:
+    """Token buckets in a fixed-size shared memory table for multi-process servers.
+
+    Every process that opens the same ``name`` sees the same table, so the
+    limit holds across uvicorn workers. The table is set-associative: a key
+    hashes to a set of ``ways`` slots of (key hash, tokens, updated). A key
+    missing from its set replaces an empty slot, a fully refilled one, or
+    else the least recently updated one, which bounds memory to
+    ``slots * 24`` bytes with stale-key eviction built in. Sets are grouped
+    into stripes guarded by a thread lock plus an ``fcntl`` byte-range lock
+    on ``lock_path``, because record locks do not exclude threads of the
+    same process.
+    """
+
+    _SLOT = struct.Struct("=Qdd")
+
+    def __init__(
+        self,
+        name: str,
+        capacity: float,
+        rate: float,
+        slots: int = 65536,
+        ways: int = 4,
+        stripes: int = 64,
+        lock_path: Optional[str] = None,
+    ):
+        if fcntl is None:
+            raise RuntimeError("Shared rate limiting requires fcntl (POSIX)")
+        from multiprocessing import shared_memory
+
+        self.capacity = capacity
+        self.rate = rate
+        self.ways = ways
+        self.sets = max(slots // ways, 1)
+        self.stripes = stripes
+        size = self.sets * ways * self._SLOT.size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._untrack(self._shm)
+        self._buf = self._shm.buf
+        self._locks = [Lock() for _ in range(stripes)]
+        lock_path = lock_path or os.path.join("/tmp", f"{name}.lock")
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @staticmethod
+    def _untrack(shm) -> None:
+        # The segment outlives any single worker; stop the resource tracker
+        # from unlinking it when the process that attached it exits.
+        try:
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+
+    def __len__(self):
+        slot = self._SLOT
+        return sum(
+            1
+            for offset in range(0, self.sets * self.ways * slot.size, slot.size)
+            if slot.unpack_from(self._buf, offset)[0]
+        )
+
+    def allow(self, key: str, cost: float = 1.0) -> bool:
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") | 1
+        set_index = key_hash % self.sets
+        stripe = set_index % self.stripes
+        base = set_index * self.ways * self._SLOT.size
+        now = time.time()
+        with self._locks[stripe]:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                return self._take(base, key_hash, now, cost)
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, stripe)
+
+    def _take(self, base: int, key_hash: int, now: float, cost: float) -> bool:
+        slot, buf = self._SLOT, self._buf
+        target, tokens = None, self.capacity
+        victim, victim_updated = base, float("inf")
+        for way in range(self.ways):
+            offset = base + way * slot.size
+            stored_hash, stored_tokens, updated = slot.unpack_from(buf, offset)
+            if stored_hash == key_hash:
+                target = offset
+                tokens = min(self.capacity, stored_tokens + (now - updated) * self.rate)
+                break
+            if not stored_hash or stored_tokens + (now - updated) * self.rate >= self.capacity:
+                victim, victim_updated = offset, float("-inf")
+            elif updated < victim_updated:
+                victim, victim_updated = offset, updated
+        if target is None:
+            target = victim
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        slot.pack_into(buf, target, key_hash, tokens, now)
+        return allowed
+
+    def approx_bytes(self) -> int:
+        return self.sets * self.ways * self._SLOT.size
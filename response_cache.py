@@ -0,0 +1,78 @@
+import sys
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    """LRU of encoded response bodies under a byte budget.
+
+    Entries are keyed by route and normalized query and tagged with the
+    store generation that was current before the response was computed. A
+    lookup only hits while the store still reports that generation, so a
+    write of any kind retires every cached page without invalidation calls;
+    stale entries are dropped as they are found or age out of the LRU.
+    ``max_bytes=0`` disables the cache.
+    """
+
+    ENTRY_OVERHEAD = sys.getsizeof((None, None, None, None)) + 56
+
+    def __init__(self, max_bytes: int = 16 * 2**20):
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        # key -> (generation, body, headers, size)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self._entries) + self._bytes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def get(self, key: Hashable, generation: int) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key: Hashable, generation: int, body: bytes, headers: Dict[str, str]) -> None:
+        size = sys.getsizeof(key) + sys.getsizeof(body) + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and existing[0] > generation:
+                # A slower request computed this page before the last write
+                return
+            self._drop(key)
+            self._entries[key] = (generation, body, headers, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
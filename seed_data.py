@@ -1,6 +1,30 @@
-import requests
+"""Seed the API with users.
+
+Without ``--users`` the sample users below are created, which is what the
+test suite and the credentials in the README expect. With ``--users N``,
+N synthetic users are generated from ``--seed`` (the same seed always
+yields the same users and passwords) and sent over one pooled
+``httpx.AsyncClient`` with ``--concurrency`` requests in flight, either one
+``POST /users`` per user or, with ``--bulk``, ``--batch-size`` users per
+``POST /users/bulk``. Throughput and error counts are printed as it goes.
+
+    python seed_data.py --users 1000000 --bulk --concurrency 8
+
+Both routes are rate limited per client, so raise ``RATE_LIMIT_REQUESTS``
+on the target for large runs; 429 and 503 responses are retried after a
+back-off. Password hashing is the bottleneck, so throughput scales with
+the server's ``PASSWORD_HASH_WORKERS``.
+"""
+import argparse
+import asyncio
 import json
+import random
 import sys
+import time
+from collections import Counter
+from itertools import islice
+
+import httpx
 
 BASE_URL = "http://localhost:8000"
 
@@ -77,80 +101,278 @@ sample_users = [
     },
 ]
 
+FIRST_NAMES = ["ada", "alan", "grace", "linus", "margaret", "dennis", "barbara", "ken", "frances", "edsger"]
+LAST_NAMES = ["lovelace", "turing", "hopper", "torvalds", "hamilton", "ritchie", "liskov", "thompson", "allen"]
+DOMAINS = ["example.com", "example.org", "example.net"]
+# Phone numbers are +1 followed by ten digits starting at this value; each
+# seed owns a block of PHONE_STRIDE numbers, which caps the users per run
+PHONE_BASE = 2_000_000_000
+PHONE_STRIDE = 10_000_000
+PHONE_SEEDS = (10_000_000_000 - PHONE_BASE) // PHONE_STRIDE
+RETRY_STATUSES = (429, 503)
+
+
+def synthetic_users(count, seed=0):
+    """Return ``count`` users; the same ``count`` and ``seed`` always give the same users.
+
+    Usernames, emails and phones embed the seed and the user's position, so
+    every user is unique and runs with different seeds do not collide:
+    phones are ``PHONE_BASE + seed * PHONE_STRIDE + i``, which needs
+    ``count <= PHONE_STRIDE`` and ``0 <= seed < PHONE_SEEDS``, and a
+    ``ValueError`` is raised up front otherwise.
+    """
+    if count > PHONE_STRIDE:
+        raise ValueError(f"at most {PHONE_STRIDE} synthetic users per run")
+    if not 0 <= seed < PHONE_SEEDS:
+        raise ValueError(f"seed must be between 0 and {PHONE_SEEDS - 1}")
+    return _synthetic_users(count, seed)
+
+
+def _synthetic_users(count, seed):
+    rng = random.Random(seed)
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first}_{last}_{seed}_{i}"
+        user = {
+            "username": username,
+            "email": f"{username}@{rng.choice(DOMAINS)}",
+            "password": f"pw-{rng.getrandbits(48):012x}",
+            "age": rng.randint(18, 90),
+        }
+        if rng.random() < 0.6:
+            user["phone"] = f"+1{PHONE_BASE + seed * PHONE_STRIDE + i:010d}"
+        yield user
+
+
+class SeedStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.retries = 0
+
+    @property
+    def created(self):
+        return self.statuses[201]
+
+    @property
+    def failed(self):
+        return sum(self.statuses.values()) - self.created
+
+    def record(self, status, detail=None):
+        self.statuses[status] += 1
+        if status != 201 and detail:
+            self.errors[f"{status}: {detail}"] += 1
+
+    def line(self):
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.statuses.values())
+        rate = self.created / elapsed if elapsed else 0.0
+        error_rate = self.failed / total if total else 0.0
+        return (
+            f"{total} sent, {self.created} created, {self.failed} failed "
+            f"({error_rate:.2%}), {rate:.0f} users/s, {self.retries} retries, {elapsed:.1f}s"
+        )
+
+
+def _summary(detail):
+    if isinstance(detail, list) and detail and isinstance(detail[0], dict):
+        # Validation errors: group by the first message, not the echoed input
+        detail = detail[0].get("msg", detail[0])
+    return detail if isinstance(detail, str) or detail is None else json.dumps(detail)[:200]
+
+
+def _detail(response):
+    try:
+        return _summary(response.json().get("detail"))
+    except ValueError:
+        return response.text[:200]
+
+
+def _retry_delay(response, attempt):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return min(0.5 * 2**attempt, 30.0)
+
+
+async def post_user(client, user, stats, retries, verbose=False):
+    for attempt in range(retries + 1):
+        try:
+            response = await client.post("/users", json=user)
+        except httpx.HTTPError as e:
+            if attempt == retries:
+                stats.record("error", type(e).__name__)
+                if verbose:
+                    print(f"✗ Error creating user {user['username']}: {e}")
+                return
+            stats.retries += 1
+            await asyncio.sleep(min(0.5 * 2**attempt, 30.0))
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            stats.retries += 1
+            await asyncio.sleep(_retry_delay(response, attempt))
+            continue
+        break
+    stats.record(response.status_code, _detail(response))
+    if verbose:
+        if response.status_code == 201:
+            print(f"✓ Created user: {user['username']}")
+        else:
+            print(f"✗ Failed to create user: {user['username']}")
+            print(f"  Status: {response.status_code}")
+            print(f"  Error: {response.text}")
 
-def check_api_health():
+
+async def post_batch(client, users, stats, retries):
+    # Rows the server could not hash in time come back as 503 and are resent
+    for attempt in range(retries + 1):
+        body = "".join(json.dumps(user) + "\n" for user in users)
+        try:
+            response = await client.post(
+                "/users/bulk", content=body, headers={"Content-Type": "application/x-ndjson"}
+            )
+        except httpx.HTTPError as e:
+            if attempt == retries:
+                for _ in users:
+                    stats.record("error", type(e).__name__)
+                return
+            stats.retries += 1
+            await asyncio.sleep(min(0.5 * 2**attempt, 30.0))
+            continue
+        if response.status_code != 200:
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                stats.retries += 1
+                await asyncio.sleep(_retry_delay(response, attempt))
+                continue
+            for _ in users:
+                stats.record(response.status_code, _detail(response))
+            return
+        pending = []
+        for result in response.json()["results"]:
+            if result["status"] == 503 and attempt < retries:
+                pending.append(users[result["index"]])
+            else:
+                stats.record(result["status"], _summary(result.get("detail")))
+        if not pending:
+            return
+        users = pending
+        stats.retries += 1
+        await asyncio.sleep(min(0.5 * 2**attempt, 30.0))
+
+
+async def report(stats, interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(stats.line(), flush=True)
+
+
+async def seed(users, base_url, concurrency, bulk, batch_size, retries, verbose, progress_interval):
+    stats = SeedStats()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        users = iter(users)
+
+        async def worker():
+            # Workers share one generator, so users are produced as they are sent
+            if bulk:
+                while batch := list(islice(users, batch_size)):
+                    await post_batch(client, batch, stats, retries)
+            else:
+                for user in users:
+                    await post_user(client, user, stats, retries, verbose)
+
+        reporter = asyncio.create_task(report(stats, progress_interval)) if progress_interval else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+    return stats
+
+
+def check_api_health(base_url=BASE_URL):
     """Check if API is running before seeding"""
     try:
-        response = requests.get(f"{BASE_URL}/")
+        response = httpx.get(f"{base_url}/")
         if response.status_code == 200:
             return True
-    except requests.ConnectionError:
+    except httpx.HTTPError:
         return False
     return False
 
 
-def seed_database():
-    """Seed the database with sample users"""
+def print_sample_credentials():
+    print("\nSample credentials for testing:")
+    print("-" * 30)
+    print("Standard users:")
+    print("  Username: john_doe, Password: password123")
+    print("  Username: jane_smith, Password: securepass456")
+    print("\nAdmin user:")
+    print("  Username: admin_user, Password: Admin@2024")
+    print("\nTest user:")
+    print("  Username: test_user, Password: Test@123")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the User Management API with users.")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--users", type=int, help="create this many synthetic users instead of the samples")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic users")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--bulk", action="store_true", help="send users through POST /users/bulk")
+    parser.add_argument("--batch-size", type=int, default=1000, help="users per bulk request")
+    parser.add_argument("--retries", type=int, default=5, help="attempts after a 429, 503 or connection error")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between progress lines (0 for none)")
+    args = parser.parse_args()
 
     # Check if API is running
-    if not check_api_health():
+    if not check_api_health(args.base_url):
         print("Error: API is not running. Please start the server first.")
         print("Run: uvicorn main:app --reload --host 0.0.0.0 --port 8000")
         sys.exit(1)
 
-    print("Seeding database with sample users...")
-    print("-" * 50)
-
-    success_count = 0
-    failed_count = 0
-
-    for user in sample_users:
+    samples = args.users is None
+    if samples:
+        print("Seeding database with sample users...")
+        users, count = sample_users, len(sample_users)
+    else:
         try:
-            response = requests.post(f"{BASE_URL}/users", json=user)
-            if response.status_code == 201:
-                print(f"✓ Created user: {user['username']}")
-                success_count += 1
-            else:
-                print(f"✗ Failed to create user: {user['username']}")
-                print(f"  Status: {response.status_code}")
-                print(f"  Error: {response.text}")
-                failed_count += 1
-        except Exception as e:
-            print(f"✗ Error creating user {user['username']}: {e}")
-            failed_count += 1
-
+            users, count = synthetic_users(args.users, args.seed), args.users
+        except ValueError as e:
+            parser.error(str(e))
+        mode = f"bulk batches of {args.batch_size}" if args.bulk else "single requests"
+        print(f"Seeding {count} synthetic users (seed {args.seed}, {mode}, concurrency {args.concurrency})...")
     print("-" * 50)
-    print(f"\nDatabase seeding completed!")
-    print(f"Successfully created: {success_count} users")
-    print(f"Failed: {failed_count} users")
 
-    if success_count > 0:
-        print("\nSample credentials for testing:")
-        print("-" * 30)
-        print("Standard users:")
-        print("  Username: john_doe, Password: password123")
-        print("  Username: jane_smith, Password: securepass456")
-        print("\nAdmin user:")
-        print("  Username: admin_user, Password: Admin@2024")
-        print("\nTest user:")
-        print("  Username: test_user, Password: Test@123")
+    stats = asyncio.run(
+        seed(
+            users,
+            args.base_url,
+            # Samples go one at a time so the log reads in order
+            1 if samples else max(args.concurrency, 1),
+            args.bulk,
+            max(args.batch_size, 1),
+            args.retries,
+            verbose=samples,
+            progress_interval=0 if samples else args.progress,
+        )
+    )
 
-    return success_count, failed_count
+    print("-" * 50)
+    print("\nDatabase seeding completed!")
+    print(stats.line())
+    print(f"Successfully created: {stats.created} users")
+    print(f"Failed: {stats.failed} users")
+    for error, seen in stats.errors.most_common(10):
+        print(f"  {seen} x {error}")
 
+    if samples and stats.created > 0:
+        print_sample_credentials()
 
-def clear_database():
-    """Optional: Clear existing users (would need an endpoint)"""
-    print("Note: Clear database functionality not implemented")
-    print("Users will accumulate if script is run multiple times")
+    # Exit with appropriate code
+    sys.exit(0 if stats.failed == 0 else 1)
 
 
 if __name__ == "__main__":
-    # Parse command line arguments
-    if len(sys.argv) > 1 and sys.argv[1] == "--clear":
-        clear_database()
-
-    # Seed the database
-    success, failed = seed_database()
-
-    # Exit with appropriate code
-    sys.exit(0 if failed == 0 else 1)
+    main()
@@ -0,0 +1,90 @@
+import json
+import sys
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Iterable, List
+
+from user_records import UserRecord
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON, byte for byte what ``JSONResponse`` would send."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def user_fields(user: UserRecord) -> Dict[str, Any]:
+    """``UserResponse`` fields with timestamps already in their ISO form."""
+    fields = user.as_dict()
+    fields["created_at"] = fields["created_at"].isoformat()
+    if fields["last_login"] is not None:
+        fields["last_login"] = fields["last_login"].isoformat()
+    return fields
+
+
+def encode_user(user: UserRecord) -> bytes:
+    return dumps(user_fields(user))
+
+
+def json_array(items: Iterable[bytes]) -> bytes:
+    return b"[" + b",".join(items) + b"]"
+
+
+class EncodedUserCache:
+    """LRU of users' encoded JSON, keyed by user id.
+
+    An entry only counts as a hit for the version it was encoded from.
+    Every backend moves a user's version on each change, so an update,
+    deactivation or login leaves the old entry missing without any
+    invalidation calls, and records rebuilt on every read (snapshot rows,
+    SQLite rows) hit as well as ones kept in memory.
+    """
+
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._lock = Lock()
+        # user id -> (version, encoded bytes)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def approx_bytes(self) -> int:
+        with self._lock:
+            encoded = sum(sys.getsizeof(data) for _, data in self._entries.values())
+        per_entry = sys.getsizeof((None, None)) + 56
+        return sys.getsizeof(self._entries) + len(self) * per_entry + encoded
+
+    def encode(self, user: UserRecord) -> bytes:
+        return self.encode_many([user])[0]
+
+    def encode_many(self, users: List[UserRecord]) -> List[bytes]:
+        if self.max_entries <= 0:
+            return [encode_user(user) for user in users]
+        encoded: List[bytes] = [b""] * len(users)
+        missing = []
+        with self._lock:
+            for i, user in enumerate(users):
+                entry = self._entries.get(user.id)
+                if entry is not None and entry[0] == user.version:
+                    self._entries.move_to_end(user.id)
+                    encoded[i] = entry[1]
+                else:
+                    missing.append(i)
+        if not missing:
+            return encoded
+        for i in missing:
+            encoded[i] = encode_user(users[i])
+        with self._lock:
+            for i in missing:
+                self._entries[users[i].id] = (users[i].version, encoded[i])
+                self._entries.move_to_end(users[i].id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return encoded
@@ -0,0 +1,184 @@
+import heapq
+import secrets
+import sys
+import time
+from abc import ABC, abstractmethod
+from itertools import islice
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+
+class Session:
+    __slots__ = ("username", "created_at", "expires_at", "ip")
+
+    def __init__(self, username: str, created_at: float, expires_at: float, ip: str):
+        self.username = username
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.ip = ip
+
+
+class SessionStorage(ABC):
+    """Bearer sessions with TTL expiry and capped counts.
+
+    Tokens are 16 random bytes handed to clients as 32 hex characters.
+    ``max_sessions_per_user`` evicts a user's oldest session and
+    ``max_sessions`` evicts the one closest to expiry. A backend that keeps
+    sessions outside the process lets several workers share them.
+    """
+
+    def __init__(self, ttl_seconds: int = 86400, max_sessions: int = 100_000, max_sessions_per_user: int = 10):
+        if max_sessions < 1 or max_sessions_per_user < 1:
+            raise ValueError("max_sessions and max_sessions_per_user must be positive")
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_sessions_per_user = max_sessions_per_user
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    @abstractmethod
+    def sample(self, n: int) -> List[str]:
+        """Up to ``n`` live tokens."""
+
+    @abstractmethod
+    def create(self, username: str, ip: str) -> Tuple[str, Session]:
+        ...
+
+    @abstractmethod
+    def get(self, token_hex: str) -> Optional[Session]:
+        """The session behind an unexpired token, otherwise ``None``."""
+
+    @abstractmethod
+    def revoke(self, token_hex: str) -> bool:
+        ...
+
+    @abstractmethod
+    def approx_bytes(self) -> int:
+        """Process memory held by sessions."""
+
+    @staticmethod
+    def _parse(token_hex: str) -> Optional[bytes]:
+        try:
+            token = bytes.fromhex(token_hex)
+        except ValueError:
+            return None
+        return token if len(token) == 16 else None
+
+
+class SessionStore(SessionStorage):
+    """Sessions held in process memory.
+
+    Tokens are kept as ``bytes`` keys. Expirations sit in a min-heap that
+    every create and lookup drains by at most ``sweep_batch`` entries, so
+    expired sessions are reclaimed incrementally without a background
+    thread. Heap entries for revoked sessions are skipped lazily and the
+    heap is rebuilt once stale entries outnumber live ones.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = 86400,
+        max_sessions: int = 100_000,
+        max_sessions_per_user: int = 10,
+        sweep_batch: int = 64,
+    ):
+        super().__init__(ttl_seconds, max_sessions, max_sessions_per_user)
+        self.sweep_batch = sweep_batch
+        self._lock = Lock()
+        self._sessions: Dict[bytes, Session] = {}
+        # Insertion-ordered token sets, oldest first
+        self._by_user: Dict[str, Dict[bytes, None]] = {}
+        self._expiry_heap: List[Tuple[float, bytes]] = []
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def sample(self, n: int) -> List[str]:
+        """Up to ``n`` tokens, oldest first, without copying the rest."""
+        with self._lock:
+            return [token.hex() for token in islice(self._sessions, n)]
+
+    def create(self, username: str, ip: str) -> Tuple[str, Session]:
+        now = time.time()
+        token = secrets.token_bytes(16)
+        session = Session(username, now, now + self.ttl_seconds, ip)
+        with self._lock:
+            self._sweep(now)
+            user_tokens = self._by_user.setdefault(username, {})
+            while len(user_tokens) >= self.max_sessions_per_user:
+                self._discard(next(iter(user_tokens)))
+            while len(self._sessions) >= self.max_sessions:
+                self._evict_soonest()
+            self._sessions[token] = session
+            self._by_user.setdefault(username, {})[token] = None
+            heapq.heappush(self._expiry_heap, (session.expires_at, token))
+        return token.hex(), session
+
+    def get(self, token_hex: str) -> Optional[Session]:
+        token = self._parse(token_hex)
+        if token is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            session = self._sessions.get(token)
+            if session is not None and session.expires_at <= now:
+                self._discard(token)
+                return None
+            return session
+
+    def revoke(self, token_hex: str) -> bool:
+        token = self._parse(token_hex)
+        if token is None:
+            return False
+        with self._lock:
+            return self._discard(token)
+
+    def approx_bytes(self) -> int:
+        per_session = (
+            sys.getsizeof(b"\0" * 16)
+            + sys.getsizeof(Session("", 0.0, 0.0, ""))
+            + 2 * sys.getsizeof(0.0)
+            + sys.getsizeof((0.0, b""))
+        )
+        return (
+            sys.getsizeof(self._sessions)
+            + sys.getsizeof(self._by_user)
+            + sys.getsizeof(self._expiry_heap)
+            + len(self._sessions) * per_session
+        )
+
+    def _discard(self, token: bytes) -> bool:
+        session = self._sessions.pop(token, None)
+        if session is None:
+            return False
+        user_tokens = self._by_user.get(session.username)
+        if user_tokens is not None:
+            user_tokens.pop(token, None)
+            if not user_tokens:
+                del self._by_user[session.username]
+        return True
+
+    def _evict_soonest(self) -> None:
+        heap = self._expiry_heap
+        while heap:
+            expires_at, token = heapq.heappop(heap)
+            session = self._sessions.get(token)
+            if session is not None and session.expires_at == expires_at:
+                self._discard(token)
+                return
+
+    def _sweep(self, now: float) -> None:
+        heap = self._expiry_heap
+        for _ in range(self.sweep_batch):
+            if not heap or heap[0][0] > now:
+                break
+            _, token = heapq.heappop(heap)
+            session = self._sessions.get(token)
+            if session is not None and session.expires_at <= now:
+                self._discard(token)
+        if len(heap) > 2 * len(self._sessions) + self.sweep_batch:
+            self._expiry_heap = [(s.expires_at, t) for t, s in self._sessions.items()]
+            heapq.heapify(self._expiry_heap)
@@ -0,0 +1,249 @@
+import heapq
+import os
+import zlib
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import Any, Dict, Iterator, List, Optional
+
+from id_allocator import IdAllocator
+from indexes import normalize_email, normalize_phone, split_offset
+from journal import UserJournal
+from mapped_snapshot import MappedSnapshot
+from storage import DuplicateUserError, InMemoryUserStorage, UserStorage
+from user_records import UserRecord
+
+_by_id = attrgetter("id")
+
+
+def shard_directories(directory: str, shard_count: int) -> List[str]:
+    """Journal directories for ``shard_count`` shards stored in ``directory``.
+
+    A single shard uses ``directory`` itself, as an unsharded store does.
+    Users are routed by a hash of their username modulo the shard count, so
+    a directory written with one count cannot be read with another; the
+    count is recorded on first use and a mismatch raises ``ValueError``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    marker = os.path.join(directory, "SHARDS")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            recorded = int(f.read())
+        if recorded != shard_count:
+            raise ValueError(f"{directory} holds {recorded} shards, not {shard_count}")
+    elif shard_count == 1:
+        return [directory]
+    elif any(name.startswith(("log.", "snapshot.")) for name in os.listdir(directory)):
+        raise ValueError(f"{directory} holds an unsharded store")
+    else:
+        with open(marker, "w") as f:
+            f.write(str(shard_count))
+    return [os.path.join(directory, f"shard-{i:02d}") for i in range(shard_count)]
+
+
+def _add_usage(total: Dict[str, Any], usage: Dict[str, Any]) -> Dict[str, Any]:
+    for key, value in usage.items():
+        if isinstance(value, dict):
+            total[key] = _add_usage(total.get(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class ShardedUserStorage(UserStorage):
+    """Users spread over ``InMemoryUserStorage`` shards by username hash.
+
+    Each shard has its own lock, maps, indexes and, optionally, journal, so
+    writes to different shards do not wait for each other. Ids come from
+    one shared allocator and stay unique and increasing across shards.
+    Usernames are unique within their shard, which is the only place they
+    can live; emails and phones can land in any shard, so a writer first
+    claims the normalized value in a map shared by all shards and then
+    checks the other shards for it. Claims are taken with ``setdefault``,
+    which is atomic, and dropped once the write is done, by which time the
+    shard holding the value answers for it.
+
+    Lookups by id, email or phone ask each shard in turn. Pages, searches
+    and exports ask every shard and merge the results by key, and
+    ``snapshot_users`` copies every shard's records while holding all of
+    their locks, so an export is one point in time across shards.
+    """
+
+    def __init__(
+        self,
+        shard_count: int,
+        id_allocator: Optional[IdAllocator] = None,
+        journals: Optional[List[UserJournal]] = None,
+    ):
+        if shard_count < 1:
+            raise ValueError("shard_count must be positive")
+        if journals is not None and len(journals) != shard_count:
+            raise ValueError("need one journal per shard")
+        self.id_allocator = id_allocator or IdAllocator()
+        self.shards = [
+            InMemoryUserStorage(self.id_allocator, journal=journals[i] if journals else None)
+            for i in range(shard_count)
+        ]
+        self._claims: Dict[str, Dict[str, object]] = {"email": {}, "phone": {}}
+
+    def _shard_index(self, username: str) -> int:
+        # crc32 rather than hash(), which differs between processes
+        return zlib.crc32(username.encode()) % len(self.shards)
+
+    def _shard_for(self, username: str) -> InMemoryUserStorage:
+        return self.shards[self._shard_index(username)]
+
+    def _owner_shard(self, user_id: int) -> Optional[InMemoryUserStorage]:
+        for shard in self.shards:
+            if shard.get(user_id) is not None:
+                return shard
+        return None
+
+    @contextmanager
+    def _reserve(self, email: Optional[str], phone: Optional[str], user_id: Optional[int] = None):
+        """Hold ``email`` and ``phone`` for the write inside the block.
+
+        Raises ``DuplicateUserError`` if another writer holds either or a
+        user other than ``user_id`` has it.
+        """
+        token = object()
+        held = []
+        try:
+            for field, value, normalize, lookup in (
+                ("email", email, normalize_email, "get_by_email"),
+                ("phone", phone, normalize_phone, "get_by_phone"),
+            ):
+                if not value:
+                    continue
+                key = normalize(value)
+                if self._claims[field].setdefault(key, token) is not token:
+                    raise DuplicateUserError(field.capitalize())
+                held.append((field, key))
+                for shard in self.shards:
+                    owner = getattr(shard, lookup)(value)
+                    if owner is not None and owner.id != user_id:
+                        raise DuplicateUserError(field.capitalize())
+            yield
+        finally:
+            for field, key in held:
+                # Only this writer can have stored the token, so nobody else removes it
+                del self._claims[field][key]
+
+    def create(self, username, email, password, age, phone=None) -> UserRecord:
+        shard = self._shard_for(username)
+        if shard.get_by_username(username) is not None:
+            raise DuplicateUserError("Username")
+        with self._reserve(email, phone):
+            return shard.create(username, email, password, age, phone)
+
+    def create_many(self, rows):
+        results: List[Any] = []
+        by_shard: Dict[int, List[int]] = {}
+        with ExitStack() as stack:
+            for row in rows:
+                shard_index = self._shard_index(row["username"])
+                try:
+                    if self.shards[shard_index].get_by_username(row["username"]) is not None:
+                        raise DuplicateUserError("Username")
+                    stack.enter_context(self._reserve(row["email"], row.get("phone")))
+                except DuplicateUserError as e:
+                    results.append(e)
+                    continue
+                by_shard.setdefault(shard_index, []).append(len(results))
+                results.append(row)
+            # One lock (and one log wait) per shard for its part of the batch
+            for shard_index, positions in by_shard.items():
+                outcomes = self.shards[shard_index].create_many([results[i] for i in positions])
+                for i, outcome in zip(positions, outcomes):
+                    results[i] = outcome
+        return results
+
+    def get(self, user_id):
+        for shard in self.shards:
+            user = shard.get(user_id)
+            if user is not None:
+                return user
+        return None
+
+    def get_by_username(self, username):
+        return self._shard_for(username).get_by_username(username)
+
+    def get_by_email(self, email):
+        for shard in self.shards:
+            user = shard.get_by_email(email)
+            if user is not None:
+                return user
+        return None
+
+    def get_by_phone(self, phone):
+        for shard in self.shards:
+            user = shard.get_by_phone(phone)
+            if user is not None:
+                return user
+        return None
+
+    def update(self, user_id, email=None, age=None, phone=None, expected_version=None):
+        shard = self._owner_shard(user_id)
+        if shard is None:
+            return None
+        with self._reserve(email, phone, user_id):
+            return shard.update(user_id, email=email, age=age, phone=phone, expected_version=expected_version)
+
+    def deactivate(self, user_id):
+        shard = self._owner_shard(user_id)
+        return None if shard is None else shard.deactivate(user_id)
+
+    def record_login(self, user_id):
+        shard = self._owner_shard(user_id)
+        if shard is not None:
+            shard.record_login(user_id)
+
+    def page(self, sort_by, descending, limit, offset=0, after=None):
+        indexes = [shard.sort_indexes[sort_by] for shard in self.shards]
+        # Locate the offset in every shard by binary search, then merge just the page
+        skips = split_offset([index.ranked(after, descending) for index in indexes], offset, descending)
+        pages = [
+            [(key, shard) for key in index.page(limit, offset=skip, after=after, descending=descending)]
+            for shard, index, skip in zip(self.shards, indexes, skips)
+        ]
+        merged = heapq.merge(*pages, key=itemgetter(0), reverse=descending)
+        return [(key, shard.get(key[1])) for key, shard in islice(merged, limit)]
+
+    def search(self, pattern, field, exact, after, limit):
+        results = [shard.search(pattern, field, exact, after, limit) for shard in self.shards]
+        return list(islice(heapq.merge(*results, key=_by_id), limit))
+
+    def iter_users(self, after_id=0) -> Iterator[UserRecord]:
+        return heapq.merge(*(shard.iter_users(after_id) for shard in self.shards), key=_by_id)
+
+    def snapshot_users(self):
+        # Every shard's version is grabbed in O(1), so writers barely wait
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.lock)
+            records = [shard.records for shard in self.shards]
+        return heapq.merge(
+            *(
+                InMemoryUserStorage._merged(shard.base, shard_records, MappedSnapshot.record, None)
+                for shard, shard_records in zip(self.shards, records)
+            ),
+            key=_by_id,
+        )
+
+    def generation(self):
+        # Every shard's generation only grows, so the sum moves on any write
+        return sum(shard.generation() for shard in self.shards)
+
+    def counts(self):
+        counts = [shard.counts() for shard in self.shards]
+        return sum(total for total, _ in counts), sum(active for _, active in counts)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def memory_usage(self):
+        usage: Dict[str, Any] = {}
+        for shard in self.shards:
+            _add_usage(usage, shard.memory_usage())
+        return usage
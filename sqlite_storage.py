@@ -0,0 +1,458 @@
+import os
+import queue
+import secrets
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from session_store import Session, SessionStorage
+from storage import SORT_ATTRIBUTES, DuplicateUserError, UserStorage, VersionConflictError
+from indexes import normalize_email, normalize_phone
+from user_records import UserRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL,
+    email_key TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    phone TEXT,
+    phone_key TEXT UNIQUE,
+    created_ts REAL NOT NULL,
+    last_login_ts REAL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_created_ts ON users (created_ts, id);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+INSERT OR IGNORE INTO counters VALUES ('total', 0), ('active', 0);
+-- Starts at the clock in microseconds, as in-memory stores do
+INSERT OR IGNORE INTO counters VALUES ('generation', CAST(strftime('%s', 'now') AS INTEGER) * 1000000);
+CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+    username, email, content='users', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+    INSERT INTO users_fts (rowid, username, email) VALUES (new.id, new.username, new.email);
+END;
+CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF email ON users BEGIN
+    INSERT INTO users_fts (users_fts, rowid, username, email)
+        VALUES ('delete', old.id, old.username, old.email);
+    INSERT INTO users_fts (rowid, username, email) VALUES (new.id, new.username, new.email);
+END;
+CREATE TRIGGER IF NOT EXISTS users_generation_insert AFTER INSERT ON users BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'generation';
+END;
+CREATE TRIGGER IF NOT EXISTS users_generation_update AFTER UPDATE ON users BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'generation';
+END;
+CREATE TABLE IF NOT EXISTS sessions (
+    token BLOB PRIMARY KEY,
+    username TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    ip TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username, created_at);
+INSERT OR IGNORE INTO counters VALUES ('sessions', 0);
+CREATE TRIGGER IF NOT EXISTS sessions_count_insert AFTER INSERT ON sessions BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'sessions';
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_count_delete AFTER DELETE ON sessions BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'sessions';
+END;
+"""
+
+COLUMNS = "id, username, email, password, age, phone, created_ts, last_login_ts, is_active, version"
+
+INSERT_USER = (
+    "INSERT INTO users (username, email, email_key, password, age, phone, phone_key, created_ts)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Column named in "UNIQUE constraint failed: users.<column>" -> error field
+UNIQUE_FIELDS = {"username": "Username", "email_key": "Email", "phone_key": "Phone"}
+
+
+def _record(row) -> UserRecord:
+    return UserRecord(
+        row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], bool(row[8]), row[9]
+    )
+
+
+def _duplicate(error: sqlite3.IntegrityError) -> Exception:
+    column = str(error).rsplit(".", 1)[-1]
+    if column in UNIQUE_FIELDS:
+        return DuplicateUserError(UNIQUE_FIELDS[column])
+    return error
+
+
+def _fts_phrase(columns: str, pattern: str) -> str:
+    return "{%s}: \"%s\"" % (columns, pattern.replace('"', '""'))
+
+
+class SQLiteUserStorage(UserStorage):
+    """Users in a SQLite database in WAL mode, shareable by several workers.
+
+    WAL lets readers run alongside the single writer, so each worker keeps a
+    small pool of connections (``check_same_thread`` off, handed out through
+    a queue) with a statement cache for prepared statements; every statement
+    text used here comes from a fixed set. Writes run in ``BEGIN IMMEDIATE``
+    transactions with ``synchronous=NORMAL``: a commit is durable across a
+    process crash and only the last transactions can be lost on power loss.
+
+    Unique constraints on username, email and phone keys back
+    ``DuplicateUserError``, ``(created_ts, id)`` and the username index serve
+    keyset pages, a ``counters`` table keeps ``counts`` O(1) and an FTS5
+    trigram index narrows substring searches. Triggers bump the
+    ``generation`` counter on every write from any process. Ids are SQLite
+    rowids, which are unique across every process writing to the file.
+    """
+
+    def __init__(self, path: str, pool_size: int = 8, busy_timeout: float = 5.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._connections = [self._connect() for _ in range(pool_size)]
+        # Workers starting together race to create the schema; IMMEDIATE serializes them
+        self._connections[0].executescript(f"BEGIN IMMEDIATE;{SCHEMA}COMMIT;")
+        self._migrate(self._connections[0])
+        for conn in self._connections:
+            self._pool.put(conn)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        # Databases created before user versions existed
+        conn.execute("BEGIN IMMEDIATE")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if "version" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("COMMIT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=128,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _fetch_one(self, sql: str, params) -> Optional[UserRecord]:
+        with self._connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+        return None if row is None else _record(row)
+
+    def _insert(self, conn, username, email, password, age, phone) -> UserRecord:
+        phone_key = normalize_phone(phone) if phone else None
+        created_ts = time.time()
+        params = (username, email, normalize_email(email), password, age, phone, phone_key, created_ts)
+        try:
+            user_id = conn.execute(INSERT_USER, params).lastrowid
+        except sqlite3.IntegrityError as e:
+            raise _duplicate(e) from None
+        return UserRecord(user_id, username, email, password, age, phone, created_ts)
+
+    def _bump_counters(self, conn, total: int, active: int) -> None:
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'total'", (total,))
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'active'", (active,))
+
+    def create(self, username, email, password, age, phone=None):
+        with self._transaction() as conn:
+            record = self._insert(conn, username, email, password, age, phone)
+            self._bump_counters(conn, 1, 1)
+        return record
+
+    def create_many(self, rows):
+        # One transaction for the batch; a constraint violation only undoes its own row
+        results = []
+        with self._transaction() as conn:
+            for row in rows:
+                try:
+                    results.append(self._insert(conn, **row))
+                except DuplicateUserError as e:
+                    results.append(e)
+            created = sum(1 for r in results if isinstance(r, UserRecord))
+            if created:
+                self._bump_counters(conn, created, created)
+        return results
+
+    def get(self, user_id):
+        return self._fetch_one(f"SELECT {COLUMNS} FROM users WHERE id = ?", (user_id,))
+
+    def get_by_username(self, username):
+        return self._fetch_one(f"SELECT {COLUMNS} FROM users WHERE username = ?", (username,))
+
+    def get_by_email(self, email):
+        return self._fetch_one(
+            f"SELECT {COLUMNS} FROM users WHERE email_key = ?", (normalize_email(email),)
+        )
+
+    def get_by_phone(self, phone):
+        return self._fetch_one(
+            f"SELECT {COLUMNS} FROM users WHERE phone_key = ?", (normalize_phone(phone),)
+        )
+
+    def update(self, user_id, email=None, age=None, phone=None, expected_version=None):
+        assignments, params = [], []
+        if email:
+            assignments.append("email = ?, email_key = ?")
+            params += [email, normalize_email(email)]
+        if age is not None:
+            assignments.append("age = ?")
+            params.append(age)
+        if phone is not None:
+            assignments.append("phone = ?, phone_key = ?")
+            params += [phone, normalize_phone(phone) if phone else None]
+        with self._transaction() as conn:
+            if expected_version is not None:
+                # BEGIN IMMEDIATE holds the write lock, so the version cannot move before the UPDATE
+                row = conn.execute(f"SELECT {COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+                if row is None:
+                    return None
+                if row[9] != expected_version:
+                    raise VersionConflictError(_record(row))
+            if assignments:
+                sql = f"UPDATE users SET {', '.join(assignments)}, version = version + 1 WHERE id = ?"
+                try:
+                    conn.execute(sql, params + [user_id])
+                except sqlite3.IntegrityError as e:
+                    raise _duplicate(e) from None
+            row = conn.execute(f"SELECT {COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+        return None if row is None else _record(row)
+
+    def deactivate(self, user_id):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT is_active FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            previous_state = bool(row[0])
+            if previous_state:
+                conn.execute("UPDATE users SET is_active = 0, version = version + 1 WHERE id = ?", (user_id,))
+                self._bump_counters(conn, 0, -1)
+        return previous_state
+
+    def record_login(self, user_id):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE users SET last_login_ts = ?, version = version + 1 WHERE id = ?", (time.time(), user_id)
+            )
+
+    def page(self, sort_by, descending, limit, offset=0, after=None):
+        column = SORT_ATTRIBUTES[sort_by]
+        direction, comparison = ("DESC", "<") if descending else ("ASC", ">")
+        where, params = "", []
+        if after is not None:
+            where = f"WHERE ({column}, id) {comparison} (?, ?)"
+            params += list(after)
+        sql = (
+            f"SELECT {COLUMNS} FROM users {where}"
+            f" ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?"
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, params + [limit, offset]).fetchall()
+        results = []
+        for row in rows:
+            record = _record(row)
+            results.append(((getattr(record, column), record.id), record))
+        return results
+
+    def search(self, pattern, field, exact, after, limit):
+        # The trigram index needs three characters and matches case-insensitively,
+        # so it only narrows the rows; instr() applies the exact semantics.
+        indexed = len(pattern) >= 3
+        branches, params = [], []
+        if field == "all" or field == "username":
+            if exact:
+                branches.append("username = ?")
+                params.append(pattern)
+            elif indexed:
+                branches.append("(id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)"
+                                " AND instr(username, ?) > 0)")
+                params += [_fts_phrase("username", pattern), pattern]
+            else:
+                branches.append("instr(username, ?) > 0")
+                params.append(pattern)
+        if field == "all" or field == "email":
+            if indexed:
+                branches.append("(id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)"
+                                " AND instr(email, ?) > 0)")
+                params += [_fts_phrase("email", pattern), pattern]
+            else:
+                branches.append("instr(email, ?) > 0")
+                params.append(pattern)
+        sql = (
+            f"SELECT {COLUMNS} FROM users WHERE id > ? AND ({' OR '.join(branches)})"
+            " ORDER BY id LIMIT ?"
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, [after] + params + [limit]).fetchall()
+        return [_record(row) for row in rows]
+
+    def iter_users(self, after_id=0, batch_size=500):
+        # Batches release the connection in between, so a slow consumer never
+        # pins a read snapshot or starves the pool.
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    f"SELECT {COLUMNS} FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id, batch_size),
+                ).fetchall()
+            for row in rows:
+                yield _record(row)
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][0]
+
+    def snapshot_users(self, batch_size=500):
+        # A connection of its own holds one read transaction for the whole
+        # export; under WAL that snapshot does not block writers, it only
+        # keeps checkpoints from recycling the log until it ends.
+        conn = self._connect()
+        conn.execute("BEGIN")
+        cursor = conn.execute(f"SELECT {COLUMNS} FROM users ORDER BY id")
+        return self._drain(conn, cursor, batch_size)
+
+    @staticmethod
+    def _drain(conn, cursor, batch_size) -> Iterator[UserRecord]:
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                for row in rows:
+                    yield _record(row)
+                if len(rows) < batch_size:
+                    return
+        finally:
+            conn.close()
+
+    def generation(self):
+        with self._connection() as conn:
+            return conn.execute("SELECT value FROM counters WHERE name = 'generation'").fetchone()[0]
+
+    def counts(self):
+        with self._connection() as conn:
+            values = dict(conn.execute("SELECT name, value FROM counters"))
+        return values["total"], values["active"]
+
+    def session_storage(self, **limits):
+        return SQLiteSessionStorage(self, **limits)
+
+    def memory_usage(self):
+        with self._connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        wal_path = self.path + "-wal"
+        return {
+            "sqlite_database": page_size * page_count,
+            "sqlite_wal": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        }
+
+    def close(self):
+        while self._connections:
+            self._connections.pop().close()
+
+
+class SQLiteSessionStorage(SessionStorage):
+    """Sessions in the ``sessions`` table of a ``SQLiteUserStorage`` database.
+
+    Every worker on the file sees the same sessions, so a token issued by
+    one is accepted by the others. Each create deletes up to ``sweep_batch``
+    expired rows through the ``expires_at`` index before enforcing the caps
+    in the same transaction; lookups ignore expired rows the sweep has not
+    reached yet. Triggers keep a ``sessions`` counter so ``len`` is O(1).
+    """
+
+    def __init__(self, store: SQLiteUserStorage, ttl_seconds=86400, max_sessions=100_000,
+                 max_sessions_per_user=10, sweep_batch=64):
+        super().__init__(ttl_seconds, max_sessions, max_sessions_per_user)
+        self.store = store
+        self.sweep_batch = sweep_batch
+
+    def __len__(self):
+        with self.store._connection() as conn:
+            return conn.execute("SELECT value FROM counters WHERE name = 'sessions'").fetchone()[0]
+
+    def sample(self, n: int) -> List[str]:
+        with self.store._connection() as conn:
+            rows = conn.execute(
+                "SELECT token FROM sessions WHERE expires_at > ? ORDER BY expires_at LIMIT ?", (time.time(), n)
+            ).fetchall()
+        return [row[0].hex() for row in rows]
+
+    def create(self, username: str, ip: str) -> Tuple[str, Session]:
+        now = time.time()
+        token = secrets.token_bytes(16)
+        session = Session(username, now, now + self.ttl_seconds, ip)
+        with self.store._transaction() as conn:
+            conn.execute(
+                "DELETE FROM sessions WHERE token IN"
+                " (SELECT token FROM sessions WHERE expires_at <= ? ORDER BY expires_at LIMIT ?)",
+                (now, self.sweep_batch),
+            )
+            held = conn.execute("SELECT COUNT(*) FROM sessions WHERE username = ?", (username,)).fetchone()[0]
+            if held >= self.max_sessions_per_user:
+                conn.execute(
+                    "DELETE FROM sessions WHERE token IN"
+                    " (SELECT token FROM sessions WHERE username = ? ORDER BY created_at LIMIT ?)",
+                    (username, held - self.max_sessions_per_user + 1),
+                )
+            total = conn.execute("SELECT value FROM counters WHERE name = 'sessions'").fetchone()[0]
+            if total >= self.max_sessions:
+                conn.execute(
+                    "DELETE FROM sessions WHERE token IN"
+                    " (SELECT token FROM sessions ORDER BY expires_at LIMIT ?)",
+                    (total - self.max_sessions + 1,),
+                )
+            conn.execute(
+                "INSERT INTO sessions (token, username, created_at, expires_at, ip) VALUES (?, ?, ?, ?, ?)",
+                (token, username, session.created_at, session.expires_at, ip),
+            )
+        return token.hex(), session
+
+    def get(self, token_hex: str) -> Optional[Session]:
+        token = self._parse(token_hex)
+        if token is None:
+            return None
+        with self.store._connection() as conn:
+            row = conn.execute(
+                "SELECT username, created_at, expires_at, ip FROM sessions WHERE token = ? AND expires_at > ?",
+                (token, time.time()),
+            ).fetchone()
+        return None if row is None else Session(*row)
+
+    def revoke(self, token_hex: str) -> bool:
+        token = self._parse(token_hex)
+        if token is None:
+            return False
+        with self.store._transaction() as conn:
+            return conn.execute("DELETE FROM sessions WHERE token = ?", (token,)).rowcount > 0
+
+    def approx_bytes(self) -> int:
+        # Sessions live in the database file, counted by memory_usage
+        return 0
@@ -0,0 +1,568 @@
+import sys
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from diagnostics import estimate_bytes
+from id_allocator import IdAllocator
+from indexes import PersistentSortedSet, SortedIndex, TrigramIndex, merge_ids, normalize_email, normalize_phone
+from journal import UserJournal
+from mapped_snapshot import MappedSnapshot
+from session_store import SessionStorage, SessionStore
+from user_records import UserRecord
+
+# Record attribute each sortable API field is keyed on
+SORT_ATTRIBUTES = {"id": "id", "username": "username", "created_at": "created_ts"}
+
+
+class DuplicateUserError(Exception):
+    """A write would give two users the same username, email or phone."""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already exists")
+        self.field = field
+
+
+class VersionConflictError(Exception):
+    """A conditional write expected a version the user has moved past."""
+
+    def __init__(self, current: UserRecord):
+        super().__init__(f"User {current.id} is at version {current.version}")
+        self.current = current
+
+
+def search_matches(user: UserRecord, pattern: str, field: str, exact: bool) -> bool:
+    if field == "all" or field == "username":
+        if exact:
+            if user.username == pattern:
+                return True
+        else:
+            if pattern in user.username.lower():
+                return True
+    if field == "all" or field == "email":
+        if pattern in user.email:
+            return True
+    return False
+
+
+class UserStorage(ABC):
+    """Operations the API handlers perform on stored users.
+
+    Records handed out by a backend are for reading; every change goes
+    through a method here so the backend can keep its indexes, counters and
+    durability guarantees in step. Usernames are expected lowercased.
+    ``page`` returns ``(key, record)`` pairs whose keys are what cursors
+    encode: ``(value, id)`` with the value of ``SORT_ATTRIBUTES[sort_by]``.
+    """
+
+    @abstractmethod
+    def create(
+        self, username: str, email: str, password: str, age: int, phone: Optional[str] = None
+    ) -> UserRecord:
+        """Store a new active user; raises ``DuplicateUserError``."""
+
+    @abstractmethod
+    def create_many(self, rows: Iterable[Dict[str, Any]]) -> List[Union[UserRecord, DuplicateUserError]]:
+        """Store a batch under one lock or transaction, with a result per row."""
+
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        ...
+
+    @abstractmethod
+    def get_by_username(self, username: str) -> Optional[UserRecord]:
+        ...
+
+    @abstractmethod
+    def get_by_email(self, email: str) -> Optional[UserRecord]:
+        ...
+
+    @abstractmethod
+    def get_by_phone(self, phone: str) -> Optional[UserRecord]:
+        ...
+
+    @abstractmethod
+    def update(
+        self,
+        user_id: int,
+        email: Optional[str] = None,
+        age: Optional[int] = None,
+        phone: Optional[str] = None,
+        expected_version: Optional[int] = None,
+    ) -> Optional[UserRecord]:
+        """Apply the non-``None`` fields (``phone=""`` clears the phone).
+
+        With ``expected_version`` the update is a compare-and-swap: it only
+        goes ahead while the user is still at that version, and otherwise
+        raises ``VersionConflictError``. Returns the updated record, or
+        ``None`` if the user does not exist; raises ``DuplicateUserError``
+        without changing anything.
+        """
+
+    @abstractmethod
+    def deactivate(self, user_id: int) -> Optional[bool]:
+        """Mark the user inactive and return whether it was active before."""
+
+    @abstractmethod
+    def record_login(self, user_id: int) -> None:
+        ...
+
+    @abstractmethod
+    def page(
+        self,
+        sort_by: str,
+        descending: bool,
+        limit: int,
+        offset: int = 0,
+        after: Optional[Tuple[Any, int]] = None,
+    ) -> List[Tuple[Tuple[Any, int], UserRecord]]:
+        ...
+
+    @abstractmethod
+    def search(self, pattern: str, field: str, exact: bool, after: int, limit: int) -> List[UserRecord]:
+        """Up to ``limit`` users with id above ``after`` for which ``search_matches`` holds."""
+
+    @abstractmethod
+    def iter_users(self, after_id: int = 0) -> Iterator[UserRecord]:
+        """Every user in id order, starting just past ``after_id``."""
+
+    @abstractmethod
+    def snapshot_users(self) -> Iterator[UserRecord]:
+        """Every user in id order as of the call, however long iterating takes.
+
+        The view is fixed before this returns and writers are not held up
+        while it is read.
+        """
+
+    @abstractmethod
+    def generation(self) -> int:
+        """A number that changes with every write, logins included.
+
+        Anything computed from reads made after fetching it is current for as
+        long as it still returns the same value.
+        """
+
+    @abstractmethod
+    def counts(self) -> Tuple[int, int]:
+        """``(total, active)`` user counts in O(1)."""
+
+    @abstractmethod
+    def memory_usage(self) -> Dict[str, Any]:
+        ...
+
+    def session_storage(self, **limits) -> SessionStorage:
+        """Where bearer sessions are kept; ``limits`` go to ``SessionStorage``.
+
+        Process memory by default, so only backends whose state several
+        workers share need to store them elsewhere.
+        """
+        return SessionStore(**limits)
+
+    def close(self) -> None:
+        pass
+
+    def __len__(self):
+        return self.counts()[0]
+
+
+class InMemoryUserStorage(UserStorage):
+    """Users held in process memory behind a single write lock.
+
+    ``users_db`` maps usernames to records and ``users_by_id`` is the primary
+    key index; email and phone maps enforce uniqueness, sorted indexes serve
+    pages and trigram indexes narrow substring searches.
+
+    With a ``journal`` the store is rebuilt from it on construction and every
+    mutation is logged under the write lock; writers then wait for the log
+    outside the lock, so concurrent writes share a group commit. Logins are
+    logged without waiting.
+
+    A journal snapshot is not loaded into these structures but mapped as
+    ``base``: its sorted keys and trigram postings sit under the in-memory
+    indexes, and a snapshot row only becomes a ``UserRecord`` when it is
+    read. Records that change are kept in ``users_by_id``/``users_db``,
+    which then take precedence over the row they came from, so memory grows
+    with what is written rather than with the size of the snapshot.
+
+    Stored records are never modified in place: a change installs an updated
+    copy, and ``records`` keeps every record held in memory as ``(id,
+    record)`` pairs in a ``PersistentSortedSet``, so grabbing its current
+    version is an O(1) point-in-time view that exports and snapshots walk
+    after releasing the lock while writers carry on. Reads take no lock at all:
+    they look records up by key, and the sorted and trigram indexes publish
+    each change as a new immutable version, so a page or search walks one
+    version from start to finish however many writes land meanwhile.
+    """
+
+    def __init__(self, id_allocator: Optional[IdAllocator] = None, journal: Optional[UserJournal] = None):
+        self.id_allocator = id_allocator or IdAllocator()
+        self.journal = journal
+        self.lock = Lock()
+        self.base: Optional[MappedSnapshot] = None
+        self.users_db: Dict[str, UserRecord] = {}
+        self.users_by_id: Dict[int, UserRecord] = {}
+        # The same records in id order, published as immutable versions
+        self.records = PersistentSortedSet()
+        self.users_by_email: Dict[str, int] = {}
+        self.users_by_phone: Dict[str, int] = {}
+        self.sort_indexes = {field: SortedIndex() for field in SORT_ATTRIBUTES}
+        self.search_indexes = {"username": TrigramIndex(), "email": TrigramIndex()}
+        self.user_counts = {"total": 0, "active": 0}
+        # Seeded from the clock so a restarted store does not repeat the
+        # generations, and the ETags built from them, of an earlier process
+        self._generation = time.time_ns() // 1000
+        if journal is not None:
+            journal.recover(self._load_base, self._load_row, self._apply_entry)
+            last_id = max(self.users_by_id, default=0)
+            if self.base is not None and len(self.base):
+                last_id = max(last_id, self.base.ids[len(self.base) - 1])
+            if last_id:
+                self.id_allocator.observe(last_id)
+            journal.start(self._capture)
+
+    def _log(self, entry: Dict[str, Any]) -> Optional[int]:
+        # Caller holds self.lock, so log order matches the order of changes.
+        # Every change is logged once it is made, which makes this the place
+        # to advance the generation.
+        self._generation += 1
+        return None if self.journal is None else self.journal.append(entry)
+
+    def _writable(self) -> None:
+        # Caller holds self.lock and has not changed anything yet
+        if self.journal is not None:
+            self.journal.check()
+
+    def _wait(self, ticket: Optional[int]) -> None:
+        if ticket is not None:
+            self.journal.wait(ticket)
+
+    def _load_base(self, base: MappedSnapshot) -> None:
+        # Recovery only: the store is still empty
+        self.base = base
+        self.sort_indexes = {field: SortedIndex(base.sorted_keys(field)) for field in SORT_ATTRIBUTES}
+        self.search_indexes = {field: TrigramIndex(base.postings(field)) for field in ("username", "email")}
+        self.user_counts = {"total": base.count, "active": base.active_count}
+
+    def _lookup(self, user_id: int) -> Optional[UserRecord]:
+        """The current record for ``user_id``; snapshot rows are read, not kept."""
+        user = self.users_by_id.get(user_id)
+        if user is None and self.base is not None:
+            row = self.base.row_of(user_id)
+            if row is not None:
+                user = self.base.record(row)
+        return user
+
+    def _materialize(self, user_id: int) -> Optional[UserRecord]:
+        # Caller holds self.lock and is about to change the record
+        user = self.users_by_id.get(user_id)
+        if user is None and self.base is not None:
+            row = self.base.row_of(user_id)
+            if row is not None:
+                user = self._install(self.base.record(row))
+        return user
+
+    def _install(self, record: UserRecord) -> UserRecord:
+        # Caller holds self.lock
+        records, user_id = self.records, record.id
+        # (id,) sorts just before (id, record), so records are never compared
+        position = records.bisect_left((user_id,))
+        if position < len(records) and records[position][0] == user_id:
+            self.records = records.replace(position, (user_id, record))
+        else:
+            self.records = records.add((user_id, record))
+        self.users_by_id[user_id] = record
+        self.users_db[record.username] = record
+        return record
+
+    def _change(self, user: UserRecord, **changes) -> UserRecord:
+        # Live changes and their replay both come through here, so versions
+        # recovered from the journal match the ones handed out before
+        return self._install(user.replace(version=user.version + 1, **changes))
+
+    def _owner(self, field: str, key: str) -> Optional[int]:
+        """Id of the user whose normalized ``field`` is ``key``."""
+        index = self.users_by_email if field == "email" else self.users_by_phone
+        user_id = index.get(key)
+        if user_id is not None or self.base is None:
+            return user_id
+        normalize = normalize_email if field == "email" else normalize_phone
+        for row in self.base.find(field, key):
+            user_id = self.base.ids[row]
+            user = self.users_by_id.get(user_id)
+            # A changed record has left the snapshot's value behind
+            value = getattr(user, field) if user is not None else self.base.string(field, row)
+            if value and normalize(value) == key:
+                return user_id
+        return None
+
+    def _check_unique(self, field: str, key: str, user_id: Optional[int]):
+        owner = self._owner(field, key)
+        if owner is not None and owner != user_id:
+            raise DuplicateUserError(field.capitalize())
+
+    def _insert(self, username, email, password, age, phone) -> UserRecord:
+        # Caller holds self.lock
+        if self.get_by_username(username) is not None:
+            raise DuplicateUserError("Username")
+        self._check_unique("email", normalize_email(email), None)
+        if phone:
+            self._check_unique("phone", normalize_phone(phone), None)
+        record = UserRecord(self.id_allocator.next_id(), username, email, password, age, phone)
+        self._add(record)
+        return record
+
+    @staticmethod
+    def _release(index: Dict[str, int], key: str, user_id: int) -> None:
+        if index.get(key) == user_id:
+            del index[key]
+
+    def _add(self, record: UserRecord) -> None:
+        user_id = record.id
+        self._install(record)
+        self.users_by_email[normalize_email(record.email)] = user_id
+        if record.phone:
+            self.users_by_phone[normalize_phone(record.phone)] = user_id
+        for field, index in self.sort_indexes.items():
+            index.add(getattr(record, SORT_ATTRIBUTES[field]), user_id)
+        for field, index in self.search_indexes.items():
+            index.add(getattr(record, field), user_id)
+        self.user_counts["total"] += 1
+        if record.is_active:
+            self.user_counts["active"] += 1
+
+    def create(self, username, email, password, age, phone=None) -> UserRecord:
+        with self.lock:
+            self._writable()
+            record = self._insert(username, email, password, age, phone)
+            ticket = self._log({"op": "create", "row": record.to_row()})
+        self._wait(ticket)
+        return record
+
+    def create_many(self, rows):
+        results, ticket = [], None
+        with self.lock:
+            self._writable()
+            for row in rows:
+                try:
+                    record = self._insert(**row)
+                except DuplicateUserError as e:
+                    results.append(e)
+                else:
+                    results.append(record)
+                    ticket = self._log({"op": "create", "row": record.to_row()})
+        self._wait(ticket)
+        return results
+
+    def get(self, user_id):
+        return self._lookup(user_id)
+
+    def get_by_username(self, username):
+        user = self.users_db.get(username)
+        if user is None and self.base is not None:
+            for row in self.base.find("username", username):
+                user = self._lookup(self.base.ids[row])
+        return user
+
+    def get_by_email(self, email):
+        user_id = self._owner("email", normalize_email(email))
+        return None if user_id is None else self._lookup(user_id)
+
+    def get_by_phone(self, phone):
+        user_id = self._owner("phone", normalize_phone(phone))
+        return None if user_id is None else self._lookup(user_id)
+
+    def update(self, user_id, email=None, age=None, phone=None, expected_version=None):
+        with self.lock:
+            self._writable()
+            user = self._materialize(user_id)
+            if user is None:
+                return None
+            if expected_version is not None and user.version != expected_version:
+                raise VersionConflictError(user)
+            if email:
+                self._check_unique("email", normalize_email(email), user_id)
+            if phone:
+                self._check_unique("phone", normalize_phone(phone), user_id)
+            user = self._apply_update(user, email, age, phone)
+            ticket = self._log({"op": "update", "id": user_id, "email": email, "age": age, "phone": phone})
+        self._wait(ticket)
+        return user
+
+    def _apply_update(self, user: UserRecord, email, age, phone) -> UserRecord:
+        user_id = user.id
+        changes = {}
+        if email:
+            self._release(self.users_by_email, normalize_email(user.email), user_id)
+            self.search_indexes["email"].remove(user.email, user_id)
+            changes["email"] = email
+            self.users_by_email[normalize_email(email)] = user_id
+            self.search_indexes["email"].add(email, user_id)
+        if age is not None:
+            changes["age"] = age
+        if phone is not None:
+            if user.phone:
+                self._release(self.users_by_phone, normalize_phone(user.phone), user_id)
+            changes["phone"] = phone
+            if phone:
+                self.users_by_phone[normalize_phone(phone)] = user_id
+        return self._change(user, **changes) if changes else user
+
+    def deactivate(self, user_id):
+        with self.lock:
+            self._writable()
+            user = self._materialize(user_id)
+            if user is None:
+                return None
+            previous_state = user.is_active
+            ticket = None
+            if previous_state:
+                self._change(user, is_active=False)
+                self.user_counts["active"] -= 1
+                ticket = self._log({"op": "deactivate", "id": user_id})
+        self._wait(ticket)
+        return previous_state
+
+    def record_login(self, user_id):
+        with self.lock:
+            self._writable()
+            user = self._materialize(user_id)
+            if user is not None:
+                user = self._change(user, last_login_ts=time.time())
+                self._log({"op": "login", "id": user_id, "ts": user.last_login_ts})
+
+    def _load_row(self, row) -> None:
+        # Replay may see a user the snapshot already holds; converge on ``row``
+        record = UserRecord.from_row(row)
+        user = self._materialize(record.id)
+        if user is None:
+            self._add(record)
+            return
+        if record.email != user.email or record.phone != user.phone:
+            email = record.email if record.email != user.email else None
+            phone = (record.phone or "") if record.phone != user.phone else None
+            user = self._apply_update(user, email, None, phone)
+        if user.is_active != record.is_active:
+            self.user_counts["active"] += 1 if record.is_active else -1
+        self._install(record)
+
+    def _apply_entry(self, entry: Dict[str, Any]) -> None:
+        op = entry["op"]
+        if op == "create":
+            self._load_row(entry["row"])
+            return
+        user = self._materialize(entry["id"])
+        if user is None:
+            return
+        if op == "update":
+            self._apply_update(user, entry["email"], entry["age"], entry["phone"])
+        elif op == "deactivate":
+            if user.is_active:
+                self._change(user, is_active=False)
+                self.user_counts["active"] -= 1
+        elif op == "login":
+            self._change(user, last_login_ts=entry["ts"])
+
+    def _capture(self):
+        # Only the segment switch and grabbing the current records version
+        # happen under the lock; rows are read while writers carry on.
+        with self.lock:
+            segment = self.journal.rotate()
+            records = self.records
+        return segment, self._merged(self.base, records, MappedSnapshot.row, UserRecord.to_row)
+
+    def snapshot_users(self):
+        # Taken under the lock so a batch of creates is either in or out
+        with self.lock:
+            records = self.records
+        return self._merged(self.base, records, MappedSnapshot.record, None)
+
+    @staticmethod
+    def _merged(
+        base: Optional[MappedSnapshot],
+        records: PersistentSortedSet,
+        read_row: Callable[[MappedSnapshot, int], Any],
+        read_record: Optional[Callable[[UserRecord], Any]],
+    ) -> Iterator[Any]:
+        """Snapshot rows and ``(id, record)`` pairs in id order, records taking precedence.
+
+        Each snapshot row is passed through ``read_row`` and each record
+        through ``read_record``, or yielded as is when that is ``None``.
+        """
+        base_ids = base.ids if base is not None else ()
+        row = 0
+        for _, record in records.iter_from(0):
+            while row < len(base_ids) and base_ids[row] < record.id:
+                yield read_row(base, row)
+                row += 1
+            if row < len(base_ids) and base_ids[row] == record.id:
+                row += 1
+            yield record if read_record is None else read_record(record)
+        while row < len(base_ids):
+            yield read_row(base, row)
+            row += 1
+
+    def page(self, sort_by, descending, limit, offset=0, after=None):
+        keys = self.sort_indexes[sort_by].page(limit, offset=offset, after=after, descending=descending)
+        return [(key, self._lookup(key[1])) for key in keys]
+
+    def search(self, pattern, field, exact, after, limit):
+        streams = []
+        if field == "all" or field == "username":
+            if exact:
+                user = self.get_by_username(pattern)
+                streams.append([user.id] if user and user.id > after else [])
+            else:
+                streams.append(self.search_indexes["username"].candidates(pattern, after))
+        if field == "all" or field == "email":
+            streams.append(self.search_indexes["email"].candidates(pattern, after))
+        if any(stream is None for stream in streams):
+            # Too short for the trigram index: scan in id order until the page fills
+            candidate_ids = (key[1] for key in self.sort_indexes["id"].iter_from((after, after)))
+        else:
+            candidate_ids = merge_ids(*streams)
+        results = []
+        for user_id in candidate_ids:
+            user = self._lookup(user_id)
+            if search_matches(user, pattern, field, exact):
+                results.append(user)
+                if len(results) == limit:
+                    break
+        return results
+
+    def iter_users(self, after_id=0):
+        for key in self.sort_indexes["id"].iter_from((after_id, after_id)):
+            yield self._lookup(key[1])
+
+    def generation(self):
+        return self._generation
+
+    def counts(self):
+        return self.user_counts["total"], self.user_counts["active"]
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def memory_usage(self):
+        # Sampling walks the maps, which must not grow mid-walk; the indexes
+        # measure whichever version they hold and need no lock
+        with self.lock:
+            maps = {
+                "users_db": estimate_bytes(self.users_db),
+                "users_by_id": estimate_bytes(self.users_by_id, shared_values=True),
+                "users_by_email": estimate_bytes(self.users_by_email, shared_values=True),
+                "users_by_phone": estimate_bytes(self.users_by_phone, shared_values=True),
+            }
+        records = self.records
+        usage = {
+            **maps,
+            # Pairs only reference the records counted in users_db
+            "records": records.approx_bytes() + len(records) * sys.getsizeof((0, None)),
+            "sort_indexes": {name: index.approx_bytes() for name, index in self.sort_indexes.items()},
+            "search_indexes": {name: index.approx_bytes() for name, index in self.search_indexes.items()},
+        }
+        if self.base is not None:
+            # Shared, file-backed pages rather than heap
+            usage["mapped_snapshot"] = self.base.size
+        return usage
@@ -0,0 +1,100 @@
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence
+
+
+class UserRecord:
+    """A stored user, laid out in ``__slots__`` rather than a nine-key dict.
+
+    Timestamps are kept as epoch-second floats instead of ``datetime``
+    objects and exposed as ``created_at``/``last_login`` properties for
+    serialization. The username is interned so the ``users_db`` key and the
+    record share one string, and ``is_active`` and ``age`` (below 256) point
+    at CPython's shared bool/small-int singletons.
+
+    On 64-bit CPython 3.11 the record object is 112 bytes plus a 24-byte
+    float, where the dict layout needed a 272-byte dict, a 48-byte datetime
+    and a second copy of the username. Counting field values and the
+    ``users_db`` entry, a typical user goes from about 750 to about 550
+    bytes; ``benchmarks/user_record_memory.py`` measures both layouts.
+
+    ``version`` counts the changes made to the user since it was created;
+    stores bump it on every update, deactivation and login.
+    """
+
+    __slots__ = (
+        "id",
+        "username",
+        "email",
+        "password",
+        "age",
+        "phone",
+        "created_ts",
+        "last_login_ts",
+        "is_active",
+        "version",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        username: str,
+        email: str,
+        password: str,
+        age: int,
+        phone: Optional[str] = None,
+        created_ts: Optional[float] = None,
+        last_login_ts: Optional[float] = None,
+        is_active: bool = True,
+        version: int = 0,
+    ):
+        self.id = id
+        self.username = sys.intern(username)
+        self.email = email
+        self.password = password
+        self.age = age
+        self.phone = phone
+        self.created_ts = time.time() if created_ts is None else created_ts
+        self.last_login_ts = last_login_ts
+        self.is_active = is_active
+        self.version = version
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self.created_ts)
+
+    @property
+    def last_login(self) -> Optional[datetime]:
+        if self.last_login_ts is None:
+            return None
+        return datetime.fromtimestamp(self.last_login_ts)
+
+    def replace(self, **changes: Any) -> "UserRecord":
+        """A copy with ``changes`` applied; stores swap this in rather than edit a record."""
+        record = object.__new__(UserRecord)
+        for name in self.__slots__:
+            setattr(record, name, changes[name] if name in changes else getattr(self, name))
+        return record
+
+    def to_row(self) -> tuple:
+        """Every field, password hash included, in ``__slots__`` order."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "UserRecord":
+        # Rows logged before versions were added have one field less
+        return cls(*row)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Public fields, in ``UserResponse`` order; the password hash is left out."""
+        return {
+            "id": self.id,
+            "username": self.username,
+            "email": self.email,
+            "age": self.age,
+            "created_at": self.created_at,
+            "is_active": self.is_active,
+            "phone": self.phone,
+            "last_login": self.last_login,
+        }